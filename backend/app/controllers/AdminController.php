@@ -268,16 +268,52 @@ class AdminController
             $limit = isset($_GET['limit']) ? intval($_GET['limit']) : 100;
             $offset = isset($_GET['offset']) ? intval($_GET['offset']) : 0;
 
+            // Filtros opcionales
+            $where = [];
+            $params = [];
+
+            if (!empty($_GET['usuario'])) {
+                $where[] = "u.nombre_usuario = :usuario";
+                $params['usuario'] = $_GET['usuario'];
+            }
+
+            if (!empty($_GET['accion'])) {
+                $where[] = "mp.accion LIKE :accion";
+                $params['accion'] = '%' . $_GET['accion'] . '%';
+            }
+
+            if (isset($_GET['fecha_desde'])) {
+                $where[] = "mp.fecha >= :fecha_desde";
+                $params['fecha_desde'] = $_GET['fecha_desde'];
+            }
+
+            if (isset($_GET['fecha_hasta'])) {
+                $where[] = "mp.fecha <= :fecha_hasta";
+                $params['fecha_hasta'] = $_GET['fecha_hasta'];
+            }
+
+            // Las páginas siguientes se piden hasta el último id de la primera,
+            // así no se desplazan mientras llegan acciones nuevas
+            if (isset($_GET['id_hasta'])) {
+                $where[] = "mp.id <= :id_hasta";
+                $params['id_hasta'] = intval($_GET['id_hasta']);
+            }
+
+            $from = "FROM movimientos_pagina mp 
+                    INNER JOIN usuarios u ON mp.id_usuario = u.id";
+            if ($where) {
+                $from .= " WHERE " . implode(' AND ', $where);
+            }
+
             $sql = "SELECT mp.*, u.nombre_usuario 
-                    FROM movimientos_pagina mp 
-                    INNER JOIN usuarios u ON mp.id_usuario = u.id 
-                    ORDER BY mp.fecha DESC 
+                    {$from} 
+                    ORDER BY mp.fecha DESC, mp.id DESC 
                     LIMIT :limit OFFSET :offset";
 
-            $logs = $this->db->fetchAll($sql, [
+            $logs = $this->db->fetchAll($sql, array_merge($params, [
                 'limit' => $limit,
                 'offset' => $offset
-            ]);
+            ]));
 
             foreach ($logs as &$log) {
                 $log['fecha'] = formatDate($log['fecha']);
@@ -285,7 +321,7 @@ class AdminController
             unset($log);
 
             // Contar total
-            $total = $this->db->fetchColumn("SELECT COUNT(*) FROM movimientos_pagina");
+            $total = $this->db->fetchColumn("SELECT COUNT(*) {$from}", $params);
 
             jsonSuccess("Historial obtenido", [
                 'logs' => $logs,
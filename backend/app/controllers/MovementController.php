@@ -4,6 +4,8 @@ namespace Controllers;
 
 use Models\Movimiento;
 use Models\Cuenta;
+use Models\ClaveIdempotencia;
+use Models\Adjunto;
 
 class MovementController
 {
@@ -59,9 +61,46 @@ class MovementController
             // Manejar archivo adjunto
             if (isset($_FILES['adjunto']) && $_FILES['adjunto']['error'] === UPLOAD_ERR_OK) {
                 $movimientoData['archivo'] = $_FILES['adjunto'];
+            } elseif (!empty($data['adjunto_hash'])) {
+                // El cliente envía solo el SHA-256 de un adjunto que ya subió;
+                // 412 si no existe, para que lo suba completo
+                $adjuntos = new Adjunto();
+                if (!preg_match('/^[0-9a-f]{64}$/i', $data['adjunto_hash'])
+                    || !$adjuntos->isAvailable()
+                    || !$adjuntos->findByHash($userId, $data['adjunto_hash'])) {
+                    jsonError("Adjunto no encontrado", 412);
+                }
+                $movimientoData['adjunto_hash'] = strtolower($data['adjunto_hash']);
+            }
+
+            // Reintentos con la misma Idempotency-Key devuelven el movimiento ya creado
+            list($claves, $clave) = $this->idempotencyKey();
+
+            if ($claves) {
+                $existente = $claves->reserve($userId, $clave);
+                if ($existente) {
+                    if ($existente['id_movimiento'] === null) {
+                        jsonError("Hay una petición en curso con esta clave", 409);
+                    }
+                    jsonSuccess("Movimiento registrado exitosamente", [
+                        'movimiento_id' => (int) $existente['id_movimiento'],
+                        'repetido' => true
+                    ], 201);
+                }
+            }
+
+            try {
+                $movimientoId = $this->movimientoModel->create($movimientoData);
+            } catch (\Exception $e) {
+                if ($claves) {
+                    $claves->release($userId, $clave);
+                }
+                throw $e;
             }
 
-            $movimientoId = $this->movimientoModel->create($movimientoData);
+            if ($claves) {
+                $claves->complete($userId, $clave, $movimientoId);
+            }
 
             jsonSuccess("Movimiento registrado exitosamente", ['movimiento_id' => $movimientoId], 201);
 
@@ -70,6 +109,21 @@ class MovementController
         }
     }
 
+    /**
+     * Clave de la cabecera Idempotency-Key y su modelo, o [null, null] si no
+     * se envía o la instalación no tiene la tabla
+     */
+    private function idempotencyKey()
+    {
+        $clave = trim($_SERVER['HTTP_IDEMPOTENCY_KEY'] ?? '');
+        if ($clave === '' || strlen($clave) > 64) {
+            return [null, null];
+        }
+
+        $claves = new ClaveIdempotencia();
+        return $claves->isAvailable() ? [$claves, $clave] : [null, null];
+    }
+
     /**
      * Obtener todos los movimientos del usuario
      */
@@ -371,13 +425,17 @@ class MovementController
     }
 
     /**
-     * Obtener estadísticas de movimientos
+     * Obtener estadísticas de movimientos (?agrupar=dia|mes añade las sumas por periodo)
      */
     public function getStats($userId)
     {
         try {
             $filters = [];
 
+            if (isset($_GET['id_cuenta'])) {
+                $filters['id_cuenta'] = $_GET['id_cuenta'];
+            }
+
             if (isset($_GET['fecha_desde'])) {
                 $filters['fecha_desde'] = $_GET['fecha_desde'];
             }
@@ -386,9 +444,17 @@ class MovementController
                 $filters['fecha_hasta'] = $_GET['fecha_hasta'];
             }
 
-            $stats = $this->movimientoModel->getUserStats($userId, $filters);
+            $agrupar = $_GET['agrupar'] ?? null;
+            if ($agrupar !== null && !in_array($agrupar, ['dia', 'mes'], true)) {
+                jsonError("agrupar debe ser 'dia' o 'mes'", 400);
+            }
 
-            jsonSuccess("Estadísticas obtenidas", ['stats' => $stats]);
+            $data = ['stats' => $this->movimientoModel->getUserStats($userId, $filters)];
+            if ($agrupar !== null) {
+                $data['series'] = $this->movimientoModel->getUserSeries($userId, $agrupar, $filters);
+            }
+
+            jsonSuccess("Estadísticas obtenidas", $data);
 
         } catch (\Exception $e) {
             jsonError($e->getMessage(), 400);
@@ -460,7 +526,10 @@ class MovementController
                 $filters['fecha_hasta'] = $_GET['fecha_hasta'];
             }
 
-            $json = $this->movimientoModel->exportToJSON($userId, $filters);
+            // adjuntos=0: sin ficheros en Base64 (mucho más ligero)
+            $includeAttachments = !isset($_GET['adjuntos']) || $_GET['adjuntos'] !== '0';
+
+            $json = $this->movimientoModel->exportToJSON($userId, $filters, $includeAttachments);
 
             // Configurar headers para descarga
             header('Content-Type: application/json; charset=utf-8');
@@ -498,12 +567,40 @@ class MovementController
 
             $jsonContent = file_get_contents($file['tmp_name']);
 
-            $result = $this->movimientoModel->importFromJSON($userId, $jsonContent);
+            // Reintentos con la misma Idempotency-Key (p. ej. los recurrentes del bot
+            // tras un timeout) no vuelven a importar el lote
+            list($claves, $clave) = $this->idempotencyKey();
+            if ($claves) {
+                $existente = $claves->reserve($userId, $clave);
+                if ($existente) {
+                    if ($existente['id_movimiento'] === null) {
+                        jsonError("Hay una petición en curso con esta clave", 409);
+                    }
+                    jsonSuccess("Importación completada", ['repetido' => true]);
+                }
+            }
+
+            try {
+                $result = $this->movimientoModel->importFromJSON($userId, $jsonContent);
+            } catch (\Exception $e) {
+                if ($claves) {
+                    $claves->release($userId, $clave);
+                }
+                throw $e;
+            }
 
             if ($result['imported'] === 0 && !empty($result['errors'])) {
+                if ($claves) {
+                    $claves->release($userId, $clave);
+                }
                 jsonError("No se pudo importar ningún movimiento", 400, $result['errors']);
             }
 
+            // Un lote no tiene un único movimiento: 0 marca la clave como completada
+            if ($claves) {
+                $claves->complete($userId, $clave, 0);
+            }
+
             logAction($userId, "ha importado {$result['imported']} movimientos");
 
             jsonSuccess("Importación completada", [
@@ -578,11 +675,8 @@ class MovementController
                 jsonError("Este movimiento no tiene archivo adjunto", 400);
             }
 
-            // Eliminar archivo físico
-            $filepath = UPLOADS_PATH . '/movements/' . $movimiento['adjunto'];
-            if (file_exists($filepath)) {
-                @unlink($filepath);
-            }
+            // Eliminar archivo físico (o una referencia si otro movimiento lo comparte)
+            $this->movimientoModel->deleteFile($movimiento['adjunto']);
 
             // Actualizar registro en BD (poner adjunto a NULL)
             $this->movimientoModel->update($movimientoId, ['adjunto' => null]);
@@ -21,6 +21,8 @@ class Database {
             
             $this->connection = new PDO($dsn, DB_USER, DB_PASS, $options);
         } catch (PDOException $e) {
+            // 503 para que los clientes distingan una caída de un error propio
+            http_response_code(503);
             if (DEBUG_MODE) {
                 die("Error de conexión: " . $e->getMessage());
             } else {
@@ -107,6 +107,45 @@ function jsonResponse($data, $statusCode = 200)
     exit;
 }
 
+/**
+ * Devuelve una respuesta JSON cacheable: ETag, 304 Not Modified y compresión
+ */
+function jsonCacheableResponse($data, $statusCode = 200)
+{
+    $body = json_encode($data, JSON_UNESCAPED_UNICODE);
+    $etag = '"' . md5($body) . '"';
+
+    header('Content-Type: application/json; charset=utf-8');
+    header('ETag: ' . $etag);
+    header('Cache-Control: private, no-cache');
+    header('Vary: Authorization, Accept-Encoding');
+
+    // El cliente ya tiene esta versión: no se reenvía el cuerpo
+    $ifNoneMatch = $_SERVER['HTTP_IF_NONE_MATCH'] ?? '';
+    if ($ifNoneMatch !== '' && in_array($etag, array_map('trim', explode(',', $ifNoneMatch)), true)) {
+        http_response_code(304);
+        exit;
+    }
+
+    http_response_code($statusCode);
+
+    // Comprimir solo si compensa y el cliente lo acepta
+    $acceptEncoding = $_SERVER['HTTP_ACCEPT_ENCODING'] ?? '';
+    if (strlen($body) > 1024 && function_exists('gzencode')) {
+        if (stripos($acceptEncoding, 'gzip') !== false) {
+            header('Content-Encoding: gzip');
+            $body = gzencode($body, 6);
+        } elseif (stripos($acceptEncoding, 'deflate') !== false) {
+            header('Content-Encoding: deflate');
+            $body = gzcompress($body, 6);
+        }
+    }
+
+    header('Content-Length: ' . strlen($body));
+    echo $body;
+    exit;
+}
+
 /**
  * Devuelve un error JSON
  */
@@ -124,11 +163,18 @@ function jsonError($message, $statusCode = 400, $errors = [])
  */
 function jsonSuccess($message, $data = [], $statusCode = 200)
 {
-    jsonResponse([
+    $payload = [
         'success' => true,
         'message' => $message,
         'data' => $data
-    ], $statusCode);
+    ];
+
+    // Las lecturas admiten peticiones condicionales (If-None-Match)
+    if (($_SERVER['REQUEST_METHOD'] ?? '') === 'GET' && $statusCode === 200) {
+        jsonCacheableResponse($payload, $statusCode);
+    }
+
+    jsonResponse($payload, $statusCode);
 }
 
 /**
@@ -0,0 +1,97 @@
+<?php
+
+namespace Models;
+
+use Core\Database;
+use Exception;
+
+/**
+ * Adjuntos direccionados por contenido (SHA-256 por usuario)
+ *
+ * Un mismo archivo subido varias veces (el recibo reenviado desde el bot)
+ * se guarda una sola vez en uploads/ y lo comparten los movimientos que lo
+ * usan; el archivo se borra cuando deja de tener referencias.
+ */
+class Adjunto {
+    private $db;
+
+    public function __construct() {
+        $this->db = Database::getInstance();
+    }
+
+    /**
+     * Indica si la tabla existe (instalaciones anteriores no la tienen)
+     */
+    public function isAvailable() {
+        return $this->db->tableExists('adjuntos');
+    }
+
+    /**
+     * Busca un adjunto del usuario por su hash; null si no existe o falta el archivo
+     */
+    public function findByHash($idUsuario, $hash) {
+        $adjunto = $this->db->fetchOne(
+            "SELECT * FROM adjuntos WHERE id_usuario = :id_usuario AND hash = :hash",
+            ['id_usuario' => $idUsuario, 'hash' => strtolower($hash)]
+        );
+
+        if (!$adjunto || !file_exists(UPLOADS_PATH . '/movements/' . $adjunto['archivo'])) {
+            return null;
+        }
+
+        return $adjunto;
+    }
+
+    /**
+     * Suma una referencia al adjunto con ese hash y devuelve su nombre de archivo
+     */
+    public function acquire($idUsuario, $hash) {
+        $adjunto = $this->findByHash($idUsuario, $hash);
+        if (!$adjunto) {
+            throw new Exception("Adjunto no encontrado");
+        }
+
+        $this->db->query(
+            "UPDATE adjuntos SET referencias = referencias + 1 WHERE id_usuario = :id_usuario AND hash = :hash",
+            ['id_usuario' => $idUsuario, 'hash' => $adjunto['hash']]
+        );
+
+        return $adjunto['archivo'];
+    }
+
+    /**
+     * Registra un archivo recién guardado con una referencia
+     */
+    public function register($idUsuario, $hash, $archivo) {
+        $this->db->query(
+            "INSERT INTO adjuntos (id_usuario, hash, archivo, referencias) VALUES (:id_usuario, :hash, :archivo, 1)
+             ON DUPLICATE KEY UPDATE archivo = VALUES(archivo), referencias = 1",
+            ['id_usuario' => $idUsuario, 'hash' => $hash, 'archivo' => $archivo]
+        );
+    }
+
+    /**
+     * Quita una referencia; devuelve true si el archivo ya no se usa y puede borrarse
+     */
+    public function release($archivo) {
+        $adjunto = $this->db->fetchOne(
+            "SELECT * FROM adjuntos WHERE archivo = :archivo",
+            ['archivo' => $archivo]
+        );
+
+        if (!$adjunto) {
+            return true; // archivo anterior a la tabla
+        }
+
+        if ($adjunto['referencias'] > 1) {
+            $this->db->query(
+                "UPDATE adjuntos SET referencias = referencias - 1 WHERE archivo = :archivo",
+                ['archivo' => $archivo]
+            );
+            return false;
+        }
+
+        $this->db->delete('adjuntos', 'archivo = :archivo', ['archivo' => $archivo]);
+        return true;
+    }
+}
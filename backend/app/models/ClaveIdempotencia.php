@@ -0,0 +1,80 @@
+<?php
+
+namespace Models;
+
+use Core\Database;
+use Exception;
+
+/**
+ * Claves de idempotencia (cabecera Idempotency-Key)
+ *
+ * Permiten que un cliente repita una creación (p. ej. el bot al reenviar su
+ * cola tras una caída) o una importación sin duplicar movimientos.
+ */
+class ClaveIdempotencia {
+    private $db;
+
+    public function __construct() {
+        $this->db = Database::getInstance();
+    }
+
+    /**
+     * Indica si la tabla existe (instalaciones anteriores no la tienen)
+     */
+    public function isAvailable() {
+        return $this->db->tableExists('claves_idempotencia');
+    }
+
+    /**
+     * Reserva una clave. Devuelve null si es nueva o la fila existente
+     * (con id_movimiento NULL si la petición original sigue en curso)
+     */
+    public function reserve($idUsuario, $clave) {
+        $stmt = $this->db->query(
+            "INSERT IGNORE INTO claves_idempotencia (id_usuario, clave) VALUES (:id_usuario, :clave)",
+            ['id_usuario' => $idUsuario, 'clave' => $clave]
+        );
+
+        if ($stmt->rowCount() === 1) {
+            return null;
+        }
+
+        return $this->db->fetchOne(
+            "SELECT * FROM claves_idempotencia WHERE id_usuario = :id_usuario AND clave = :clave",
+            ['id_usuario' => $idUsuario, 'clave' => $clave]
+        );
+    }
+
+    /**
+     * Asocia la clave con el movimiento creado (0 en una importación)
+     */
+    public function complete($idUsuario, $clave, $idMovimiento) {
+        return $this->db->update(
+            'claves_idempotencia',
+            ['id_movimiento' => $idMovimiento],
+            'id_usuario = :id_usuario_where AND clave = :clave',
+            ['id_usuario_where' => $idUsuario, 'clave' => $clave]
+        );
+    }
+
+    /**
+     * Libera una clave cuya creación ha fallado, para poder reintentarla
+     */
+    public function release($idUsuario, $clave) {
+        return $this->db->delete(
+            'claves_idempotencia',
+            'id_usuario = :id_usuario AND clave = :clave AND id_movimiento IS NULL',
+            ['id_usuario' => $idUsuario, 'clave' => $clave]
+        );
+    }
+
+    /**
+     * Elimina claves antiguas
+     */
+    public function deleteExpired($days = 30) {
+        return $this->db->delete(
+            'claves_idempotencia',
+            'created_at < DATE_SUB(NOW(), INTERVAL ' . (int) $days . ' DAY)'
+        );
+    }
+}
@@ -50,10 +50,17 @@ class Movimiento
         }
 
         // Manejar archivo adjunto si existe
-        if (isset($data['archivo']) && !empty($data['archivo'])) {
-            $data['adjunto'] = $this->uploadFile($data['archivo']);
-            unset($data['archivo']);
+        if (!empty($data['adjunto_hash'])) {
+            // Mismo contenido que un adjunto ya guardado: se reutiliza sin volver a subirlo
+            $adjuntos = $this->adjuntos();
+            if (!$adjuntos) {
+                throw new Exception("Adjunto no encontrado");
+            }
+            $data['adjunto'] = $adjuntos->acquire($this->accountOwner($data['id_cuenta']), $data['adjunto_hash']);
+        } elseif (isset($data['archivo']) && !empty($data['archivo'])) {
+            $data['adjunto'] = $this->uploadFile($data['archivo'], $this->accountOwner($data['id_cuenta']));
         }
+        unset($data['archivo'], $data['adjunto_hash']);
 
         // Insertar movimiento (el trigger actualizará el balance automáticamente)
         $id = $this->db->insert('movimientos', $data);
@@ -245,7 +252,7 @@ class Movimiento
             if ($movimiento['adjunto']) {
                 $this->deleteFile($movimiento['adjunto']);
             }
-            $data['adjunto'] = $this->uploadFile($data['archivo']);
+            $data['adjunto'] = $this->uploadFile($data['archivo'], $this->accountOwner($movimiento['id_cuenta']));
             unset($data['archivo']);
         }
 
@@ -292,9 +299,30 @@ class Movimiento
     }
 
     /**
-     * Sube un archivo adjunto
+     * Tabla de adjuntos por contenido, o null si la instalación no la tiene
      */
-    private function uploadFile($file)
+    private function adjuntos()
+    {
+        $adjuntos = new Adjunto();
+        return $adjuntos->isAvailable() ? $adjuntos : null;
+    }
+
+    /**
+     * Usuario propietario de una cuenta
+     */
+    private function accountOwner($idCuenta)
+    {
+        $cuenta = (new Cuenta())->findById($idCuenta);
+        if (!$cuenta) {
+            throw new Exception("La cuenta especificada no existe");
+        }
+        return $cuenta['id_usuario'];
+    }
+
+    /**
+     * Sube un archivo adjunto (si el usuario ya tiene uno idéntico, se reutiliza)
+     */
+    private function uploadFile($file, $idUsuario = null)
     {
         // Validar que el archivo temporal existe
         if (!isset($file['tmp_name']) || !file_exists($file['tmp_name'])) {
@@ -332,6 +360,16 @@ class Movimiento
             throw new Exception("Solo se permiten archivos PDF e imágenes (JPG, PNG, GIF, WEBP)");
         }
 
+        // Mismo contenido ya guardado para este usuario: no se duplica en uploads/
+        $adjuntos = $idUsuario ? $this->adjuntos() : null;
+        $hash = $adjuntos ? hash_file('sha256', $file['tmp_name']) : null;
+        if ($adjuntos && $adjuntos->findByHash($idUsuario, $hash)) {
+            if (!$isUploadedFile) {
+                @unlink($file['tmp_name']);
+            }
+            return $adjuntos->acquire($idUsuario, $hash);
+        }
+
         // Generar nombre único
         $filename = generateUniqueFilename($file['name']);
         $destination = UPLOADS_PATH . '/movements/' . $filename;
@@ -358,14 +396,24 @@ class Movimiento
             }
         }
 
+        if ($adjuntos) {
+            $adjuntos->register($idUsuario, $hash, $filename);
+        }
+
         return $filename;
     }
 
     /**
-     * Elimina un archivo adjunto
+     * Elimina un archivo adjunto (o una referencia si está compartido)
      */
-    private function deleteFile($filename)
+    public function deleteFile($filename)
     {
+        // Otros movimientos comparten el mismo archivo
+        $adjuntos = $this->adjuntos();
+        if ($adjuntos && !$adjuntos->release($filename)) {
+            return;
+        }
+
         $filepath = UPLOADS_PATH . '/movements/' . $filename;
         if (file_exists($filepath)) {
             unlink($filepath);
@@ -399,8 +447,9 @@ class Movimiento
      * Exporta movimientos a JSON con adjuntos en Base64 y metadata de cuentas
      * Formato completo para backup/restore entre usuarios
      * INCLUYE balance actual para preservar balances iniciales
+     * Sin adjuntos ($includeAttachments = false) sirve para índices y comprobaciones ligeras
      */
-    public function exportToJSON($idUsuario, $filters = [])
+    public function exportToJSON($idUsuario, $filters = [], $includeAttachments = true)
     {
         $movimientos = $this->findByUser($idUsuario, $filters);
         $cuentaModel = new Cuenta();
@@ -444,7 +493,7 @@ class Movimiento
             ];
 
             // Procesar adjunto si existe
-            if (!empty($mov['adjunto'])) {
+            if ($includeAttachments && !empty($mov['adjunto'])) {
                 $filepath = UPLOADS_PATH . '/movements/' . $mov['adjunto'];
                 if (file_exists($filepath)) {
                     $fileContent = file_get_contents($filepath);
@@ -840,6 +889,45 @@ class Movimiento
                 WHERE c.id_usuario = :id_usuario";
 
         $params = ['id_usuario' => $idUsuario];
+        $sql .= $this->statsFilters($filters, $params);
+
+        return $this->db->fetchOne($sql, $params);
+    }
+
+    /**
+     * Sumas de ingresos y retiradas por día o por mes (gráficos), con los
+     * mismos filtros que getUserStats. Solo aparecen los periodos con movimientos.
+     */
+    public function getUserSeries($idUsuario, $agrupar, $filters = [])
+    {
+        $formato = $agrupar === 'dia' ? '%Y-%m-%d' : '%Y-%m';
+
+        $sql = "SELECT 
+                    DATE_FORMAT(m.fecha_movimiento, '$formato') as periodo,
+                    COALESCE(SUM(CASE WHEN m.tipo = 'ingreso' THEN m.cantidad ELSE 0 END), 0) as suma_ingresos,
+                    COALESCE(SUM(CASE WHEN m.tipo = 'retirada' THEN m.cantidad ELSE 0 END), 0) as suma_retiradas
+                FROM movimientos m 
+                INNER JOIN cuentas c ON m.id_cuenta = c.id 
+                WHERE c.id_usuario = :id_usuario";
+
+        $params = ['id_usuario' => $idUsuario];
+        $sql .= $this->statsFilters($filters, $params);
+        $sql .= " GROUP BY periodo ORDER BY periodo";
+
+        return $this->db->fetchAll($sql, $params);
+    }
+
+    /**
+     * Condiciones comunes de las estadísticas (cuenta y rango de fechas)
+     */
+    private function statsFilters($filters, &$params)
+    {
+        $sql = '';
+
+        if (isset($filters['id_cuenta'])) {
+            $sql .= " AND m.id_cuenta = :id_cuenta";
+            $params['id_cuenta'] = $filters['id_cuenta'];
+        }
 
         if (isset($filters['fecha_desde'])) {
             $sql .= " AND m.fecha_movimiento >= :fecha_desde";
@@ -851,6 +939,6 @@ class Movimiento
             $params['fecha_hasta'] = $filters['fecha_hasta'];
         }
 
-        return $this->db->fetchOne($sql, $params);
+        return $sql;
     }
 }
\ No newline at end of file
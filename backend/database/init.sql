@@ -148,6 +148,29 @@ CREATE TABLE IF NOT EXISTS tokens_api (
     INDEX idx_usuario (id_usuario)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Claves de idempotencia (reintentos de creación sin duplicados)
+CREATE TABLE IF NOT EXISTS claves_idempotencia (
+    id_usuario INT NOT NULL,
+    clave VARCHAR(64) NOT NULL,
+    id_movimiento INT DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_usuario, clave),
+    FOREIGN KEY (id_usuario) REFERENCES usuarios(id) ON DELETE CASCADE,
+    INDEX idx_fecha (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Adjuntos por contenido (un archivo por usuario y SHA-256, compartido entre movimientos)
+CREATE TABLE IF NOT EXISTS adjuntos (
+    id_usuario INT NOT NULL,
+    hash CHAR(64) NOT NULL,
+    archivo VARCHAR(255) NOT NULL,
+    referencias INT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_usuario, hash),
+    FOREIGN KEY (id_usuario) REFERENCES usuarios(id) ON DELETE CASCADE,
+    INDEX idx_archivo (archivo)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Trigger para actualizar balance de cuenta al insertar movimiento
 DELIMITER //
 CREATE TRIGGER actualizar_balance_insertar
@@ -22,6 +22,7 @@ if (file_exists('../../vendor/autoload.php')) {
 }
 
 use Core\Router;
+use Core\Database;
 use Core\AuthMiddleware;
 use Core\AdminMiddleware;
 use Core\OwnerMiddleware;
@@ -53,6 +54,16 @@ $router->post('/auth/reset-password', [AuthController::class, 'resetPassword']);
 // Etiquetas (públicas para mostrar en formularios)
 $router->get('/tags', [TagController::class, 'getAll']);
 
+// Estado del servicio (lo usa el bot para saber cuándo reenviar su cola)
+$router->get('/health', function () {
+    try {
+        Database::getInstance()->fetchColumn("SELECT 1");
+    } catch (\Exception $e) {
+        jsonError("Base de datos no disponible", 503);
+    }
+    jsonSuccess("OK", ['status' => 'ok']);
+});
+
 // ============================================
 // Rutas protegidas (requieren autenticación)
 // ============================================
@@ -11,6 +11,7 @@ use Models\Usuario;
 use Models\Sesion;
 use Models\Codigo2FA;
 use Models\TokenRecuperacion;
+use Models\ClaveIdempotencia;
 
 echo "[" . date('Y-m-d H:i:s') . "] Iniciando tareas programadas...\n";
 
@@ -122,6 +123,17 @@ $deletedTokens = $tokenRecuperacionModel->deleteExpired();
 
 echo "Tokens eliminados: {$deletedTokens}\n\n";
 
+// ============================================
+// 5. Limpiar claves de idempotencia antiguas
+// ============================================
+
+echo "Limpiando claves de idempotencia antiguas...\n";
+
+$claveIdempotenciaModel = new ClaveIdempotencia();
+$deletedKeys = $claveIdempotenciaModel->isAvailable() ? $claveIdempotenciaModel->deleteExpired() : 0;
+
+echo "Claves eliminadas: {$deletedKeys}\n\n";
+
 // ============================================
 // Resumen final
 // ============================================
@@ -133,4 +145,5 @@ echo "  - Usuarios procesados: " . count($inactiveUsers) . "\n";
 echo "  - Sesiones limpiadas: {$deletedSessions}\n";
 echo "  - Códigos 2FA limpiados: {$deleted2FA}\n";
 echo "  - Tokens limpiados: {$deletedTokens}\n";
+echo "  - Claves de idempotencia limpiadas: {$deletedKeys}\n";
 echo "================================================\n";
\ No newline at end of file
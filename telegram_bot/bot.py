@@ -3,19 +3,33 @@
 Bot de Telegram para Gestión de Gastos
 """
 
+import asyncio
 import logging
+from typing import Optional
 from telegram import Update
+from telegram.request import BaseRequest
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 
 from config import (
     TELEGRAM_BOT_TOKEN,
-    API_URL,
+    API_URLS,
+    HEALTH_CHECK_INTERVAL,
+    CATALOG_TTL,
+    PERSISTENCE_PATH,
+    PERSISTENCE_INTERVAL,
+    SESSION_VALIDATION_INTERVAL,
+    JOURNAL_REPLAY_INTERVAL,
+    CONVERSATION_TIMEOUT,
+    STATE_SWEEP_INTERVAL,
+    DUPLICATE_REFRESH_INTERVAL,
     LOGIN_USERNAME,
     LOGIN_PASSWORD,
     LOGIN_2FA,
@@ -23,9 +37,27 @@ from config import (
     NEW_MOVEMENT_ACCOUNT,
     NEW_MOVEMENT_AMOUNT,
     NEW_MOVEMENT_NOTES,
-    NEW_MOVEMENT_FILE
+    NEW_MOVEMENT_FILE,
+    NEW_MOVEMENT_CONFIRM
 )
 
+from services.persistence import SQLitePersistence
+from services.session_manager import session_manager
+from services.session_validator import session_validator
+from services.message_queue import outbound_queue, reply
+from services.charts import chart_service
+from services.recurring import recurring_scheduler
+from services.write_journal import write_journal
+from services.tracing import TracedApplication, setup_logging
+from services.state_gc import state_sweeper
+from services.duplicates import duplicate_index
+from services.load_balancer import backend_pool
+from services.attachments import attachment_registry
+from services.catalog import catalog
+from services.render_cache import render_cache
+from services.admin_cache import admin_cache
+from services.recorder import recorder, ArrivalQueue
+
 from handlers.auth_handlers import (
     start,
     help_command,
@@ -34,7 +66,8 @@ from handlers.auth_handlers import (
     login_password,
     login_2fa,
     logout,
-    cancel
+    cancel,
+    login_timeout
 )
 
 from handlers.query_handlers import (
@@ -44,6 +77,12 @@ from handlers.query_handlers import (
     movements_command
 )
 
+from handlers.chart_handlers import chart_command
+from handlers.compare_handlers import compare_command
+from handlers.forecast_handlers import forecast_command
+from handlers.recurring_handlers import recurring_command
+from handlers.admin_handlers import admin_command, admin_log_page
+
 from handlers.movement_handlers import (
     new_movement_start,
     new_movement_type,
@@ -51,23 +90,80 @@ from handlers.movement_handlers import (
     new_movement_amount,
     new_movement_notes,
     new_movement_file,
+    new_movement_confirm,
+    new_movement_cancel,
+    new_movement_timeout,
     delete_movement_command,
     confirm_delete_movement,
-    edit_movement_command
+    edit_movement_command,
+    pending_command
 )
 
-# Configurar logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Configurar logging (no bloqueante, con el trace id de cada update)
+log_listener = setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    """Función principal del bot"""
+async def post_init(application: Application):
+    """Arranca los servicios que necesitan el bot ya inicializado"""
+    outbound_queue.start(application.bot)
+    recurring_scheduler.start()
+    write_journal.open()
+    duplicate_index.open()
+    attachment_registry.open()
+    recorder.open()
+    # Primera carga de los catálogos (si el backend no responde, se reintenta en segundo plano)
+    await asyncio.to_thread(catalog.refresh_all)
+
+async def post_stop(application: Application):
+    """Envía los mensajes que quedan en cola mientras el bot aún puede enviar"""
+    # post_shutdown llega con la conexión de Telegram ya cerrada
+    await recurring_scheduler.stop()
+    await outbound_queue.stop()
+
+async def post_shutdown(application: Application):
+    """Cierra el resto de servicios y registra sus estadísticas"""
+    chart_service.shutdown()
+    logger.info(f"📤 Cola de salida: {outbound_queue.metrics()}")
+    logger.info(f"🔁 Recurrentes: {recurring_scheduler.stats}")
+    logger.info(f"⏳ Escrituras pendientes: {write_journal.size} - {write_journal.stats}")
+    logger.info(f"🧹 Recolector de estado: {state_sweeper.stats}")
+    logger.info(f"🔍 Índice de duplicados: {duplicate_index.stats}")
+    logger.info(f"📎 Adjuntos: {attachment_registry.stats} (reutilizados {attachment_registry.hit_rate():.0%})")
+    logger.info(f"📚 Catálogos: {catalog.stats}")
+    logger.info(f"🖨 Mensajes formateados: {render_cache.stats} (reutilizados {render_cache.hit_rate():.0%})")
+    logger.info(f"🛠 Administración: {admin_cache.stats}")
+    logger.info(f"📡 Réplicas del backend: {backend_pool.stats} - {backend_pool.metrics()}")
+    if recorder.enabled:
+        recorder.close()
+        logger.info(f"🎙 Grabación ({recorder.path}): {recorder.stats}")
+    log_listener.stop()
+
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    """
+    Crea la aplicación con todos los handlers y tareas.
+
+    `request` sustituye la conexión con la API de Telegram (tools/replay.py
+    la usa para reproducir updates grabados sin red).
+    """
+    
+    # Persistencia de conversaciones, user_data y sesiones
+    persistence = SQLitePersistence(PERSISTENCE_PATH, update_interval=PERSISTENCE_INTERVAL)
+    session_manager.attach_store(persistence)
     
     # Crear aplicación
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .application_class(TracedApplication)
+        .token(TELEGRAM_BOT_TOKEN)
+        .persistence(persistence)
+        .update_queue(ArrivalQueue())
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
     
     # ============================================
     # Conversación de Login
@@ -78,8 +174,12 @@ def main():
             LOGIN_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_username)],
             LOGIN_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_password)],
             LOGIN_2FA: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_2fa)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, login_timeout)],
         },
-        fallbacks=[CommandHandler('cancelar', cancel)]
+        fallbacks=[CommandHandler('cancelar', cancel)],
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        name='login',
+        persistent=True
     )
     
     # ============================================
@@ -96,10 +196,20 @@ def main():
                 MessageHandler(filters.Document.ALL | filters.PHOTO, new_movement_file),
                 CommandHandler('omitir', new_movement_file)
             ],
+            NEW_MOVEMENT_CONFIRM: [CommandHandler('confirmar', new_movement_confirm)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, new_movement_timeout)],
         },
-        fallbacks=[CommandHandler('cancelar', cancel)]
+        fallbacks=[CommandHandler('cancelar', new_movement_cancel)],
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        name='nuevo_movimiento',
+        persistent=True
     )
     
+    # Última actividad de cada usuario (grupo -1: antes que el resto de handlers)
+    application.add_handler(TypeHandler(Update, state_sweeper.touch), group=-1)
+    # Sesiones que el backend ha rechazado durante el update (grupo 1: después)
+    application.add_handler(TypeHandler(Update, session_validator.expire_rejected), group=1)
+    
     # ============================================
     # Comandos básicos
     # ============================================
@@ -126,12 +236,23 @@ def main():
     application.add_handler(CommandHandler('cuentas', accounts_command))
     application.add_handler(CommandHandler('cuenta', account_detail_command))
     application.add_handler(CommandHandler('movimientos', movements_command))
+    application.add_handler(CommandHandler('grafico', chart_command))
+    application.add_handler(CommandHandler('comparar', compare_command))
+    application.add_handler(CommandHandler('prevision', forecast_command))
     
     # ============================================
     # Comandos de modificación
     # ============================================
     application.add_handler(CommandHandler('eliminar', delete_movement_command))
     application.add_handler(CommandHandler('editar', edit_movement_command))
+    application.add_handler(CommandHandler('recurrente', recurring_command))
+    application.add_handler(CommandHandler('pendientes', pending_command))
+    
+    # ============================================
+    # Administración
+    # ============================================
+    application.add_handler(CommandHandler('admin', admin_command))
+    application.add_handler(CallbackQueryHandler(admin_log_page, pattern=r'^alog:'))
     
     # Handler para confirmación de eliminación
     application.add_handler(
@@ -148,18 +269,59 @@ def main():
         """Maneja errores del bot"""
         logger.error(f"Error: {context.error}")
         if update and update.effective_message:
-            await update.effective_message.reply_text(
+            await reply(
+                update,
                 "❌ Ha ocurrido un error inesperado.\n"
                 "Por favor, intenta de nuevo más tarde."
             )
     
     application.add_error_handler(error_handler)
     
+    # ============================================
+    # Tareas en segundo plano
+    # ============================================
+    application.job_queue.run_repeating(
+        session_validator.run,
+        interval=SESSION_VALIDATION_INTERVAL,
+        first=SESSION_VALIDATION_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        write_journal.replay,
+        interval=JOURNAL_REPLAY_INTERVAL,
+        first=JOURNAL_REPLAY_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        state_sweeper.run,
+        interval=STATE_SWEEP_INTERVAL,
+        first=STATE_SWEEP_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        catalog.run,
+        interval=max(1, CATALOG_TTL // 2),
+        first=max(1, CATALOG_TTL // 2)
+    )
+    application.job_queue.run_repeating(
+        duplicate_index.run,
+        interval=DUPLICATE_REFRESH_INTERVAL,
+        first=DUPLICATE_REFRESH_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        backend_pool.run,
+        interval=HEALTH_CHECK_INTERVAL,
+        first=HEALTH_CHECK_INTERVAL
+    )
+    
+    return application
+
+def main():
+    """Función principal del bot"""
+    application = build_application()
+    
     # ============================================
     # Iniciar bot
     # ============================================
     logger.info("🤖 Bot iniciado correctamente")
-    logger.info(f"📡 Conectando a API: {API_URL}")
+    logger.info(f"📡 Conectando a API: {', '.join(API_URLS)}")
     
     # Iniciar polling
     application.run_polling(allowed_updates=Update.ALL_TYPES)
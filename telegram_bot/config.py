@@ -7,6 +7,88 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 API_URL = os.getenv('API_URL', 'http://backend:80/api')
 
+# Réplicas del backend separadas por comas (por defecto solo API_URL)
+API_URLS = [url.strip() for url in os.getenv('API_URLS', API_URL).split(',') if url.strip()]
+HEALTH_CHECK_INTERVAL = int(os.getenv('HEALTH_CHECK_INTERVAL', '10'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '2'))
+REPLICA_EJECT_FAILURES = int(os.getenv('REPLICA_EJECT_FAILURES', '3'))  # errores seguidos
+REPLICA_EJECT_TIME = int(os.getenv('REPLICA_EJECT_TIME', '30'))
+
+# Persistencia del estado de conversaciones y sesiones
+PERSISTENCE_PATH = os.getenv('PERSISTENCE_PATH', 'data/bot_state.sqlite3')
+PERSISTENCE_INTERVAL = int(os.getenv('PERSISTENCE_INTERVAL', '30'))
+
+# Validación de sesiones en segundo plano
+SESSION_VALIDATION_INTERVAL = int(os.getenv('SESSION_VALIDATION_INTERVAL', '300'))
+SESSION_VALIDATION_BATCH = int(os.getenv('SESSION_VALIDATION_BATCH', '50'))
+SESSION_VALIDATION_CONCURRENCY = int(os.getenv('SESSION_VALIDATION_CONCURRENCY', '5'))
+SESSION_MAX_IDLE = int(os.getenv('SESSION_MAX_IDLE', '7200'))  # SESSION_LIFETIME del backend
+
+# Cola de mensajes salientes (límites de Telegram: ~30 msg/s global, ~1 msg/s por chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_MERGE_WINDOW = float(os.getenv('OUTBOUND_MERGE_WINDOW', '0.15'))
+
+# Procesos para dibujar gráficos (/grafico)
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', '2'))
+
+# Tiempo máximo (segundos) que se reutiliza la lista de cuentas en /cuenta
+ACCOUNT_CACHE_TTL = int(os.getenv('ACCOUNT_CACHE_TTL', '600'))
+
+# Escrituras pendientes cuando el backend no está disponible (/pendientes)
+JOURNAL_FILES_DIR = os.getenv('JOURNAL_FILES_DIR', 'data/pending_files')
+JOURNAL_REPLAY_INTERVAL = int(os.getenv('JOURNAL_REPLAY_INTERVAL', '30'))
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', '50'))
+JOURNAL_CONCURRENCY = int(os.getenv('JOURNAL_CONCURRENCY', '4'))
+
+# Trazas por update (fracción de updates que se registran, 0-1)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+
+# Grabación anónima de updates para tools/replay.py (vacío = desactivada)
+RECORD_PATH = os.getenv('RECORD_PATH', '')
+RECORD_SAMPLE_RATE = float(os.getenv('RECORD_SAMPLE_RATE', '1'))  # fracción de usuarios
+
+# Límites del estado por usuario en memoria
+CONVERSATION_TIMEOUT = int(os.getenv('CONVERSATION_TIMEOUT', '600'))
+STATE_SWEEP_INTERVAL = int(os.getenv('STATE_SWEEP_INTERVAL', '300'))
+USER_DATA_MAX_IDLE = int(os.getenv('USER_DATA_MAX_IDLE', '3600'))
+USER_DATA_MAX_BYTES = int(os.getenv('USER_DATA_MAX_BYTES', '65536'))
+
+# Previsión de metas de ahorro (/prevision)
+FORECAST_HISTORY_MONTHS = int(os.getenv('FORECAST_HISTORY_MONTHS', '24'))
+FORECAST_MAX_MOVEMENTS = int(os.getenv('FORECAST_MAX_MOVEMENTS', '10000'))
+FORECAST_CACHE_SIZE = int(os.getenv('FORECAST_CACHE_SIZE', '5000'))
+
+# Detección de movimientos duplicados
+DUPLICATE_WINDOW_DAYS = int(os.getenv('DUPLICATE_WINDOW_DAYS', '365'))
+DUPLICATE_INDEX_TTL = int(os.getenv('DUPLICATE_INDEX_TTL', '86400'))
+# Cada cuántos segundos se buscan índices caducados de las sesiones abiertas
+DUPLICATE_REFRESH_INTERVAL = int(os.getenv('DUPLICATE_REFRESH_INTERVAL', '600'))
+DUPLICATE_MAX_USERS = int(os.getenv('DUPLICATE_MAX_USERS', '10000'))
+
+# Catálogos globales (etiquetas): segundos hasta recargarlos en segundo plano
+CATALOG_TTL = int(os.getenv('CATALOG_TTL', '300'))
+
+# Registro de adjuntos ya descargados y subidos (filas por tabla)
+ATTACHMENT_INDEX_MAX = int(os.getenv('ATTACHMENT_INDEX_MAX', '50000'))
+
+# Mensajes ya formateados de /cuentas, /balance y /movimientos
+RENDER_CACHE_ENTRIES = int(os.getenv('RENDER_CACHE_ENTRIES', '2000'))
+RENDER_CACHE_BYTES = int(os.getenv('RENDER_CACHE_BYTES', str(8 * 1024 * 1024)))
+
+# /admin stats y /admin log
+ADMIN_STATS_TTL = int(os.getenv('ADMIN_STATS_TTL', '60'))
+ADMIN_LOG_PAGE_SIZE = int(os.getenv('ADMIN_LOG_PAGE_SIZE', '10'))
+ADMIN_LOG_CACHE_PAGES = int(os.getenv('ADMIN_LOG_CACHE_PAGES', '200'))
+
+# Peticiones simultáneas por usuario en /comparar
+COMPARE_CONCURRENCY = int(os.getenv('COMPARE_CONCURRENCY', '3'))
+
+# Movimientos recurrentes (/recurrente)
+RECURRING_JITTER = int(os.getenv('RECURRING_JITTER', '3600'))  # ventana de reparto en segundos
+RECURRING_CONCURRENCY = int(os.getenv('RECURRING_CONCURRENCY', '5'))
+RECURRING_RETRY_DELAY = int(os.getenv('RECURRING_RETRY_DELAY', '300'))
+
 # Validar configuración
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN no está configurado en las variables de entorno")
@@ -38,12 +120,18 @@ Usa /login para comenzar.
 💰 Consultas:
 /balance - Ver balance total
 /cuentas - Listar cuentas
-/movimientos - Últimos movimientos
+/cuenta [nombre|número] - Detalle de una cuenta
+/movimientos [N] [filtros] - Últimos movimientos (/movimientos ayuda)
+/grafico [mes|año] [cuenta] - Gráfico de ingresos y gastos
+/comparar [mes|año] - Comparar con periodos anteriores
+/prevision [cuenta] - Previsión de balance y metas de ahorro
 
 ✏️ Acciones:
 /nuevo - Crear movimiento
 /editar [id] - Editar movimiento
 /eliminar [id] - Eliminar movimiento
+/recurrente - Movimientos recurrentes
+/pendientes - Operaciones pendientes de enviar
 
 ℹ️ Ayuda:
 /ayuda - Ver esta ayuda
@@ -54,6 +142,10 @@ Usa /login para comenzar.
     'login_success': "✅ Sesión iniciada correctamente. Usa /ayuda para ver los comandos disponibles.",
     'logout_success': "👋 Sesión cerrada correctamente.",
     'operation_cancelled': "❌ Operación cancelada.",
+    'conversation_timeout': "⌛ La operación se ha cancelado por inactividad.",
+    'conversation_expired': "⌛ Los datos de esta operación han caducado. Empieza de nuevo, por favor.",
+    'admin_only': "⛔ Este comando solo está disponible para administradores.",
+    'owner_only': "⛔ Solo el propietario puede consultar esto.",
     'error': "❌ Ha ocurrido un error. Por favor, intenta de nuevo.",
 }
 
@@ -69,4 +161,5 @@ Usa /login para comenzar.
     NEW_MOVEMENT_FILE,
     EDIT_MOVEMENT_FIELD,
     EDIT_MOVEMENT_VALUE,
-) = range(10)
\ No newline at end of file
+    NEW_MOVEMENT_CONFIRM,
+) = range(11)
\ No newline at end of file
@@ -0,0 +1,257 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+from services.message_queue import reply
+from services.session_manager import session_manager
+from services.state_gc import state_sweeper
+from services.load_balancer import backend_pool
+from services.attachments import attachment_registry
+from services.admin_cache import admin_cache, LogBrowse
+from utils.formatters import format_number
+from utils.movement_query import QueryError, parse_period
+from config import MESSAGES
+
+ADMIN_ROLES = ('propietario', 'administrador')
+
+def require_admin(func):
+    """Decorador: solo usuarios con sesión y rol de administrador"""
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = session_manager.get_user_data(update.effective_user.id)
+
+        if not user:
+            await reply(update, MESSAGES['not_logged_in'])
+            return
+        if user.get('rol') not in ADMIN_ROLES:
+            await reply(update, MESSAGES['admin_only'])
+            return
+
+        return await func(update, context)
+
+    return wrapper
+
+def _size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{format_number(size / (1024 * 1024))} MB"
+    return f"{format_number(size / 1024)} KB"
+
+async def _memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    report = state_sweeper.report(context.application)
+    stats = report['stats']
+
+    message = "🧠 *Memoria del bot*\n\n"
+    if report['rss_bytes'] is not None:
+        message += f"Proceso: {_size(report['rss_bytes'])}\n"
+    message += (
+        f"user\\_data: {report['users']} usuario(s), {_size(report['user_data_bytes'])}\n"
+        f"Sesiones: {report['sessions']} ({report['account_caches']} con cuentas en caché)\n"
+        f"Actividad registrada: {report['last_seen']} usuario(s)\n"
+    )
+    if report['top']:
+        message += "\nMayores user\\_data:\n"
+        for size, user_id in report['top']:
+            message += f"  {user_id}: {_size(size)}\n"
+    message += (
+        f"\nRecolector: {stats['runs']} pasada(s), {stats['keys_evicted']} clave(s) y "
+        f"{stats['users_dropped']} usuario(s) liberados, {stats['over_cap']} por encima del límite, "
+        f"{stats['account_caches']} caché(s) de cuentas"
+    )
+    await reply(update, message, parse_mode='Markdown')
+
+def _ms(value) -> str:
+    return '-' if value is None else f"{value:.0f} ms"
+
+async def _replicas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stats = backend_pool.stats
+    message = "📡 *Réplicas del backend*\n\n"
+    for replica in backend_pool.metrics():
+        if replica['available']:
+            state = '✅'
+        elif not replica['healthy']:
+            state = '❌ sin /health'
+        else:
+            state = f"⏸️ expulsada {replica['ejected_for']:.0f}s"
+        message += (
+            f"{state} `{replica['url']}`\n"
+            f"  {replica['requests']} petición(es), {replica['errors']} error(es), "
+            f"{replica['outstanding']} en curso\n"
+            f"  media {_ms(replica['ewma_ms'])}, p50 {_ms(replica['p50_ms'])}, "
+            f"p95 {_ms(replica['p95_ms'])}\n"
+        )
+    message += (
+        f"\nReintentos: {stats['retries']}, expulsiones: {stats['ejections']}, "
+        f"readmitidas: {stats['reintroduced']}, sin réplicas disponibles: {stats['panic']}"
+    )
+    await reply(update, message, parse_mode='Markdown')
+
+async def _attachments(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stats = attachment_registry.stats
+    files, uploads = attachment_registry.size()
+    message = (
+        "📎 *Adjuntos*\n\n"
+        f"Reutilizados: {stats['reused']} de {stats['reused'] + stats['uploads']} "
+        f"({attachment_registry.hit_rate() * 100:.1f}%)\n"
+        f"Descargas evitadas por file\\_unique\\_id: {stats['unique_hits']} de {stats['lookups']}\n"
+        f"Mismo contenido con otro archivo: {stats['content_hits']}\n"
+        f"Ya no estaban en el backend: {stats['stale']}\n"
+        f"Transferencia ahorrada: {_size(stats['bytes_saved'])}\n\n"
+        f"Registro: {files} archivo(s), {uploads} contenido(s) subidos"
+    )
+    await reply(update, message, parse_mode='Markdown')
+
+def _is_owner(user_id: int) -> bool:
+    """El historial y las estadísticas generales solo los sirve el backend al propietario"""
+    user = session_manager.get_user_data(user_id)
+    return bool(user) and user.get('rol') == 'propietario'
+
+async def _stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_owner(update.effective_user.id):
+        await reply(update, MESSAGES['owner_only'])
+        return
+
+    api = session_manager.get_api_client(update.effective_user.id)
+    try:
+        stats, age = await asyncio.to_thread(admin_cache.general_stats, api)
+    except Exception as e:
+        await reply(update, f"❌ Error: {str(e)}")
+        return
+
+    message = (
+        "📈 *Estadísticas generales*\n\n"
+        f"Usuarios: {stats['total_usuarios']} ({stats.get('usuarios_activos', '-')} activos en 30 días, "
+        f"{stats.get('usuarios_con_2fa', '-')} con 2FA)\n"
+        f"Cuentas: {stats['total_cuentas']}\n"
+        f"Movimientos: {stats['total_movimientos']}\n"
+    )
+    if age >= 1:
+        message += f"\n_Datos de hace {age:.0f}s_"
+    await reply(update, message, parse_mode='Markdown')
+
+LOG_USAGE = (
+    "Uso: /admin log [usuario:nombre] [desde:2026-01] [hasta:2026-01-31] [texto de la acción]\n"
+    "Ejemplo: /admin log usuario:juan desde:2026-10 eliminado"
+)
+
+def _parse_log_filters(args: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """Filtros de GET /admin/activity-log y su descripción"""
+    filters: Dict[str, str] = {}
+    labels: List[str] = []
+    words = []
+    for token in args:
+        key, sep, value = token.partition(':')
+        key = key.lower()
+        if not sep or key not in ('usuario', 'desde', 'hasta'):
+            words.append(token)
+            continue
+        if not value:
+            raise QueryError(f"Falta el valor en «{token}»")
+        if key == 'usuario':
+            filters['usuario'] = value
+            labels.append(f"@{value}")
+            continue
+        first, last, label = parse_period(value)
+        filters['fecha_desde' if key == 'desde' else 'fecha_hasta'] = first if key == 'desde' else last
+        labels.append(f"{key} {label}")
+
+    if words:
+        filters['accion'] = ' '.join(words)
+        labels.append(f"\"{filters['accion']}\"")
+    if 'fecha_desde' in filters and 'fecha_hasta' in filters and filters['fecha_desde'] > filters['fecha_hasta']:
+        raise QueryError("La fecha «desde» es posterior a «hasta»")
+    return filters, labels
+
+def _log_time(fecha: str) -> str:
+    try:
+        return datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
+    except (TypeError, ValueError):
+        return fecha or '-'
+
+def _format_log_page(browse: LogBrowse, logs: List[Dict], number: int, pages: int) -> str:
+    # Sin Markdown: las acciones son texto libre
+    title = ' · '.join(["📜 Historial"] + browse.labels)
+    message = f"{title}\nPágina {number + 1} de {pages} ({browse.total} acción(es))\n\n"
+    if not logs:
+        return message + "No hay acciones que cumplan el filtro."
+    for log in logs:
+        message += f"#{log['id']} {_log_time(log.get('fecha'))} · {log.get('nombre_usuario', log['id_usuario'])}\n"
+        message += f"   {log['accion']}"
+        message += f" · {log['ip']}\n" if log.get('ip') else "\n"
+    return message
+
+def _log_keyboard(browse_id: str, number: int, pages: int):
+    buttons = []
+    if number > 0:
+        buttons.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"alog:{browse_id}:{number - 1}"))
+    if number + 1 < pages:
+        buttons.append(InlineKeyboardButton("Siguiente ▶️", callback_data=f"alog:{browse_id}:{number + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def _show_log_page(update: Update, context: ContextTypes.DEFAULT_TYPE, browse_id: str,
+                         browse: LogBrowse, number: int):
+    """Envía (o edita, con la vista de la consulta) una página y precarga la siguiente"""
+    api = session_manager.get_api_client(update.effective_user.id)
+    try:
+        logs = await asyncio.to_thread(admin_cache.page, api, browse, number)
+    except Exception as e:
+        await reply(update, f"❌ Error: {str(e)}")
+        return
+
+    pages = admin_cache.pages(browse)
+    await reply(
+        update,
+        _format_log_page(browse, logs, number, pages),
+        view=f"alog:{browse_id}",
+        reply_markup=_log_keyboard(browse_id, number, pages)
+    )
+    if number + 1 < pages:
+        context.application.create_task(asyncio.to_thread(admin_cache.prefetch, api, browse, number + 1))
+
+async def _log(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not _is_owner(user_id):
+        await reply(update, MESSAGES['owner_only'])
+        return
+
+    try:
+        filters, labels = _parse_log_filters(context.args[1:])
+    except QueryError as e:
+        await reply(update, f"❌ {str(e)}\n\n{LOG_USAGE}")
+        return
+
+    browse_id = admin_cache.open(user_id, filters, labels)
+    await _show_log_page(update, context, browse_id, admin_cache.browse(browse_id), 0)
+
+async def admin_log_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Botones Anterior/Siguiente de /admin log"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    _, browse_id, number = query.data.split(':')
+
+    browse = admin_cache.browse(browse_id)
+    if not _is_owner(user_id):
+        await query.answer(MESSAGES['owner_only'], show_alert=True)
+        return
+    if browse is None or browse.owner != user_id:
+        await query.answer("⌛ Esta consulta ha caducado. Vuelve a lanzar /admin log.", show_alert=True)
+        return
+
+    await query.answer()
+    await _show_log_page(update, context, browse_id, browse, int(number))
+
+SUBCOMMANDS = {
+    'memoria': _memory,
+    'replicas': _replicas,
+    'adjuntos': _attachments,
+    'stats': _stats,
+    'log': _log,
+}
+
+@require_admin
+async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /admin <subcomando> - Herramientas de administración"""
+    handler = SUBCOMMANDS.get(context.args[0].lower()) if context.args else None
+    if handler is None:
+        await reply(update, "Uso: /admin " + "|".join(SUBCOMMANDS))
+        return
+    await handler(update, context)
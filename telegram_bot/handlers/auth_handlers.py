@@ -2,18 +2,24 @@ from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from services.api_client import APIClient
 from services.session_manager import session_manager
+from services.recurring import recurring_scheduler
+from services.duplicates import duplicate_index
+from services.state_gc import clear_transient
+from services.message_queue import reply
 from config import MESSAGES, LOGIN_USERNAME, LOGIN_PASSWORD, LOGIN_2FA
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /start"""
-    await update.message.reply_text(
+    await reply(
+        update,
         MESSAGES['welcome'],
         parse_mode='Markdown'
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /ayuda"""
-    await update.message.reply_text(
+    await reply(
+        update,
         MESSAGES['help'],
         parse_mode='Markdown'
     )
@@ -24,14 +30,16 @@ async def login_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if session_manager.is_logged_in(user_id):
         user_data = session_manager.get_user_data(user_id)
-        await update.message.reply_text(
+        await reply(
+            update,
             f"Ya tienes sesión iniciada como *{user_data['nombre_usuario']}*.\n"
             "Usa /logout para cerrar sesión.",
             parse_mode='Markdown'
         )
         return ConversationHandler.END
     
-    await update.message.reply_text(
+    await reply(
+        update,
         "🔐 *Inicio de Sesión*\n\n"
         "Ingresa tu nombre de usuario:",
         parse_mode='Markdown'
@@ -42,14 +50,15 @@ async def login_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Recibe el nombre de usuario"""
     context.user_data['username'] = update.message.text.strip()
     
-    await update.message.reply_text(
+    await reply(
+        update,
         "Ahora ingresa tu contraseña:"
     )
     return LOGIN_PASSWORD
 
 async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Recibe la contraseña e intenta hacer login"""
-    username = context.user_data['username']
+    username = context.user_data.pop('username', None)
     password = update.message.text.strip()
     
     # Borrar mensaje con contraseña por seguridad
@@ -58,6 +67,10 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
+    if username is None:
+        await reply(update, MESSAGES['conversation_expired'])
+        return ConversationHandler.END
+    
     try:
         api = APIClient()
         response = api.login(username, password)
@@ -67,7 +80,8 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Verificar si requiere 2FA
         if data.get('requires_2fa'):
             context.user_data['user_id_2fa'] = data['user_id']
-            await update.effective_message.reply_text(
+            await reply(
+                update,
                 "🔐 Se ha enviado un código de verificación a tu correo.\n"
                 "Ingresa el código (6 dígitos):"
             )
@@ -85,8 +99,14 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
             token,
             user_data
         )
+        recurring_scheduler.release(update.effective_user.id)
+        # El índice de duplicados se prepara ya, no al registrar el primer movimiento
+        context.application.create_task(duplicate_index.refresh(
+            session_manager.get_api_client(update.effective_user.id), update.effective_user.id
+        ))
         
-        await update.effective_message.reply_text(
+        await reply(
+            update,
             f"✅ ¡Bienvenido, *{user_data['nombre_usuario']}*!\n\n"
             f"Usa /ayuda para ver los comandos disponibles.",
             parse_mode='Markdown'
@@ -95,7 +115,8 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
         
     except Exception as e:
-        await update.effective_message.reply_text(
+        await reply(
+            update,
             f"❌ Error al iniciar sesión: {str(e)}\n\n"
             "Usa /login para intentar de nuevo."
         )
@@ -104,10 +125,11 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def login_2fa(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Verifica el código 2FA"""
     code = update.message.text.strip()
-    user_id_2fa = context.user_data.get('user_id_2fa')
+    user_id_2fa = context.user_data.pop('user_id_2fa', None)
     
     if not user_id_2fa:
-        await update.message.reply_text(
+        await reply(
+            update,
             "❌ Error: sesión expirada. Usa /login para comenzar de nuevo."
         )
         return ConversationHandler.END
@@ -125,8 +147,14 @@ async def login_2fa(update: Update, context: ContextTypes.DEFAULT_TYPE):
             token,
             user_data
         )
+        recurring_scheduler.release(update.effective_user.id)
+        # El índice de duplicados se prepara ya, no al registrar el primer movimiento
+        context.application.create_task(duplicate_index.refresh(
+            session_manager.get_api_client(update.effective_user.id), update.effective_user.id
+        ))
         
-        await update.message.reply_text(
+        await reply(
+            update,
             f"✅ ¡Verificación exitosa!\n\n"
             f"Bienvenido, *{user_data['nombre_usuario']}*\n\n"
             f"Usa /ayuda para ver los comandos disponibles.",
@@ -136,7 +164,8 @@ async def login_2fa(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
         
     except Exception as e:
-        await update.message.reply_text(
+        await reply(
+            update,
             f"❌ Código incorrecto o expirado: {str(e)}\n\n"
             "Usa /login para intentar de nuevo."
         )
@@ -147,7 +176,7 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     if not session_manager.is_logged_in(user_id):
-        await update.message.reply_text(MESSAGES['not_logged_in'])
+        await reply(update, MESSAGES['not_logged_in'])
         return
     
     try:
@@ -158,9 +187,16 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     session_manager.delete_session(user_id)
     
-    await update.message.reply_text(MESSAGES['logout_success'])
+    await reply(update, MESSAGES['logout_success'])
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancela la operación actual"""
-    await update.message.reply_text(MESSAGES['operation_cancelled'])
-    return ConversationHandler.END
\ No newline at end of file
+    clear_transient(context.user_data)
+    await reply(update, MESSAGES['operation_cancelled'])
+    return ConversationHandler.END
+
+async def login_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Estado TIMEOUT del login: CONVERSATION_TIMEOUT segundos sin respuesta"""
+    context.user_data.pop('username', None)
+    context.user_data.pop('user_id_2fa', None)
+    await reply(update, MESSAGES['conversation_timeout'])
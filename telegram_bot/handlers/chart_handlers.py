@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, List, Tuple
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+from services.charts import chart_service
+from services.message_queue import outbound_queue, reply
+from services.models import to_decimal
+from services.session_manager import session_manager
+from handlers.query_handlers import require_login, resolve_accounts
+from utils.account_index import normalize
+from utils.formatters import format_money, MONTH_NAMES
+
+logger = logging.getLogger(__name__)
+
+def _buckets(period: str, today: date) -> Tuple[str, List[str], List[str]]:
+    """Devuelve (fecha_desde, claves de cada periodo, etiquetas)"""
+    if period == 'mes':
+        keys = [f"{today:%Y-%m}-{day:02d}" for day in range(1, today.day + 1)]
+        labels = [f"{day}" for day in range(1, today.day + 1)]
+        return f"{today:%Y-%m}-01", keys, labels
+
+    keys, labels = [], []
+    year, month = today.year, today.month
+    for _ in range(12):
+        keys.insert(0, f"{year}-{month:02d}")
+        labels.insert(0, f"{MONTH_NAMES[month - 1]} {year % 100:02d}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return f"{keys[0]}-01", keys, labels
+
+def _series(series: List[Dict[str, str]], keys: List[str]) -> Tuple[List[float], List[float]]:
+    """Ingresos y gastos de cada periodo (los que no vienen del backend no tienen movimientos)"""
+    by_period = {row['periodo']: row for row in series}
+    ingresos, gastos = [], []
+    for key in keys:
+        row = by_period.get(key)
+        ingresos.append(round(float(to_decimal(row['suma_ingresos'])), 2) if row else 0.0)
+        gastos.append(round(float(to_decimal(row['suma_retiradas'])), 2) if row else 0.0)
+    return ingresos, gastos
+
+@require_login
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /grafico [mes|año] [cuenta] - Ingresos vs gastos y balances"""
+    user_id = update.effective_user.id
+    api = session_manager.get_api_client(user_id)
+
+    args = list(context.args or [])
+    period = 'mes'
+    if args and normalize(args[0]) in ('mes', 'ano', 'anio'):
+        period = 'mes' if normalize(args.pop(0)) == 'mes' else 'año'
+    account_query = ' '.join(args)
+
+    try:
+        account = None
+        if account_query:
+            matches, _ = await asyncio.to_thread(resolve_accounts, api, user_id, account_query)
+            if not matches or len(matches) > 1:
+                await reply(
+                    update,
+                    f"❌ No se pudo identificar la cuenta \"{account_query}\".\n"
+                    "Usa /cuentas para ver la lista."
+                )
+                return
+            account = matches[0]
+
+        today = date.today()
+        fecha_desde, keys, labels = _buckets(period, today)
+        filters = {'fecha_desde': f"{fecha_desde} 00:00:00", 'agrupar': 'dia' if period == 'mes' else 'mes'}
+        if account:
+            filters['id_cuenta'] = account.id
+
+        # Barras y totales salen de la misma agregación en el backend
+        data = (await asyncio.to_thread(api.get_movements_stats, **filters))['data']
+        ingresos, gastos = _series(data['series'], keys)
+        total_ingresos, total_gastos = data['stats']['suma_ingresos'], data['stats']['suma_retiradas']
+
+        if account:
+            balances = [(account.nombre, round(float(account.balance), 2))]
+        else:
+            accounts = await asyncio.to_thread(api.get_account_list)
+            balances = [(a.nombre, round(float(a.balance), 2)) for a in accounts]
+
+        periodo_texto = 'este mes' if period == 'mes' else 'últimos 12 meses'
+        spec = {
+            'title': f"Ingresos vs gastos - {periodo_texto}" + (f" - {account.nombre}" if account else ''),
+            'labels': labels,
+            'ingresos': ingresos,
+            'gastos': gastos,
+            'balances': balances,
+        }
+        caption = (
+            f"📊 {periodo_texto.capitalize()}\n"
+            f"📈 Ingresos: {format_money(total_ingresos)}\n"
+            f"📉 Gastos: {format_money(total_gastos)}"
+        )
+
+        # La foto no pasa por la cola: antes sale lo que ya hay encolado para el chat
+        await outbound_queue.wait_chat(update.effective_chat.id)
+
+        key = chart_service.spec_hash(spec)
+        file_id = chart_service.get_file_id(key)
+        if file_id:
+            try:
+                await update.message.reply_photo(photo=file_id, caption=caption)
+                return
+            except BadRequest:
+                # file_id ya no válido: se vuelve a dibujar
+                chart_service.forget(key)
+
+        png = await chart_service.render(spec)
+        message = await update.message.reply_photo(photo=png, caption=caption)
+        chart_service.remember(key, message.photo[-1].file_id)
+
+    except ImportError:
+        await reply(update, "❌ Los gráficos no están disponibles (falta matplotlib).")
+    except Exception as e:
+        logger.error(f"Error al generar gráfico: {e}")
+        await reply(update, f"❌ Error: {str(e)}")
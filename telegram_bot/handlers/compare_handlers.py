@@ -0,0 +1,80 @@
+import asyncio
+import calendar
+import logging
+from datetime import date
+from typing import Dict, List, Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.message_queue import reply
+from services.session_manager import session_manager
+from handlers.query_handlers import require_login
+from utils.account_index import normalize
+from utils.formatters import format_comparison, MONTH_NAMES
+from config import COMPARE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Semáforo por usuario: limita las peticiones simultáneas de un mismo usuario
+_limits: Dict[int, asyncio.Semaphore] = {}
+_in_flight: Dict[int, int] = {}
+
+def _month(year: int, month: int) -> Tuple[str, str, str]:
+    """(etiqueta, primer día, último día) de un mes"""
+    last = calendar.monthrange(year, month)[1]
+    return (f"{MONTH_NAMES[month - 1]} {year % 100:02d}",
+            f"{year}-{month:02d}-01", f"{year}-{month:02d}-{last:02d}")
+
+def _periods(mode: str, today: date) -> List[Tuple[str, str, str]]:
+    """Periodo actual seguido de los periodos con los que se compara"""
+    if mode == 'año':
+        return [(str(year), f"{year}-01-01", f"{year}-12-31")
+                for year in (today.year, today.year - 1)]
+
+    previous_year, previous_month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    return [
+        _month(today.year, today.month),
+        _month(previous_year, previous_month),
+        _month(today.year - 1, today.month),
+    ]
+
+@require_login
+async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /comparar [mes|año] - Compara el periodo actual con los anteriores"""
+    user_id = update.effective_user.id
+    api = session_manager.get_api_client(user_id)
+
+    mode = 'mes'
+    if context.args and normalize(context.args[0]) in ('ano', 'anio'):
+        mode = 'año'
+
+    today = date.today()
+    periods = _periods(mode, today)
+
+    semaphore = _limits.setdefault(user_id, asyncio.Semaphore(COMPARE_CONCURRENCY))
+    _in_flight[user_id] = _in_flight.get(user_id, 0) + 1
+
+    async def fetch(desde: str, hasta: str):
+        async with semaphore:
+            return await asyncio.to_thread(api.get_period_stats, desde, hasta)
+
+    try:
+        results = await asyncio.gather(*(fetch(desde, hasta) for _, desde, hasta in periods))
+    except Exception as e:
+        logger.error(f"Error al comparar periodos: {e}")
+        await reply(update, f"❌ Error: {str(e)}")
+        return
+    finally:
+        _in_flight[user_id] -= 1
+        if not _in_flight[user_id]:
+            del _in_flight[user_id]
+            del _limits[user_id]
+
+    current_label = periods[0][0]
+    note = (f"{current_label} incluye hasta hoy, día {today.day}" if mode == 'mes'
+            else f"{current_label} incluye hasta hoy, {today:%d/%m}")
+
+    message = format_comparison(
+        [(label, stats) for (label, _, _), stats in zip(periods, results)],
+        note=note
+    )
+    await reply(update, message, parse_mode='Markdown')
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.forecast import forecast_cache
+from services.message_queue import reply
+from services.session_manager import session_manager
+from handlers.query_handlers import require_login, resolve_accounts
+from utils.formatters import format_forecast, format_forecast_summary
+
+logger = logging.getLogger(__name__)
+
+@require_login
+async def forecast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /prevision [cuenta] - Balance previsto y fecha estimada de las metas"""
+    user_id = update.effective_user.id
+    api = session_manager.get_api_client(user_id)
+    query = ' '.join(context.args or [])
+
+    try:
+        if query:
+            matches, _ = await asyncio.to_thread(resolve_accounts, api, user_id, query)
+            if not matches or len(matches) > 1:
+                await reply(
+                    update,
+                    f"❌ No se pudo identificar la cuenta \"{query}\".\n"
+                    "Usa /cuentas para ver la lista."
+                )
+                return
+            # El balance tiene que ser el actual: con él se valida la caché
+            account = await asyncio.to_thread(api.get_account_detail, matches[0].id)
+            forecast = await asyncio.to_thread(forecast_cache.forecast, api, user_id, account)
+            if forecast is None:
+                await reply(update, f"ℹ️ {account.nombre} aún no tiene un mes completo de movimientos.")
+                return
+            await reply(update, format_forecast(account, forecast), parse_mode='Markdown')
+            return
+
+        accounts = [a for a in await asyncio.to_thread(api.get_account_list) if a.meta]
+        if not accounts:
+            await reply(
+                update,
+                "ℹ️ Ninguna de tus cuentas tiene una meta de ahorro.\n"
+                "Usa /prevision [cuenta] para ver la previsión de una cuenta."
+            )
+            return
+
+        forecasts = await asyncio.gather(*(
+            asyncio.to_thread(forecast_cache.forecast, api, user_id, account)
+            for account in accounts
+        ))
+        await reply(update, format_forecast_summary(list(zip(accounts, forecasts))), parse_mode='Markdown')
+
+    except Exception as e:
+        logger.error(f"Error al calcular la previsión: {e}")
+        await reply(update, f"❌ Error: {str(e)}")
@@ -1,7 +1,17 @@
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from services.session_manager import session_manager
+from services.message_queue import reply
+from services.api_client import BackendUnavailableError, PreconditionFailedError
+from services.write_journal import write_journal, new_idempotency_key
+from services.state_gc import clear_transient
+from services.forecast import forecast_cache
+from services.duplicates import duplicate_index, fingerprint_item
+from services.attachments import attachment_registry, file_digest
+from utils.formatters import format_money
 from datetime import datetime
+import asyncio
+import logging
 import os
 from config import (
     MESSAGES,
@@ -9,26 +19,36 @@ from config import (
     NEW_MOVEMENT_ACCOUNT,
     NEW_MOVEMENT_AMOUNT,
     NEW_MOVEMENT_NOTES,
-    NEW_MOVEMENT_FILE
+    NEW_MOVEMENT_FILE,
+    NEW_MOVEMENT_CONFIRM
 )
 
+logger = logging.getLogger(__name__)
+
 def require_login(func):
     """Decorador para verificar que el usuario esté logueado"""
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         
         if not session_manager.is_logged_in(user_id):
-            await update.message.reply_text(MESSAGES['not_logged_in'])
+            await reply(update, MESSAGES['not_logged_in'])
             return ConversationHandler.END
         
         return await func(update, context)
     
     return wrapper
 
+def end_new_movement(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Termina la conversación de /nuevo sin dejar datos temporales en user_data"""
+    clear_transient(context.user_data, 'new_movement_')
+    context.user_data.pop('accounts', None)
+    return ConversationHandler.END
+
 @require_login
 async def new_movement_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Inicia el proceso de crear un movimiento"""
-    await update.message.reply_text(
+    await reply(
+        update,
         "💰 *Nuevo Movimiento*\n\n"
         "¿Qué tipo de movimiento deseas registrar?\n\n"
         "1️⃣ Ingreso 📈\n"
@@ -50,7 +70,8 @@ async def new_movement_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['new_movement_tipo'] = 'retirada'
         tipo_text = 'Gasto 📉'
     else:
-        await update.message.reply_text(
+        await reply(
+            update,
             "❌ Opción inválida. Responde con 1 (Ingreso) o 2 (Gasto)."
         )
         return NEW_MOVEMENT_TYPE
@@ -60,34 +81,36 @@ async def new_movement_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     api = session_manager.get_api_client(user_id)
     
     try:
-        response = api.get_accounts()
-        accounts = response['data']['cuentas']
+        accounts = api.get_account_list()
+        session_manager.cache_accounts(user_id, accounts)
         
         if not accounts:
-            await update.message.reply_text(
+            await reply(
+                update,
                 "❌ No tienes cuentas registradas.\n"
                 "Crea una cuenta desde la aplicación web primero."
             )
-            return ConversationHandler.END
+            return end_new_movement(context)
         
-        context.user_data['accounts'] = accounts
+        # Solo lo necesario para elegir la cuenta: user_data se persiste en cada update
+        context.user_data['accounts'] = [(account.id, account.nombre) for account in accounts]
         
         # Mostrar cuentas disponibles
         message = f"Tipo seleccionado: *{tipo_text}*\n\n"
         message += "Selecciona la cuenta:\n\n"
         
         for i, account in enumerate(accounts, 1):
-            tipo_emoji = '💵' if account['tipo'] == 'efectivo' else '🏦'
-            message += f"{i}. {tipo_emoji} {account['nombre']}\n"
+            tipo_emoji = '💵' if account.tipo == 'efectivo' else '🏦'
+            message += f"{i}. {tipo_emoji} {account.nombre}\n"
         
         message += "\nResponde con el número de la cuenta."
         
-        await update.message.reply_text(message, parse_mode='Markdown')
+        await reply(update, message, parse_mode='Markdown')
         return NEW_MOVEMENT_ACCOUNT
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
-        return ConversationHandler.END
+        await reply(update, f"❌ Error: {str(e)}")
+        return end_new_movement(context)
 
 @require_login
 async def new_movement_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -95,26 +118,35 @@ async def new_movement_account(update: Update, context: ContextTypes.DEFAULT_TYP
     account_input = update.message.text.strip()
     
     if not account_input.isdigit():
-        await update.message.reply_text(
+        await reply(
+            update,
             "❌ Por favor, responde con el número de la cuenta."
         )
         return NEW_MOVEMENT_ACCOUNT
     
     index = int(account_input) - 1
-    accounts = context.user_data.get('accounts', [])
+    accounts = context.user_data.get('accounts')
+    
+    if not accounts:
+        # Datos descartados por el recolector (p. ej. conversación restaurada tras un reinicio)
+        await reply(update, MESSAGES['conversation_expired'])
+        return end_new_movement(context)
     
     if index < 0 or index >= len(accounts):
-        await update.message.reply_text(
+        await reply(
+            update,
             f"❌ Número inválido. Tienes {len(accounts)} cuenta(s)."
         )
         return NEW_MOVEMENT_ACCOUNT
     
-    selected_account = accounts[index]
-    context.user_data['new_movement_cuenta'] = selected_account['id']
-    context.user_data['new_movement_cuenta_nombre'] = selected_account['nombre']
+    account_id, account_name = accounts[index]
+    context.user_data['new_movement_cuenta'] = account_id
+    context.user_data['new_movement_cuenta_nombre'] = account_name
+    del context.user_data['accounts']
     
-    await update.message.reply_text(
-        f"Cuenta seleccionada: *{selected_account['nombre']}*\n\n"
+    await reply(
+        update,
+        f"Cuenta seleccionada: *{account_name}*\n\n"
         "Ahora ingresa la cantidad (solo números):\n"
         "Ejemplo: 50.00",
         parse_mode='Markdown'
@@ -133,7 +165,8 @@ async def new_movement_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         context.user_data['new_movement_cantidad'] = amount
         
-        await update.message.reply_text(
+        await reply(
+            update,
             f"Cantidad: *€{amount:.2f}*\n\n"
             "¿Deseas agregar notas? (opcional)\n\n"
             "Escribe las notas o envía /omitir para continuar.",
@@ -142,7 +175,8 @@ async def new_movement_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
         return NEW_MOVEMENT_NOTES
         
     except ValueError:
-        await update.message.reply_text(
+        await reply(
+            update,
             "❌ Cantidad inválida. Ingresa un número positivo.\n"
             "Ejemplo: 50.00"
         )
@@ -156,7 +190,8 @@ async def new_movement_notes(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         context.user_data['new_movement_notas'] = update.message.text.strip()[:1000]
     
-    await update.message.reply_text(
+    await reply(
+        update,
         "¿Deseas adjuntar un archivo? (PDF o imagen)\n\n"
         "Envía el archivo o /omitir para finalizar."
     )
@@ -167,61 +202,192 @@ async def new_movement_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Recibe el archivo adjunto o finaliza sin él"""
     user_id = update.effective_user.id
     api = session_manager.get_api_client(user_id)
-    file_path = None
     
-    # Verificar si hay archivo
+    if 'new_movement_cantidad' not in context.user_data:
+        await reply(update, MESSAGES['conversation_expired'])
+        return end_new_movement(context)
+    
+    # El archivo no se descarga aún: puede que ya se tenga (mismo file_unique_id)
     if update.message.document:
-        file = await update.message.document.get_file()
-        file_path = f'/tmp/telegram_bot_{user_id}_{file.file_id}'
-        await file.download_to_drive(file_path)
+        document = update.message.document
+        context.user_data['new_movement_adjunto'] = {
+            'file_id': document.file_id,
+            'unique_id': document.file_unique_id,
+            'suffix': os.path.splitext(document.file_name or '')[1],
+            'size': document.file_size or 0,
+        }
     elif update.message.photo:
-        file = await update.message.photo[-1].get_file()
-        file_path = f'/tmp/telegram_bot_{user_id}_{file.file_id}.jpg'
-        await file.download_to_drive(file_path)
+        photo = update.message.photo[-1]
+        context.user_data['new_movement_adjunto'] = {
+            'file_id': photo.file_id,
+            'unique_id': photo.file_unique_id,
+            'suffix': '.jpg',
+            'size': photo.file_size or 0,
+        }
+    
+    data = _movement_data(context)
+    if await _is_duplicate(api, user_id, data):
+        tipo_text = 'ingreso' if data['tipo'] == 'ingreso' else 'gasto'
+        await reply(
+            update,
+            f"⚠️ *Posible duplicado*\n\n"
+            f"Hoy ya hay un {tipo_text} de €{data['cantidad']:.2f} en "
+            f"{context.user_data['new_movement_cuenta_nombre']} con las mismas notas.\n\n"
+            "Envía /confirmar para registrarlo igualmente o /cancelar para descartarlo.",
+            parse_mode='Markdown'
+        )
+        return NEW_MOVEMENT_CONFIRM
+    
+    return await _submit_new_movement(update, context, data)
+
+@require_login
+async def new_movement_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Registra el movimiento aunque parezca un duplicado (/confirmar)"""
+    if 'new_movement_cantidad' not in context.user_data:
+        await reply(update, MESSAGES['conversation_expired'])
+        return end_new_movement(context)
+    
+    return await _submit_new_movement(update, context, _movement_data(context))
+
+async def new_movement_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cancelar dentro de /nuevo"""
+    await reply(update, MESSAGES['operation_cancelled'])
+    return end_new_movement(context)
+
+def _movement_data(context: ContextTypes.DEFAULT_TYPE) -> dict:
+    return {
+        'tipo': context.user_data['new_movement_tipo'],
+        'id_cuenta': context.user_data['new_movement_cuenta'],
+        'cantidad': context.user_data['new_movement_cantidad'],
+        'notas': context.user_data['new_movement_notas'],
+        'fecha_movimiento': datetime.now().strftime('%Y-%m-%d %H:%M:00')  # Fecha con hora
+    }
+
+async def _is_duplicate(api, user_id: int, data: dict) -> bool:
+    """Consulta el índice de huellas; si aún no está construido (se hace en segundo plano) no avisa"""
+    def check():
+        if not duplicate_index.is_built(user_id):
+            return False
+        return duplicate_index.contains(user_id, fingerprint_item(data))
+    
+    try:
+        return await asyncio.to_thread(check)
+    except Exception as e:
+        # Sin índice no se bloquea el alta: solo se pierde el aviso
+        logger.warning(f"No se pudo comprobar si hay duplicados para {user_id}: {e}")
+        return False
+
+async def _download_attachment(context: ContextTypes.DEFAULT_TYPE, user_id: int, attachment: dict) -> str:
+    """Descarga el adjunto de Telegram y registra su SHA-256"""
+    file = await context.bot.get_file(attachment['file_id'])
+    file_path = f"/tmp/telegram_bot_{user_id}_{attachment['unique_id']}{attachment['suffix']}"
+    await file.download_to_drive(file_path)
+    attachment['path'] = file_path
+    attachment['sha256'], size = await asyncio.to_thread(file_digest, file_path)
+    attachment_registry.record(user_id, attachment['unique_id'], attachment['sha256'], size)
+    return file_path
+
+async def _create_with_attachment(context: ContextTypes.DEFAULT_TYPE, api, user_id: int,
+                                  data: dict, attachment: dict, idempotency_key: str):
+    """Crea el movimiento descargando y subiendo el adjunto solo si hace falta"""
+    sha256 = await asyncio.to_thread(attachment_registry.lookup, user_id, attachment['unique_id'])
+    if sha256 is None:
+        await _download_attachment(context, user_id, attachment)
+        sha256 = attachment['sha256']
+        if await asyncio.to_thread(attachment_registry.uploaded, user_id, sha256):
+            attachment_registry.stats['content_hits'] += 1  # otro archivo de Telegram, mismo contenido
+    
+    if await asyncio.to_thread(attachment_registry.uploaded, user_id, sha256):
+        try:
+            await asyncio.to_thread(api.create_movement, data, None, idempotency_key, sha256)
+            attachment_registry.stats['reused'] += 1
+            attachment_registry.stats['bytes_saved'] += attachment['size']
+            return
+        except PreconditionFailedError:
+            # El backend ya no lo tiene (movimiento eliminado): se sube completo
+            await asyncio.to_thread(attachment_registry.forget_upload, user_id, sha256)
+    
+    if not attachment.get('path'):
+        await _download_attachment(context, user_id, attachment)
+    await asyncio.to_thread(api.create_movement, data, attachment['path'], idempotency_key)
+    attachment_registry.stats['uploads'] += 1
+    await asyncio.to_thread(attachment_registry.mark_uploaded, user_id, sha256)
+
+def _remove_download(attachment):
+    """Borra el archivo temporal descargado de Telegram"""
+    file_path = attachment.get('path') if attachment else None
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+async def _submit_new_movement(update: Update, context: ContextTypes.DEFAULT_TYPE, data: dict):
+    """Crea el movimiento (o lo guarda como pendiente) y termina la conversación"""
+    user_id = update.effective_user.id
+    api = session_manager.get_api_client(user_id)
+    attachment = context.user_data.get('new_movement_adjunto')
+    
+    # Vista de progreso: el resultado editará este mismo mensaje
+    view = f"nuevo_movimiento:{update.update_id}"
+    await reply(update, "⏳ Registrando movimiento...", view=view)
     
     # Crear movimiento
     try:
-        data = {
-            'tipo': context.user_data['new_movement_tipo'],
-            'id_cuenta': context.user_data['new_movement_cuenta'],
-            'cantidad': context.user_data['new_movement_cantidad'],
-            'notas': context.user_data['new_movement_notas'],
-            'fecha_movimiento': datetime.now().strftime('%Y-%m-%d %H:%M:00')  # Fecha con hora
-        }
-        
-        response = api.create_movement(data, file_path)
-        
-        # Limpiar archivo temporal
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-        
         tipo_emoji = '📈' if data['tipo'] == 'ingreso' else '📉'
         tipo_text = 'Ingreso' if data['tipo'] == 'ingreso' else 'Gasto'
         
-        await update.message.reply_text(
-            f"✅ *{tipo_text} registrado exitosamente!*\n\n"
+        # La misma clave se reutiliza si hay que reenviarlo desde /pendientes
+        idempotency_key = new_idempotency_key()
+        try:
+            # En un hilo aparte para que el mensaje de progreso salga mientras tanto
+            if attachment:
+                await _create_with_attachment(context, api, user_id, data, attachment, idempotency_key)
+            else:
+                await asyncio.to_thread(api.create_movement, data, None, idempotency_key)
+            forecast_cache.record(user_id, data['id_cuenta'], data['tipo'],
+                                  data['cantidad'], data['fecha_movimiento'])
+            result = f"✅ *{tipo_text} registrado exitosamente!*\n\n"
+            footer = "Usa /movimientos para ver tu historial."
+        except BackendUnavailableError:
+            if attachment and not attachment.get('path'):
+                # La cola guarda su propia copia del archivo
+                await _download_attachment(context, user_id, attachment)
+            file_path = attachment['path'] if attachment else None
+            data['cuenta_nombre'] = context.user_data['new_movement_cuenta_nombre']
+            seq = write_journal.append(user_id, 'create', data, file_path, idempotency_key)
+            result = f"⏳ *{tipo_text} guardado como pendiente (#{seq})*\n\n"
+            footer = ("El servidor no está disponible ahora mismo; se enviará automáticamente "
+                      "cuando vuelva. Usa /pendientes para ver la cola.")
+        # Un segundo envío igual (p. ej. tras una respuesta lenta) ya se detectará
+        await asyncio.to_thread(duplicate_index.add, user_id, [fingerprint_item(data)])
+        
+        _remove_download(attachment)
+        
+        await reply(
+            update,
+            result +
             f"{tipo_emoji} Cantidad: €{data['cantidad']:.2f}\n"
-            f"Cuenta: {context.user_data['new_movement_cuenta_nombre']}\n\n"
-            "Usa /movimientos para ver tu historial.",
-            parse_mode='Markdown'
+            f"Cuenta: {context.user_data['new_movement_cuenta_nombre']}\n\n" +
+            footer,
+            parse_mode='Markdown',
+            view=view
         )
         
-        # Limpiar datos de contexto
-        for key in list(context.user_data.keys()):
-            if key.startswith('new_movement_'):
-                del context.user_data[key]
-        
-        return ConversationHandler.END
+        return end_new_movement(context)
         
     except Exception as e:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+        _remove_download(attachment)
         
-        await update.message.reply_text(
+        await reply(
+            update,
             f"❌ Error al crear movimiento: {str(e)}\n\n"
-            "Usa /nuevo para intentar de nuevo."
+            "Usa /nuevo para intentar de nuevo.",
+            view=view
         )
-        return ConversationHandler.END
+        return end_new_movement(context)
+
+async def new_movement_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Estado TIMEOUT de /nuevo: CONVERSATION_TIMEOUT segundos sin respuesta"""
+    end_new_movement(context)
+    await reply(update, MESSAGES['conversation_timeout'])
 
 @require_login
 async def delete_movement_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -230,7 +396,8 @@ async def delete_movement_command(update: Update, context: ContextTypes.DEFAULT_
     api = session_manager.get_api_client(user_id)
     
     if not context.args or not context.args[0].isdigit():
-        await update.message.reply_text(
+        await reply(
+            update,
             "Uso: /eliminar [ID]\n"
             "Ejemplo: /eliminar 123\n\n"
             "Usa /movimientos para ver los IDs."
@@ -241,25 +408,24 @@ async def delete_movement_command(update: Update, context: ContextTypes.DEFAULT_
     
     try:
         # Verificar que el movimiento existe y pertenece al usuario
-        movement_response = api.get_movement(movement_id)
-        movement = movement_response['data']['movimiento']
+        movement = api.get_movement_detail(movement_id)
         
         # Confirmar eliminación
-        tipo_emoji = '📈' if movement['tipo'] == 'ingreso' else '📉'
-        cantidad = float(movement['cantidad']) if isinstance(movement['cantidad'], str) else movement['cantidad']
+        tipo_emoji = '📈' if movement.tipo == 'ingreso' else '📉'
         
-        await update.message.reply_text(
+        await reply(
+            update,
             f"⚠️ ¿Estás seguro de eliminar este movimiento?\n\n"
             f"{tipo_emoji} ID: {movement_id}\n"
-            f"Cantidad: €{cantidad:.2f}\n"
-            f"Cuenta: {movement.get('cuenta_nombre', 'N/A')}\n\n"
+            f"Cantidad: €{movement.cantidad:.2f}\n"
+            f"Cuenta: {movement.cuenta_nombre or 'N/A'}\n\n"
             "Responde SI para confirmar o NO para cancelar."
         )
         
         context.user_data['delete_movement_id'] = movement_id
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await reply(update, f"❌ Error: {str(e)}")
 
 @require_login
 async def confirm_delete_movement(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -276,26 +442,62 @@ async def confirm_delete_movement(update: Update, context: ContextTypes.DEFAULT_
     if response == 'SI':
         try:
             api.delete_movement(movement_id)
-            await update.message.reply_text(
+            await reply(
+                update,
                 f"✅ Movimiento {movement_id} eliminado correctamente.\n"
                 "El balance se ha actualizado automáticamente gracias a los triggers de la base de datos."
             )
+        except BackendUnavailableError:
+            seq = write_journal.append(user_id, 'delete', {'id': movement_id})
+            await reply(
+                update,
+                f"⏳ Eliminación del movimiento {movement_id} guardada como pendiente (#{seq}).\n"
+                "Se enviará automáticamente cuando el servidor vuelva a estar disponible."
+            )
         except Exception as e:
-            await update.message.reply_text(f"❌ Error: {str(e)}")
+            await reply(update, f"❌ Error: {str(e)}")
     else:
-        await update.message.reply_text("❌ Eliminación cancelada.")
+        await reply(update, "❌ Eliminación cancelada.")
     
-    if 'delete_movement_id' in context.user_data:
-        del context.user_data['delete_movement_id']
+    context.user_data.pop('delete_movement_id', None)
 
 @require_login
 async def edit_movement_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /editar [id] - Editar un movimiento (no implementado aún)"""
-    await update.message.reply_text(
+    await reply(
+        update,
         "⚠️ La función de editar movimientos desde Telegram aún no está implementada.\n\n"
         "Por ahora, usa la aplicación web para editar movimientos.\n\n"
         "Comandos disponibles:\n"
         "/nuevo - Crear movimiento\n"
         "/eliminar [ID] - Eliminar movimiento\n"
         "/movimientos - Ver movimientos"
-    )
\ No newline at end of file
+    )
+
+@require_login
+async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /pendientes - Operaciones guardadas a la espera del servidor"""
+    entries = write_journal.pending(update.effective_user.id)
+    
+    if not entries:
+        await reply(update, "✅ No tienes operaciones pendientes.")
+        return
+    
+    message = f"⏳ *Operaciones pendientes ({len(entries)})*\n\n"
+    for entry in entries:
+        payload = entry['payload']
+        fecha = datetime.fromtimestamp(entry['created_at']).strftime('%d/%m %H:%M')
+        if entry['op'] == 'create':
+            tipo_emoji = '📈' if payload['tipo'] == 'ingreso' else '📉'
+            message += (f"#{entry['seq']} {tipo_emoji} {format_money(str(payload['cantidad']))} - "
+                        f"{payload.get('cuenta_nombre', 'N/A')} ({fecha})")
+            if entry['file_path']:
+                message += " 📎"
+        else:
+            message += f"#{entry['seq']} 🗑 Eliminar movimiento {payload['id']} ({fecha})"
+        if entry['attempts']:
+            message += f" - {entry['attempts']} intento(s)"
+        message += "\n"
+    
+    message += "\nSe enviarán en este orden cuando el servidor vuelva a responder."
+    await reply(update, message, parse_mode='Markdown')
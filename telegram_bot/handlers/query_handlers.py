@@ -1,13 +1,22 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
+from services.api_client import APIClient
+from services.models import Account, Summary, accounts_from_list, movements_from_list
 from services.session_manager import session_manager
+from services.message_queue import reply
+from services.catalog import catalog, tag_names, find_tags
+from services.render_cache import render_cache
 from utils.formatters import (
     format_summary,
     format_accounts_list,
     format_movements_list,
     format_account
 )
-from config import MESSAGES
+from utils.account_index import normalize
+from utils.movement_query import MovementQuery, QueryError, parse_movement_query, MOVEMENTS_HELP
+from config import MESSAGES, ACCOUNT_CACHE_TTL
 
 def require_login(func):
     """Decorador para verificar que el usuario esté logueado"""
@@ -15,13 +24,41 @@ def require_login(func):
         user_id = update.effective_user.id
         
         if not session_manager.is_logged_in(user_id):
-            await update.message.reply_text(MESSAGES['not_logged_in'])
+            await reply(update, MESSAGES['not_logged_in'])
             return
         
         return await func(update, context)
     
     return wrapper
 
+def resolve_accounts(api: APIClient, user_id: int, query: str) -> Tuple[Optional[List[Account]], bool]:
+    """
+    Resuelve una cuenta por número, nombre o prefijo.
+
+    Devuelve (coincidencias, desde_caché). Las coincidencias son None si se
+    pidió un número fuera de rango. Usa el índice de nombres guardado en la
+    sesión y, si no encuentra nada, la búsqueda del backend.
+    """
+    index = session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL)
+    cached = index is not None
+    
+    if query.isdigit():
+        if index is None or index.by_number(int(query)) is None:
+            session_manager.cache_accounts(user_id, api.get_account_list())
+            index = session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL)
+            cached = False
+        
+        account = index.by_number(int(query))
+        return ([account] if account else None), cached
+    
+    matches = index.lookup(query) if index else []
+    if not matches:
+        # Cuentas creadas después de la caché: buscar en el backend
+        matches = api.search_accounts(query)
+        cached = False
+    
+    return matches, cached
+
 @require_login
 async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /balance - Muestra el balance total"""
@@ -29,14 +66,17 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     api = session_manager.get_api_client(user_id)
     
     try:
-        response = api.get_accounts_summary()
-        summary = response['data']['summary']
+        response, version = await asyncio.to_thread(api.get_versioned, '/accounts/summary')
+        key = render_cache.key(user_id, 'balance', (), version)
+        message = render_cache.get(key)
+        if message is None:
+            message = format_summary(Summary.from_dict(response['data']['summary']))
+            render_cache.put(key, message)
         
-        message = format_summary(summary)
-        await update.message.reply_text(message, parse_mode='Markdown')
+        await reply(update, message, parse_mode='Markdown')
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await reply(update, f"❌ Error: {str(e)}")
 
 @require_login
 async def accounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -45,99 +85,235 @@ async def accounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     api = session_manager.get_api_client(user_id)
     
     try:
-        response = api.get_accounts()
-        accounts = response['data']['cuentas']
+        response, version = await asyncio.to_thread(api.get_versioned, '/accounts')
+        key = render_cache.key(user_id, 'cuentas', (), version, catalog.version('etiquetas'))
+        message = render_cache.get(key)
         
-        if not accounts:
-            await update.message.reply_text(
-                "No tienes cuentas registradas.\n"
-                "Crea una desde la aplicación web."
-            )
-            return
+        # Con el mensaje en caché el índice ya se construyó con estas mismas cuentas
+        if message is None or session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL) is None:
+            accounts = accounts_from_list(response['data']['cuentas'])
+            session_manager.cache_accounts(user_id, accounts)
+            
+            if not accounts:
+                await reply(
+                    update,
+                    "No tienes cuentas registradas.\n"
+                    "Crea una desde la aplicación web."
+                )
+                return
+            
+            if message is None:
+                message = format_accounts_list(accounts, tag_names())
+                render_cache.put(key, message)
         
-        message = format_accounts_list(accounts)
-        await update.message.reply_text(message, parse_mode='Markdown')
+        await reply(update, message, parse_mode='Markdown')
         
         # Preguntar si quiere ver detalles de alguna
-        await update.message.reply_text(
+        await reply(
+            update,
             "Para ver detalles de una cuenta, usa:\n"
-            "/cuenta [número]\n\n"
-            "Ejemplo: /cuenta 1"
+            "/cuenta [nombre o número]\n\n"
+            "Ejemplo: /cuenta ahorro"
         )
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await reply(update, f"❌ Error: {str(e)}")
 
 @require_login
 async def account_detail_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Comando /cuenta [id] - Muestra detalles de una cuenta"""
+    """Comando /cuenta [nombre|prefijo|número] - Muestra detalles de una cuenta"""
     user_id = update.effective_user.id
     api = session_manager.get_api_client(user_id)
     
-    # Obtener ID de la cuenta
-    if not context.args or not context.args[0].isdigit():
-        await update.message.reply_text(
-            "Uso: /cuenta [número]\n"
-            "Ejemplo: /cuenta 1\n\n"
+    if not context.args:
+        await reply(
+            update,
+            "Uso: /cuenta [nombre o número]\n"
+            "Ejemplo: /cuenta ahorro o /cuenta 1\n\n"
             "Usa /cuentas para ver la lista."
         )
         return
     
+    query = ' '.join(context.args)
+    
     try:
-        # Primero obtener todas las cuentas para mapear el índice
-        response = api.get_accounts()
-        accounts = response['data']['cuentas']
+        matches, cached = await asyncio.to_thread(resolve_accounts, api, user_id, query)
         
-        index = int(context.args[0]) - 1
+        if matches is None:
+            index = session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL)
+            await reply(
+                update,
+                f"❌ Cuenta no encontrada. Tienes {len(index.accounts)} cuenta(s)."
+            )
+            return
         
-        if index < 0 or index >= len(accounts):
-            await update.message.reply_text(
-                f"❌ Cuenta no encontrada. Tienes {len(accounts)} cuenta(s)."
+        if not matches:
+            await reply(
+                update,
+                f"❌ No hay ninguna cuenta que coincida con \"{query}\".\n"
+                "Usa /cuentas para ver la lista."
             )
             return
         
-        account = accounts[index]
+        if len(matches) > 1:
+            message = f"🔎 Varias cuentas coinciden con \"{query}\":\n\n"
+            for account in matches:
+                message += f"• {account.nombre}\n"
+            message += "\nEscribe un nombre más completo."
+            await reply(update, message)
+            return
         
-        # Obtener detalles completos
-        detail_response = api.get_account(account['id'])
-        account_detail = detail_response['data']['cuenta']
+        # Si la cuenta salió de la caché se piden los datos al día;
+        # si acaba de llegar del backend ya están completos
+        if cached:
+            account_detail = await asyncio.to_thread(api.get_account_detail, matches[0].id)
+        else:
+            account_detail = matches[0]
         
-        message = format_account(account_detail)
-        await update.message.reply_text(message, parse_mode='Markdown')
+        message = format_account(account_detail, tag_names())
+        await reply(update, message, parse_mode='Markdown')
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await reply(update, f"❌ Error: {str(e)}")
 
 @require_login
 async def movements_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Comando /movimientos - Lista últimos movimientos"""
+    """Comando /movimientos [N] [filtros] - Lista últimos movimientos"""
     user_id = update.effective_user.id
     api = session_manager.get_api_client(user_id)
     
-    # Determinar límite
-    limit = 10
-    if context.args and context.args[0].isdigit():
-        limit = min(int(context.args[0]), 50)
+    if context.args and normalize(context.args[0]) in ('ayuda', 'help'):
+        await reply(update, MOVEMENTS_HELP)
+        return
+    
+    try:
+        query = parse_movement_query(context.args or [])
+    except QueryError as e:
+        await reply(update, f"❌ {str(e)}\n\n{MOVEMENTS_HELP}")
+        return
     
     try:
-        response = api.get_movements(limit=limit)
-        movements = response['data']['movimientos']
+        # Los filtros los aplica el backend: solo llegan las filas que se muestran
+        filters = query.filters()
+        terms = list(query.terms)
+        account_ids = None
+        if query.account:
+            account = await _filter_account(update, api, user_id, query.account)
+            if account is None:
+                return
+            filters['id_cuenta'] = account.id
+            account_ids = [account.id]
+            terms.insert(0, account.nombre)
         
-        if not movements:
-            await update.message.reply_text(
-                "No tienes movimientos registrados.\n"
-                "Usa /nuevo para crear uno."
-            )
+        message = None
+        if query.tag:
+            # Se mezclan varias respuestas: este listado no pasa por la caché de mensajes
+            movements, labels = await _movements_by_tag(update, api, user_id, query, filters, account_ids)
+            if movements is None:
+                return
+            terms.insert(0, labels)
+            if movements:
+                message = format_movements_list(movements, ' · '.join(["Últimos movimientos"] + terms))
+        else:
+            params = {'limit': query.limit, **filters}
+            response, version = await asyncio.to_thread(api.get_versioned, '/movements', params)
+            key = render_cache.key(user_id, 'movimientos', (tuple(sorted(params.items())), tuple(terms)), version)
+            message = render_cache.get(key)
+            if message is None and response['data']['movimientos']:
+                movements = movements_from_list(response['data']['movimientos'])
+                title = ' · '.join(["Últimos movimientos"] + terms)
+                total = response['data'].get('total')
+                if total is not None and int(total) > len(movements):
+                    title += f" ({len(movements)} de {total})"
+                message = format_movements_list(movements, title)
+                render_cache.put(key, message)
+        
+        if message is None:
+            if terms:
+                await reply(update, "No hay movimientos que cumplan el filtro.")
+            else:
+                await reply(
+                    update,
+                    "No tienes movimientos registrados.\n"
+                    "Usa /nuevo para crear uno."
+                )
             return
         
-        message = format_movements_list(movements)
-        await update.message.reply_text(message, parse_mode='Markdown')
+        await reply(update, message, parse_mode='Markdown')
         
-        await update.message.reply_text(
+        await reply(
+            update,
             "Para editar o eliminar un movimiento:\n"
             "/editar [ID] - Editar movimiento\n"
-            "/eliminar [ID] - Eliminar movimiento"
+            "/eliminar [ID] - Eliminar movimiento\n\n"
+            "Filtros: /movimientos ayuda"
         )
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
\ No newline at end of file
+        await reply(update, f"❌ Error: {str(e)}")
+
+async def _filter_account(update: Update, api: APIClient, user_id: int, account_query: str) -> Optional[Account]:
+    """Cuenta de `cuenta:`; None si ya se ha respondido con el error"""
+    matches, _ = await asyncio.to_thread(resolve_accounts, api, user_id, account_query)
+    if matches and len(matches) == 1:
+        return matches[0]
+    
+    if matches:
+        await reply(
+            update,
+            f"🔎 Varias cuentas coinciden con \"{account_query}\": " +
+            ', '.join(account.nombre for account in matches) +
+            "\nEscribe un nombre más completo (con _ en lugar de espacios o entre comillas)."
+        )
+    else:
+        await reply(
+            update,
+            f"❌ No hay ninguna cuenta que coincida con \"{account_query}\".\n"
+            "Usa /cuentas para ver la lista."
+        )
+    return None
+
+async def _movements_by_tag(update: Update, api: APIClient, user_id: int, query: MovementQuery,
+                            filters: Dict[str, str], account_ids: Optional[List[int]]) -> Tuple[Optional[List], str]:
+    """
+    Movimientos de las cuentas con una etiqueta.
+
+    La etiqueta se resuelve con el catálogo en memoria y las cuentas con el
+    índice de la sesión; solo se piden al backend los movimientos (una
+    petición por cuenta, a la vez, con el resto de filtros) y se mezclan en
+    el mismo orden que usa el backend. Devuelve (None, _) si ya se ha respondido.
+    """
+    names = tag_names()
+    if not names:
+        await reply(update, "⏳ Las etiquetas aún no están disponibles. Inténtalo en unos segundos.")
+        return None, ''
+    
+    tag_ids = find_tags(query.tag)
+    if not tag_ids:
+        await reply(
+            update,
+            f"❌ No hay ninguna etiqueta \"{query.tag}\".\n"
+            "Etiquetas: " + ', '.join(f"#{name.replace(' ', '_')}" for name in sorted(names.values()))
+        )
+        return None, ''
+    
+    index = session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL)
+    if index is None:
+        session_manager.cache_accounts(user_id, await asyncio.to_thread(api.get_account_list))
+        index = session_manager.get_account_index(user_id, ACCOUNT_CACHE_TTL)
+    
+    labels = ', '.join(f"#{names[tag_id]}" for tag_id in tag_ids)
+    accounts = [account for account in index.accounts
+                if account.id_etiqueta in tag_ids and (account_ids is None or account.id in account_ids)]
+    if not accounts:
+        owner = "La cuenta elegida no tiene" if account_ids else "Ninguna de tus cuentas tiene"
+        await reply(update, f"ℹ️ {owner} la etiqueta {labels}.")
+        return None, ''
+    
+    pages = await asyncio.gather(*(
+        asyncio.to_thread(api.get_movement_list, limit=query.limit, **{**filters, 'id_cuenta': account.id})
+        for account in accounts
+    ))
+    movements = [movement for page in pages for movement in page]
+    movements.sort(key=query.sort_key(), reverse=query.order_dir == 'DESC')
+    return movements[:query.limit], labels
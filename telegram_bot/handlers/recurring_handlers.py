@@ -0,0 +1,130 @@
+import asyncio
+from decimal import Decimal, InvalidOperation
+from telegram import Update
+from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
+from services.message_queue import reply
+from services.recurring import recurring_scheduler, WEEKDAYS
+from services.session_manager import session_manager
+from handlers.query_handlers import require_login, resolve_accounts
+from utils.account_index import normalize
+from utils.formatters import format_money, format_date
+
+USAGE = (
+    "🔁 *Movimientos recurrentes*\n\n"
+    "/recurrente - Ver tus recurrentes\n"
+    "/recurrente mensual <día> <ingreso|gasto> <cantidad> <cuenta> [| notas]\n"
+    "/recurrente semanal <lunes..domingo> <ingreso|gasto> <cantidad> <cuenta> [| notas]\n"
+    "/recurrente borrar <id>\n\n"
+    "Ejemplo: `/recurrente mensual 1 gasto 750 Cuenta común | Alquiler`"
+)
+
+def _parse_day(frecuencia: str, text: str) -> int:
+    """Día del mes (1-31) o día de la semana (0 = lunes)"""
+    if frecuencia == 'semanal':
+        day = normalize(text)
+        if day not in WEEKDAYS:
+            raise ValueError("Día de la semana inválido (lunes..domingo)")
+        return WEEKDAYS.index(day)
+
+    if not (text.isascii() and text.isdigit()) or not 1 <= int(text) <= 31:
+        raise ValueError("El día del mes debe estar entre 1 y 31")
+    return int(text)
+
+@require_login
+async def recurring_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /recurrente - Lista, crea o borra movimientos recurrentes"""
+    user_id = update.effective_user.id
+    args = list(context.args or [])
+
+    if not args:
+        rules = recurring_scheduler.rules_for(user_id)
+        if not rules:
+            await reply(update, "No tienes movimientos recurrentes.\n\n" + USAGE, parse_mode='Markdown')
+            return
+
+        message = "🔁 *Tus movimientos recurrentes*\n\n"
+        for rule in rules:
+            tipo_emoji = '📈' if rule.tipo == 'ingreso' else '📉'
+            if rule.id in recurring_scheduler.paused:
+                status = "⏸ pausado (rechazado por el servidor)"
+            else:
+                status = f"próximo: {format_date(rule.next_date)}"
+            message += (
+                f"`{rule.id}` {tipo_emoji} {format_money(rule.cantidad)} - {escape_markdown(rule.cuenta_nombre)}\n"
+                f"    {rule.describe()}, {status}"
+            )
+            # Notas y nombres los escribe el usuario: un _ o un * romperían el Markdown
+            message += f" - {escape_markdown(rule.notas)}\n" if rule.notas else "\n"
+        await reply(update, message, parse_mode='Markdown')
+        return
+
+    action = normalize(args[0])
+
+    if action == 'borrar':
+        if len(args) != 2 or not (args[1].isascii() and args[1].isdigit()):
+            await reply(update, "❌ Uso: /recurrente borrar <id>")
+            return
+        if recurring_scheduler.delete_rule(user_id, int(args[1])):
+            await reply(update, f"✅ Recurrente {args[1]} eliminado.")
+        else:
+            await reply(update, "❌ No existe ese movimiento recurrente.")
+        return
+
+    if action not in ('mensual', 'semanal') or len(args) < 5:
+        await reply(update, USAGE, parse_mode='Markdown')
+        return
+
+    text = ' '.join(args[4:])
+    account_query, _, notas = text.partition('|')
+    account_query, notas = account_query.strip(), notas.strip() or None
+
+    try:
+        dia = _parse_day(action, args[1])
+
+        tipo_input = normalize(args[2])
+        if tipo_input not in ('ingreso', 'gasto'):
+            raise ValueError("El tipo debe ser ingreso o gasto")
+        tipo = 'ingreso' if tipo_input == 'ingreso' else 'retirada'
+
+        cantidad = Decimal(args[3].replace(',', '.'))
+        if cantidad <= 0:
+            raise ValueError("La cantidad debe ser mayor a 0")
+    except InvalidOperation:
+        await reply(update, "❌ Cantidad inválida. Ejemplo: 750 o 12,99")
+        return
+    except ValueError as e:
+        await reply(update, f"❌ {str(e)}")
+        return
+
+    api = session_manager.get_api_client(user_id)
+    try:
+        matches, _ = await asyncio.to_thread(resolve_accounts, api, user_id, account_query)
+    except Exception as e:
+        await reply(update, f"❌ Error: {str(e)}")
+        return
+
+    if not matches or len(matches) > 1:
+        await reply(
+            update,
+            f"❌ No se pudo identificar la cuenta \"{account_query}\".\n"
+            "Usa /cuentas para ver la lista."
+        )
+        return
+
+    account = matches[0]
+    rule = recurring_scheduler.add_rule(
+        user_id, account.id, account.nombre, tipo, f"{cantidad:.2f}", notas, action, dia
+    )
+
+    tipo_text = 'Ingreso 📈' if tipo == 'ingreso' else 'Gasto 📉'
+    await reply(
+        update,
+        f"✅ Recurrente `{rule.id}` creado\n\n"
+        f"Tipo: {tipo_text}\n"
+        f"Cuenta: {escape_markdown(account.nombre)}\n"
+        f"Cantidad: {format_money(rule.cantidad)}\n"
+        f"Periodicidad: {rule.describe()}\n"
+        f"Próximo: {format_date(rule.next_date)}",
+        parse_mode='Markdown'
+    )
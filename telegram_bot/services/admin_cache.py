@@ -0,0 +1,164 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from services.api_client import APIClient
+from config import ADMIN_STATS_TTL, ADMIN_LOG_PAGE_SIZE, ADMIN_LOG_CACHE_PAGES
+
+# Segundos que una petición espera a otra igual que ya está en curso
+INFLIGHT_WAIT = 30
+
+class LogBrowse:
+    """Una consulta de /admin log: filtros y el último id visto al abrirla"""
+    __slots__ = ('owner', 'filters', 'labels', 'anchor', 'total')
+
+    def __init__(self, owner: int, filters: Dict[str, str], labels: List[str]):
+        self.owner = owner
+        self.filters = filters
+        self.labels = labels
+        self.anchor: Optional[int] = None   # id_hasta de las páginas siguientes
+        self.total = 0
+
+    def key(self) -> Tuple:
+        return tuple(sorted(self.filters.items())), self.anchor
+
+class AdminCache:
+    """
+    Datos de /admin stats y /admin log.
+
+    Las estadísticas generales no dependen de quién las pida: se guarda
+    una copia durante `stats_ttl` segundos. El historial se lee
+    por páginas; la primera fija el último id y las siguientes se piden
+    hasta ese id, de modo que no se desplazan mientras llegan acciones
+    nuevas y se pueden guardar sin caducidad (LRU de `max_pages`). Si la
+    primera sale vacía no hay ancla y no se guarda: se vuelve a pedir. Una
+    página que ya se está pidiendo (la precarga de la siguiente) no se
+    vuelve a pedir: se espera a esa petición.
+    """
+
+    def __init__(self, stats_ttl: float = 60, page_size: int = 10, max_pages: int = 200,
+                 max_browses: int = 256):
+        self.stats_ttl = stats_ttl
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.max_browses = max_browses
+        self._general: Optional[Dict[str, Any]] = None
+        self._general_at = 0.0
+        self._general_lock = threading.Lock()
+        self._browses: 'OrderedDict[str, LogBrowse]' = OrderedDict()
+        self._pages: 'OrderedDict[Tuple, Tuple[List[Dict[str, Any]], int]]' = OrderedDict()
+        self._inflight: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats = {'stats_hits': 0, 'stats_fetches': 0, 'page_hits': 0, 'page_fetches': 0,
+                      'prefetched': 0, 'waited': 0}
+
+    # ============================================
+    # Estadísticas generales
+    # ============================================
+    def general_stats(self, api: APIClient) -> Tuple[Dict[str, Any], float]:
+        """(estadísticas, segundos desde que se pidieron)"""
+        # Con el lock, varias consultas a la vez hacen una sola petición
+        with self._general_lock:
+            age = time.monotonic() - self._general_at
+            if self._general is not None and age < self.stats_ttl:
+                self.stats['stats_hits'] += 1
+                return self._general, age
+            self._general = api.get_admin_stats()['data']['stats']
+            self._general_at = time.monotonic()
+            self.stats['stats_fetches'] += 1
+            return self._general, 0.0
+
+    # ============================================
+    # Historial
+    # ============================================
+    def open(self, owner: int, filters: Dict[str, str], labels: List[str]) -> str:
+        """Registra una consulta y devuelve su id (va en los botones)"""
+        browse_id = secrets.token_hex(4)
+        with self._lock:
+            self._browses[browse_id] = LogBrowse(owner, filters, labels)
+            while len(self._browses) > self.max_browses:
+                self._browses.popitem(last=False)
+        return browse_id
+
+    def browse(self, browse_id: str) -> Optional[LogBrowse]:
+        with self._lock:
+            browse = self._browses.get(browse_id)
+            if browse is not None:
+                self._browses.move_to_end(browse_id)
+            return browse
+
+    def pages(self, browse: LogBrowse) -> int:
+        return max(1, -(-browse.total // self.page_size))
+
+    def page(self, api: APIClient, browse: LogBrowse, number: int) -> List[Dict[str, Any]]:
+        """Acciones de la página `number` (desde 0)"""
+        key = (browse.key(), number)
+        with self._lock:
+            logs = self._cached(browse, key)
+            if logs is not None:
+                return logs
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            # La está pidiendo otro hilo (la precarga): se espera a esa respuesta
+            self.stats['waited'] += 1
+            event.wait(INFLIGHT_WAIT)
+            with self._lock:
+                logs = self._cached(browse, (browse.key(), number))
+            if logs is not None:
+                return logs
+
+        try:
+            params = dict(browse.filters)
+            if browse.anchor is not None:
+                params['id_hasta'] = browse.anchor
+            data = api.get_activity_log(limit=self.page_size, offset=number * self.page_size, **params)['data']
+            logs, total = data['logs'], int(data['total'])
+            self.stats['page_fetches'] += 1
+
+            with self._lock:
+                if browse.anchor is None and logs:
+                    browse.anchor = max(int(log['id']) for log in logs)
+                browse.total = total
+                # Sin ancla (historial vacío) la página puede cambiar: no se guarda
+                if browse.anchor is not None:
+                    self._pages[(browse.key(), number)] = (logs, total)
+                    while len(self._pages) > self.max_pages:
+                        self._pages.popitem(last=False)
+            return logs
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+    def _cached(self, browse: LogBrowse, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        """Página guardada (llamar con el lock)"""
+        cached = self._pages.get(key)
+        if cached is None:
+            return None
+        self._pages.move_to_end(key)
+        self.stats['page_hits'] += 1
+        browse.total = cached[1]
+        return cached[0]
+
+    def prefetch(self, api: APIClient, browse: LogBrowse, number: int):
+        """Pide una página en segundo plano para que el botón responda al instante"""
+        if number >= self.pages(browse):
+            return
+        with self._lock:
+            if (browse.key(), number) in self._pages:
+                return
+        try:
+            self.page(api, browse, number)
+            self.stats['prefetched'] += 1
+        except Exception:
+            # Si falla, el botón la volverá a pedir
+            pass
+
+# Instancia global de los datos de administración
+admin_cache = AdminCache(ADMIN_STATS_TTL, ADMIN_LOG_PAGE_SIZE, ADMIN_LOG_CACHE_PAGES)
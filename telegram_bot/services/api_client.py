@@ -1,17 +1,83 @@
 import requests
+from urllib3.exceptions import NewConnectionError
 import base64
-from typing import Optional, Dict, Any
-from config import API_URL
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Dict, Any, List, Tuple
+from services import tracing
+from services.recorder import recorder
+from services.load_balancer import backend_pool
+from services.models import (
+    Account,
+    Movement,
+    Summary,
+    Stats,
+    decode_json,
+    accounts_from_list,
+    movements_from_list
+)
+
+class SessionExpiredError(Exception):
+    """El backend ha rechazado el token (401)"""
+    pass
+
+class BackendUnavailableError(Exception):
+    """El backend no responde o falla con un 5xx (caída de PHP o MySQL)"""
+    pass
+
+class NotFoundError(Exception):
+    """El recurso no existe (404)"""
+    pass
+
+class PreconditionFailedError(Exception):
+    """El backend no tiene lo que la petición daba por hecho (412), p. ej. un adjunto por hash"""
+    pass
+
+class RejectedError(Exception):
+    """El backend ha rechazado la petición con otro 4xx (validación, permisos, 409...)"""
+    
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _not_sent(error: requests.exceptions.RequestException) -> bool:
+    """El fallo fue al conectar: la petición no llegó a la réplica"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def _digest(content: bytes) -> str:
+    """Huella del cuerpo de una respuesta"""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
 
 class APIClient:
     """Cliente para interactuar con la API REST"""
     
+    # Máximo de respuestas GET guardadas para peticiones condicionales
+    MAX_CONDITIONAL_ENTRIES = 64
+    
     def __init__(self, token: Optional[str] = None):
-        self.base_url = API_URL
         self.token = token
-        self.headers = {}
+        # El backend ha respondido 401 con este token (la sesión se descarta tras el update)
+        self.expired = False
+        self.headers = {'Accept-Encoding': 'gzip, deflate'}
         if token:
             self.headers['Authorization'] = f'Bearer {token}'
+        
+        # (endpoint, params) -> {'etag', 'last_modified', 'body', 'decoded'}
+        self._conditional: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+        # Los comandos pueden lanzar varias peticiones a la vez desde hilos distintos
+        self._lock = threading.Lock()
+        
+        # (fecha_desde, fecha_hasta) -> Stats de periodos ya cerrados
+        self._closed_stats: Dict[Tuple[str, str], Stats] = {}
+        # Sube con cada escritura de este cliente (parte de la versión de los mensajes cacheados)
+        self.write_version = 0
+        self.stats = {'not_modified': 0, 'full_responses': 0}
     
     def set_token(self, token: str):
         """Establece el token de autenticación"""
@@ -23,33 +89,189 @@ class APIClient:
         self.token = None
         if 'Authorization' in self.headers:
             del self.headers['Authorization']
+        self._conditional.clear()
+        self._closed_stats.clear()
+    
+    @staticmethod
+    def _conditional_key(endpoint: str, params: Optional[Dict[str, Any]]) -> Tuple:
+        """Clave de la caché condicional: endpoint + parámetros ordenados"""
+        return (endpoint, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
     
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """Realiza una petición HTTP"""
-        url = f"{self.base_url}{endpoint}"
+        """Realiza una petición HTTP y decodifica la respuesta JSON"""
+        content = self._request_raw(method, endpoint, **kwargs)
+        
+        if method != 'GET':
+            # Cualquier escritura puede cambiar periodos pasados (fechas editadas, importaciones)
+            self._closed_stats.clear()
+            self.write_version += 1
+            return decode_json(content)
+        
+        # En un 304 se reutiliza también el JSON ya decodificado
+        entry = self._stored_entry(endpoint, kwargs.get('params'), content)
+        if entry is not None:
+            if entry['decoded'] is None:
+                entry['decoded'] = decode_json(content)
+            return entry['decoded']
         
+        return decode_json(content)
+    
+    def get_versioned(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Tuple[int, str]]:
+        """
+        GET decodificado junto con la versión de los datos.
+        
+        La versión es (escrituras de este cliente, huella del cuerpo): no
+        cambia mientras el backend responda 304 o devuelva el mismo contenido.
+        """
+        version = self.write_version
+        content = self._request_raw('GET', endpoint, params=params)
+        entry = self._stored_entry(endpoint, params, content)
+        if entry is None:
+            return decode_json(content), (version, _digest(content))
+        
+        if entry['decoded'] is None:
+            entry['decoded'] = decode_json(content)
+        if entry['digest'] is None:
+            entry['digest'] = _digest(content)
+        return entry['decoded'], (version, entry['digest'])
+    
+    def _stored_entry(self, endpoint: str, params: Optional[Dict[str, Any]], content: bytes) -> Optional[Dict[str, Any]]:
+        """Entrada de la caché condicional si `content` es su cuerpo (respuesta 200 guardada o 304)"""
+        with self._lock:
+            entry = self._conditional.get(self._conditional_key(endpoint, params))
+        return entry if entry is not None and entry['body'] is content else None
+    
+    def _request_raw(self, method: str, endpoint: str, **kwargs) -> bytes:
+        """Realiza una petición HTTP y devuelve el cuerpo sin decodificar"""
         # Asegurar que los headers se incluyan
         if 'headers' not in kwargs:
             kwargs['headers'] = {}
         kwargs['headers'].update(self.headers)
         
+        # Peticiones condicionales: enviar los validadores de la última respuesta
+        entry = None
+        if method == 'GET':
+            key = self._conditional_key(endpoint, kwargs.get('params'))
+            with self._lock:
+                entry = self._conditional.get(key)
+            if entry:
+                if entry['etag']:
+                    kwargs['headers']['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    kwargs['headers']['If-Modified-Since'] = entry['last_modified']
+        
+        kwargs.setdefault('timeout', 30)
+        
+        # Correlación con los logs del backend
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            kwargs['headers']['X-Trace-Id'] = trace_id
+        
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                timeout=30,
-                **kwargs
-            )
+            response = self._send(method, endpoint, kwargs)
             
             if response.status_code == 401:
-                raise Exception("Sesión expirada o inválida")
+                self.expired = True
+                raise SessionExpiredError("Sesión expirada o inválida")
+            
+            if response.status_code == 404:
+                raise NotFoundError("No encontrado")
+            
+            if response.status_code == 412:
+                raise PreconditionFailedError(self._error_message(response, 'Precondición fallida'))
+            
+            if response.status_code >= 500:
+                raise BackendUnavailableError(f"Servidor no disponible ({response.status_code})")
+            
+            if response.status_code == 304 and entry:
+                with self._lock:
+                    if key in self._conditional:
+                        self._conditional.move_to_end(key)
+                self.stats['not_modified'] += 1
+                return entry['body']
             
             response.raise_for_status()
-            return response.json()
+            
+            if method == 'GET':
+                self.stats['full_responses'] += 1
+                self._store_conditional(key, response)
+            
+            return response.content
         
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise BackendUnavailableError(f"Error de conexión: {str(e)}")
+        except requests.exceptions.HTTPError as e:
+            raise RejectedError(e.response.status_code, f"Error de conexión: {str(e)}")
         except requests.exceptions.RequestException as e:
             raise Exception(f"Error de conexión: {str(e)}")
     
+    @staticmethod
+    def _error_message(response: requests.Response, default: str) -> str:
+        """Mensaje de un error JSON del backend; un proxy puede responder HTML o nada"""
+        try:
+            body = decode_json(response.content)
+        except ValueError:
+            return default
+        message = body.get('message') if isinstance(body, dict) else None
+        return message or default
+    
+    def _send(self, method: str, endpoint: str, kwargs: Dict[str, Any]) -> requests.Response:
+        """Envía la petición a una réplica; un GET que falla se reintenta en otra"""
+        tried = []
+        while True:
+            replica = backend_pool.pick(exclude=tried)
+            tried.append(replica)
+            can_retry = backend_pool.can_retry(tried)
+            
+            with tracing.span('api', method=method, endpoint=endpoint, replica=replica.url) as span, \
+                    backend_pool.track(replica) as call:
+                try:
+                    response = requests.request(
+                        method=method,
+                        url=f"{replica.url}{endpoint}",
+                        **kwargs
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    call.fail()
+                    # Una escritura solo se repite si no llegó a salir
+                    if not can_retry or (method != 'GET' and not _not_sent(e)):
+                        raise
+                    backend_pool.stats['retries'] += 1
+                    continue
+                span.set(http_status=response.status_code, bytes=len(response.content))
+                recorder.api(method, endpoint, response.status_code,
+                             response.elapsed.total_seconds(), len(response.content))
+                if response.status_code >= 500:
+                    call.fail()
+                    if can_retry and method == 'GET':
+                        backend_pool.stats['retries'] += 1
+                        continue
+            
+            return response
+    
+    def _store_conditional(self, key: Tuple, response: requests.Response):
+        """Guarda el cuerpo y los validadores de una respuesta GET"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        
+        if not etag and not last_modified:
+            with self._lock:
+                self._conditional.pop(key, None)
+            return
+        
+        with self._lock:
+            self._conditional[key] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'body': response.content,
+                'decoded': None,
+                'digest': None
+            }
+            self._conditional.move_to_end(key)
+            
+            while len(self._conditional) > self.MAX_CONDITIONAL_ENTRIES:
+                self._conditional.popitem(last=False)
+    
     def _encode_file_base64(self, file_path: str) -> Dict[str, str]:
         """Codifica un archivo a Base64"""
         with open(file_path, 'rb') as f:
@@ -64,6 +286,14 @@ class APIClient:
                 'data': base64_data
             }
     
+    def health(self) -> bool:
+        """Comprueba si el backend (y su base de datos) responde"""
+        try:
+            self._request_raw('GET', '/health', timeout=5)
+            return True
+        except Exception:
+            return False
+    
     # AUTH
     def login(self, username: str, password: str) -> Dict[str, Any]:
         """Inicia sesión"""
@@ -86,6 +316,10 @@ class APIClient:
         headers = {'Content-Type': 'application/json'}
         return self._request('POST', '/auth/logout', headers=headers)
     
+    def validate_session(self) -> Dict[str, Any]:
+        """Valida (y renueva) el token actual"""
+        return self._request('GET', '/auth/validate')
+    
     # USER
     def get_profile(self) -> Dict[str, Any]:
         """Obtiene perfil del usuario"""
@@ -104,6 +338,23 @@ class APIClient:
         """Obtiene resumen de cuentas"""
         return self._request('GET', '/accounts/summary')
     
+    def get_account_list(self) -> List[Account]:
+        """Obtiene lista de cuentas como objetos Account"""
+        return accounts_from_list(self.get_accounts()['data']['cuentas'])
+    
+    def get_account_detail(self, account_id: int) -> Account:
+        """Obtiene una cuenta específica como Account"""
+        return Account.from_dict(self.get_account(account_id)['data']['cuenta'])
+    
+    def search_accounts(self, query: str) -> List[Account]:
+        """Busca cuentas por nombre o descripción"""
+        response = self._request('GET', '/accounts/search', params={'q': query})
+        return accounts_from_list(response['data']['cuentas'])
+    
+    def get_summary(self) -> Summary:
+        """Obtiene resumen de cuentas como Summary"""
+        return Summary.from_dict(self.get_accounts_summary()['data']['summary'])
+    
     # MOVEMENTS
     def get_movements(self, limit: int = 10, **filters) -> Dict[str, Any]:
         """Obtiene lista de movimientos"""
@@ -114,18 +365,39 @@ class APIClient:
         """Obtiene un movimiento específico"""
         return self._request('GET', f'/movements/{movement_id}')
     
-    def create_movement(self, data: Dict[str, Any], file_path: Optional[str] = None) -> Dict[str, Any]:
-        """Crea un nuevo movimiento"""
+    def get_movement_list(self, limit: int = 10, **filters) -> List[Movement]:
+        """Obtiene lista de movimientos como objetos Movement"""
+        return movements_from_list(self.get_movements(limit=limit, **filters)['data']['movimientos'])
+    
+    def get_movement_detail(self, movement_id: int) -> Movement:
+        """Obtiene un movimiento específico como Movement"""
+        return Movement.from_dict(self.get_movement(movement_id)['data']['movimiento'])
+    
+    def create_movement(self, data: Dict[str, Any], file_path: Optional[str] = None,
+                        idempotency_key: Optional[str] = None,
+                        attachment_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Crea un nuevo movimiento (la misma idempotency_key no lo duplica al reintentar).
+        
+        Con attachment_hash (SHA-256) y sin archivo se reutiliza un adjunto que el
+        backend ya tiene; si no lo tiene lanza PreconditionFailedError.
+        """
+        if attachment_hash and not file_path:
+            data = {**data, 'adjunto_hash': attachment_hash}
         if file_path:
             # Si hay archivo, usar multipart/form-data
             with open(file_path, 'rb') as f:
                 files = {'adjunto': (file_path.split('/')[-1], f)}
                 # Enviar como form-data sin Content-Type en headers (requests lo establece automáticamente)
                 headers = {k: v for k, v in self.headers.items() if k != 'Content-Type'}
+                if idempotency_key:
+                    headers['Idempotency-Key'] = idempotency_key
                 return self._request('POST', '/movements', data=data, files=files, headers=headers)
         else:
             # Sin archivo, enviar como form-data también
             headers = {k: v for k, v in self.headers.items()}
+            if idempotency_key:
+                headers['Idempotency-Key'] = idempotency_key
             return self._request('POST', '/movements', data=data, headers=headers)
     
     def update_movement(self, movement_id: int, data: Dict[str, Any], 
@@ -146,11 +418,57 @@ class APIClient:
         """Elimina un movimiento"""
         return self._request('DELETE', f'/movements/{movement_id}')
     
+    def import_movements(self, movements: List[Dict[str, Any]],
+                         idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Crea varios movimientos en una sola petición (/movements/import; la misma idempotency_key no repite el lote)"""
+        content = json.dumps(movements).encode('utf-8')
+        files = {'file': ('movimientos.json', content, 'application/json')}
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+        return self._request('POST', '/movements/import', files=files, headers=headers)
+    
+    def export_movements(self, include_attachments: bool = False, **filters) -> Dict[str, Any]:
+        """Copia de seguridad en JSON (/movements/export/json); sin adjuntos salvo que se pidan"""
+        params = dict(filters)
+        if not include_attachments:
+            params['adjuntos'] = '0'
+        return self._request('GET', '/movements/export/json', params=params)
+    
     def get_movements_stats(self, **filters) -> Dict[str, Any]:
         """Obtiene estadísticas de movimientos"""
         return self._request('GET', '/movements/stats', params=filters)
     
+    def get_period_stats(self, fecha_desde: str, fecha_hasta: str) -> Stats:
+        """
+        Estadísticas entre dos fechas (YYYY-MM-DD, ambas incluidas).
+        
+        Los periodos que terminaron antes de hoy solo cambian si se edita un
+        movimiento, así que se guardan hasta la próxima escritura de este cliente.
+        """
+        key = (fecha_desde, fecha_hasta)
+        cached = self._closed_stats.get(key)
+        if cached is not None:
+            return cached
+        
+        response = self.get_movements_stats(
+            fecha_desde=f"{fecha_desde} 00:00:00",
+            fecha_hasta=f"{fecha_hasta} 23:59:59"
+        )
+        stats = Stats.from_dict(response['data']['stats'])
+        
+        if fecha_hasta < date.today().isoformat():
+            self._closed_stats[key] = stats
+        return stats
+    
     # TAGS
     def get_tags(self) -> Dict[str, Any]:
         """Obtiene lista de etiquetas"""
-        return self._request('GET', '/tags')
\ No newline at end of file
+        return self._request('GET', '/tags')
+    
+    # ADMIN
+    def get_admin_stats(self) -> Dict[str, Any]:
+        """Estadísticas generales (solo propietario)"""
+        return self._request('GET', '/admin/stats')
+    
+    def get_activity_log(self, limit: int = 100, offset: int = 0, **filters) -> Dict[str, Any]:
+        """Historial de acciones, más recientes primero (solo propietario)"""
+        return self._request('GET', '/admin/activity-log', params={'limit': limit, 'offset': offset, **filters})
@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+from config import PERSISTENCE_PATH, ATTACHMENT_INDEX_MAX
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    user_id INTEGER NOT NULL,
+    file_unique_id TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (user_id, file_unique_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attachments_last_used ON attachments (last_used);
+CREATE TABLE IF NOT EXISTS attachment_uploads (
+    user_id INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (user_id, sha256)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attachment_uploads_last_used ON attachment_uploads (last_used);
+"""
+
+def file_digest(path: str) -> Tuple[str, int]:
+    """SHA-256 (hex) y tamaño de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+class AttachmentRegistry:
+    """
+    Registro de adjuntos ya vistos por usuario.
+
+    Telegram da a cada archivo un `file_unique_id` estable (el mismo al
+    reenviar la foto), así que tras la primera descarga se sabe su SHA-256
+    sin volver a bajarlo. Los hashes que el backend ya tiene guardados se
+    envían solos (`adjunto_hash`) en lugar del archivo; si el backend ya no
+    lo tiene responde 412 y se sube completo. Las dos tablas se recortan a
+    las `max_entries` filas usadas más recientemente.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, prune_every: int = 500):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'lookups': 0, 'unique_hits': 0, 'content_hits': 0, 'reused': 0,
+                      'stale': 0, 'uploads': 0, 'bytes_saved': 0}
+
+    def open(self):
+        if self.conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    # ============================================
+    # file_unique_id -> contenido
+    # ============================================
+    def lookup(self, user_id: int, unique_id: str) -> Optional[str]:
+        """SHA-256 de un archivo de Telegram ya descargado, o None"""
+        self.open()
+        self.stats['lookups'] += 1
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT sha256 FROM attachments WHERE user_id = ? AND file_unique_id = ?',
+                (user_id, unique_id)
+            ).fetchone()
+            if row is None:
+                return None
+            self.stats['unique_hits'] += 1
+            with self.conn:
+                self.conn.execute(
+                    'UPDATE attachments SET last_used = ? WHERE user_id = ? AND file_unique_id = ?',
+                    (time.time(), user_id, unique_id)
+                )
+        return row[0]
+
+    def record(self, user_id: int, unique_id: str, sha256: str, size: int):
+        """Guarda el hash de un archivo recién descargado"""
+        self.open()
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO attachments (user_id, file_unique_id, sha256, size, last_used) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (user_id, unique_id, sha256, size, time.time())
+                )
+            self._maybe_prune()
+
+    # ============================================
+    # Contenido ya subido al backend
+    # ============================================
+    def uploaded(self, user_id: int, sha256: str) -> bool:
+        self.open()
+        with self._lock:
+            return self.conn.execute(
+                'SELECT 1 FROM attachment_uploads WHERE user_id = ? AND sha256 = ?', (user_id, sha256)
+            ).fetchone() is not None
+
+    def mark_uploaded(self, user_id: int, sha256: str):
+        self.open()
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO attachment_uploads (user_id, sha256, last_used) VALUES (?, ?, ?)',
+                    (user_id, sha256, time.time())
+                )
+            self._maybe_prune()
+
+    def forget_upload(self, user_id: int, sha256: str):
+        """El backend ya no tiene el archivo (412): la próxima vez se sube"""
+        self.open()
+        self.stats['stale'] += 1
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    'DELETE FROM attachment_uploads WHERE user_id = ? AND sha256 = ?', (user_id, sha256)
+                )
+
+    def _maybe_prune(self):
+        """Recorta las tablas a las max_entries filas más recientes (llamar con el lock)"""
+        self._writes += 1
+        if self._writes % self.prune_every:
+            return
+        with self.conn:
+            for table in ('attachments', 'attachment_uploads'):
+                self.conn.execute(
+                    f'DELETE FROM {table} WHERE last_used < ('
+                    f'SELECT last_used FROM {table} ORDER BY last_used DESC LIMIT 1 OFFSET ?)',
+                    (self.max_entries - 1,)
+                )
+
+    def size(self) -> Tuple[int, int]:
+        """(archivos conocidos, contenidos subidos)"""
+        self.open()
+        with self._lock:
+            return (self.conn.execute('SELECT COUNT(*) FROM attachments').fetchone()[0],
+                    self.conn.execute('SELECT COUNT(*) FROM attachment_uploads').fetchone()[0])
+
+    def hit_rate(self) -> float:
+        """Fracción de adjuntos que no se han tenido que descargar o subir de nuevo"""
+        total = self.stats['reused'] + self.stats['uploads']
+        return self.stats['reused'] / total if total else 0.0
+
+# Instancia global del registro de adjuntos
+attachment_registry = AttachmentRegistry(PERSISTENCE_PATH, max_entries=ATTACHMENT_INDEX_MAX)
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from telegram.ext import ContextTypes
+from services.api_client import APIClient
+from utils.account_index import normalize
+from config import CATALOG_TTL
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ('value', 'fetched_at', 'version', 'refreshing')
+
+    def __init__(self):
+        self.value: Any = None
+        self.fetched_at = 0.0
+        self.version = 0            # sube cada vez que cambia el contenido
+        self.refreshing = False
+
+class CatalogCache:
+    """
+    Datos de referencia globales (etiquetas...) compartidos por todo el proceso.
+
+    No dependen del usuario, así que hay una sola copia para todos. get()
+    nunca espera a la red: devuelve lo que haya y, si tiene más de `ttl`
+    segundos, lanza la recarga en un hilo aparte (stale-while-revalidate).
+    Además el job los recarga antes de que caduquen, de modo que un comando
+    solo ve un catálogo vacío justo después de arrancar con el backend
+    caído. Las recargas son GET condicionales: si no ha cambiado nada, el
+    backend contesta 304.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.api = APIClient()      # endpoints públicos, sin token
+        self._loaders: Dict[str, Callable[[APIClient], Any]] = {}
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'changes': 0, 'errors': 0}
+
+    def register(self, name: str, loader: Callable[[APIClient], Any]):
+        self._loaders[name] = loader
+        self._entries[name] = _Entry()
+
+    def get(self, name: str) -> Optional[Any]:
+        """Valor actual del catálogo (None si aún no se ha cargado nunca)"""
+        entry = self._entries[name]
+        age = time.monotonic() - entry.fetched_at
+        if entry.value is None:
+            self.stats['misses'] += 1
+        elif age > self.ttl:
+            self.stats['stale'] += 1
+        else:
+            self.stats['hits'] += 1
+            return entry.value
+
+        self._revalidate(name)
+        return entry.value
+
+    def version(self, name: str) -> int:
+        return self._entries[name].version
+
+    def _revalidate(self, name: str):
+        """Recarga en segundo plano si no hay ya una en curso"""
+        entry = self._entries[name]
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        threading.Thread(target=self._refresh, args=(name,), daemon=True,
+                         name=f"catalog-{name}").start()
+
+    def refresh(self, name: str) -> bool:
+        """Recarga un catálogo ahora (bloqueante); False si el backend falla"""
+        entry = self._entries[name]
+        with self._lock:
+            if entry.refreshing:
+                return entry.value is not None
+            entry.refreshing = True
+        return self._refresh(name)
+
+    def _refresh(self, name: str) -> bool:
+        entry = self._entries[name]
+        try:
+            value = self._loaders[name](self.api)
+            self.stats['refreshes'] += 1
+            if value != entry.value:
+                entry.value = value
+                entry.version += 1
+                self.stats['changes'] += 1
+            entry.fetched_at = time.monotonic()
+            return True
+        except Exception as e:
+            # Se sigue sirviendo el valor anterior
+            self.stats['errors'] += 1
+            logger.warning(f"No se pudo recargar el catálogo {name}: {e}")
+            return False
+        finally:
+            entry.refreshing = False
+
+    def refresh_all(self):
+        for name in self._loaders:
+            self.refresh(name)
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: recarga a mitad de vida para que get() no los vea caducados"""
+        now = time.monotonic()
+        for name, entry in self._entries.items():
+            if entry.value is None or now - entry.fetched_at >= self.ttl / 2:
+                self._revalidate(name)
+
+# ============================================
+# Etiquetas
+# ============================================
+def _load_tags(api: APIClient) -> Dict[int, str]:
+    return {int(tag['id']): tag['nombre'] for tag in api.get_tags()['data']['etiquetas']}
+
+# Instancia global del catálogo
+catalog = CatalogCache(CATALOG_TTL)
+catalog.register('etiquetas', _load_tags)
+
+def tag_names() -> Dict[int, str]:
+    """id -> nombre de todas las etiquetas ({} si aún no se han cargado)"""
+    return catalog.get('etiquetas') or {}
+
+def find_tags(query: str) -> List[int]:
+    """Etiquetas por nombre exacto o, si no hay, por prefijo (sin tildes; '_' es espacio)"""
+    key = normalize(query.replace('_', ' '))
+    if not key:
+        return []
+    names = {tag_id: normalize(name) for tag_id, name in tag_names().items()}
+    exact = [tag_id for tag_id, name in names.items() if name == key]
+    if exact:
+        return exact
+    return [tag_id for tag_id, name in names.items()
+            if name.startswith(key) or any(word.startswith(key) for word in name.split(' '))]
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+from config import CHART_WORKERS
+
+logger = logging.getLogger(__name__)
+
+def render_chart(spec: Dict[str, Any]) -> bytes:
+    """
+    Dibuja el gráfico descrito por `spec` y devuelve el PNG.
+
+    Se ejecuta en un proceso del pool, por eso recibe y devuelve solo datos
+    serializables y hace el import de matplotlib aquí dentro (backend Agg,
+    sin pantalla ni GPU).
+    """
+    import io
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    labels = spec['labels']
+    has_balances = bool(spec.get('balances'))
+    fig, axes = plt.subplots(2 if has_balances else 1, 1,
+                             figsize=(8, 7 if has_balances else 4), dpi=100)
+    if not has_balances:
+        axes = [axes]
+
+    # Ingresos frente a gastos por periodo
+    ax = axes[0]
+    positions = range(len(labels))
+    width = 0.4
+    ax.bar([p - width / 2 for p in positions], spec['ingresos'], width, label='Ingresos', color='#16A34A')
+    ax.bar([p + width / 2 for p in positions], spec['gastos'], width, label='Gastos', color='#DC2626')
+    ax.set_title(spec['title'])
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels(labels, rotation=45, ha='right', fontsize=8)
+    ax.set_ylabel(spec.get('currency', 'EUR'))
+    ax.legend()
+    ax.grid(axis='y', alpha=0.3)
+
+    # Balance por cuenta
+    if has_balances:
+        ax = axes[1]
+        names = [b[0] for b in spec['balances']]
+        values = [b[1] for b in spec['balances']]
+        colors = ['#16A34A' if v >= 0 else '#DC2626' for v in values]
+        ax.barh(names, values, color=colors)
+        ax.set_title('Balance por cuenta')
+        ax.grid(axis='x', alpha=0.3)
+
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+class ChartService:
+    """
+    Renderiza gráficos en un pool de procesos y recuerda el file_id de
+    Telegram de cada imagen ya enviada, indexado por un hash de los datos y
+    parámetros. Si los datos no han cambiado se reenvía el file_id sin volver
+    a dibujar ni a subir la imagen.
+    """
+
+    def __init__(self, workers: int = 2, max_cached: int = 1000):
+        self.workers = workers
+        self.max_cached = max_cached
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._file_ids: 'OrderedDict[str, str]' = OrderedDict()
+        self.stats = {'rendered': 0, 'cache_hits': 0}
+
+    @staticmethod
+    def spec_hash(spec: Dict[str, Any]) -> str:
+        """Hash estable de los datos y parámetros de un gráfico"""
+        encoded = json.dumps(spec, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        file_id = self._file_ids.get(key)
+        if file_id:
+            self._file_ids.move_to_end(key)
+            self.stats['cache_hits'] += 1
+        return file_id
+
+    def remember(self, key: str, file_id: str):
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_cached:
+            self._file_ids.popitem(last=False)
+
+    def forget(self, key: str):
+        self._file_ids.pop(key, None)
+
+    async def render(self, spec: Dict[str, Any]) -> bytes:
+        """Renderiza en el pool sin bloquear el bucle de eventos"""
+        if self._executor is None:
+            # spawn: los procesos no heredan hilos ni sockets del bot
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        self.stats['rendered'] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, render_chart, spec)
+        except BrokenProcessPool:
+            # Un proceso murió: el pool no se puede reutilizar, se crea otro la próxima vez
+            logger.error("El pool de gráficos se ha roto, se recreará")
+            self._executor = None
+            raise
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Instancia global del servicio de gráficos
+chart_service = ChartService(workers=CHART_WORKERS)
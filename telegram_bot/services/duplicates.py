@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set
+from telegram.ext import ContextTypes
+from services.api_client import APIClient
+from services.session_manager import session_manager
+from utils.account_index import normalize
+from config import (
+    PERSISTENCE_PATH,
+    DUPLICATE_WINDOW_DAYS,
+    DUPLICATE_INDEX_TTL,
+    DUPLICATE_MAX_USERS
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    user_id INTEGER NOT NULL,
+    digest INTEGER NOT NULL,
+    PRIMARY KEY (user_id, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fingerprint_builds (
+    user_id INTEGER PRIMARY KEY,
+    built_at REAL NOT NULL
+);
+"""
+
+def fingerprint(id_cuenta: int, tipo: str, cantidad: Any, fecha: str, notas: Optional[str]) -> int:
+    """
+    Huella de un movimiento: cuenta, tipo, céntimos, día y notas normalizadas.
+
+    Entero de 64 bits con signo (cabe en un INTEGER de SQLite).
+    """
+    cents = int((Decimal(str(cantidad)) * 100).to_integral_value())
+    key = f"{int(id_cuenta)}|{tipo}|{cents}|{fecha[:10]}|{normalize(notas or '')}"
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def fingerprint_item(item: Dict[str, Any]) -> int:
+    return fingerprint(item['id_cuenta'], item['tipo'], item['cantidad'],
+                       item['fecha_movimiento'], item.get('notas'))
+
+class BloomFilter:
+    """Filtro de Bloom sobre huellas de 64 bits (doble hash con sus dos mitades)"""
+    __slots__ = ('bits', 'size', 'hashes', 'capacity', 'count')
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 64)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def _positions(self, digest: int):
+        digest &= 0xFFFFFFFFFFFFFFFF
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, digest: int):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: int) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+class DuplicateIndex:
+    """
+    Índice de huellas de movimientos por usuario para avisar de duplicados.
+
+    Cada consulta pasa primero por un filtro de Bloom en memoria (1 % de
+    falsos positivos, ~2,4 bytes por movimiento con margen para crecer): si dice que no, no se toca
+    nada más. Si dice que sí, se confirma en SQLite por clave primaria. Las
+    huellas salen de la exportación JSON del backend (sin adjuntos) de los
+    últimos `window_days` días y se reconstruyen cada `ttl` segundos, porque
+    los movimientos creados desde la web no pasan por el bot; los creados
+    desde el bot se añaden al momento.
+
+    La reconstrucción descarga un año de movimientos: se hace en segundo
+    plano (tras el login y en el job `run`), nunca al registrar uno.
+    """
+
+    def __init__(self, path: str, window_days: int = 365, ttl: float = 86400,
+                 max_users: int = 10000, error_rate: float = 0.01):
+        self.path = path
+        self.window_days = window_days
+        self.ttl = ttl
+        self.max_users = max_users
+        self.error_rate = error_rate
+        self.conn: Optional[sqlite3.Connection] = None
+        self._filters: 'OrderedDict[int, BloomFilter]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Usuarios con una reconstrucción en marcha (login y job a la vez)
+        self._refreshing: Set[int] = set()
+        self.stats = {'lookups': 0, 'filtered': 0, 'confirmed': 0,
+                      'false_positives': 0, 'rebuilds': 0, 'rebuild_errors': 0}
+
+    def open(self):
+        if self.conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    # ============================================
+    # Construcción
+    # ============================================
+    def built_at(self, user_id: int) -> Optional[float]:
+        self.open()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT built_at FROM fingerprint_builds WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def ensure(self, api: APIClient, user_id: int):
+        """Reconstruye el índice del usuario si no existe o ha caducado"""
+        built_at = self.built_at(user_id)
+        if built_at is None or time.time() - built_at > self.ttl:
+            self.rebuild(api, user_id)
+
+    async def refresh(self, api: APIClient, user_id: int):
+        """ensure() en un hilo; un fallo solo deja el índice como estaba"""
+        if user_id in self._refreshing:
+            return
+        self._refreshing.add(user_id)
+        try:
+            await asyncio.to_thread(self.ensure, api, user_id)
+        except Exception as e:
+            self.stats['rebuild_errors'] += 1
+            logger.warning(f"No se pudo reconstruir el índice de duplicados de {user_id}: {e}")
+        finally:
+            self._refreshing.discard(user_id)
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: reconstruye los índices caducados de las sesiones abiertas"""
+        for user_id, session in list(session_manager.sessions.items()):
+            await self.refresh(session['api_client'], user_id)
+
+    def rebuild(self, api: APIClient, user_id: int):
+        """Vuelve a calcular las huellas desde la exportación del backend"""
+        self.open()
+        since = date.today() - timedelta(days=self.window_days)
+        backup = api.export_movements(fecha_desde=f"{since.isoformat()} 00:00:00")
+        # La exportación identifica la cuenta por nombre
+        account_ids = {account.nombre: account.id for account in api.get_account_list()}
+
+        digests = set()
+        for item in backup.get('movimientos') or []:
+            id_cuenta = account_ids.get(item.get('cuenta_nombre'))
+            if id_cuenta is None:
+                continue
+            digests.add(fingerprint(id_cuenta, item['tipo'], item['cantidad'],
+                                    item['fecha_movimiento'], item.get('notas')))
+
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM fingerprints WHERE user_id = ?', (user_id,))
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO fingerprints (user_id, digest) VALUES (?, ?)',
+                    ((user_id, digest) for digest in digests)
+                )
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO fingerprint_builds (user_id, built_at) VALUES (?, ?)',
+                    (user_id, time.time())
+                )
+            self._store_filter(user_id, self._new_filter(digests))
+        self.stats['rebuilds'] += 1
+
+    def _new_filter(self, digests: Iterable[int], count: int = 0) -> BloomFilter:
+        digests = list(digests)
+        bloom = BloomFilter(max(len(digests), count) * 2, self.error_rate)
+        for digest in digests:
+            bloom.add(digest)
+        return bloom
+
+    def _store_filter(self, user_id: int, bloom: BloomFilter):
+        self._filters[user_id] = bloom
+        self._filters.move_to_end(user_id)
+        while len(self._filters) > self.max_users:
+            self._filters.popitem(last=False)
+
+    def _filter(self, user_id: int) -> BloomFilter:
+        """Filtro del usuario; se carga de SQLite si no está en memoria (llamar con el lock)"""
+        bloom = self._filters.get(user_id)
+        if bloom is None:
+            rows = self.conn.execute(
+                'SELECT digest FROM fingerprints WHERE user_id = ?', (user_id,)
+            )
+            bloom = self._new_filter(row[0] for row in rows)
+            self._store_filter(user_id, bloom)
+        else:
+            self._filters.move_to_end(user_id)
+        return bloom
+
+    # ============================================
+    # Consulta y alta
+    # ============================================
+    def is_built(self, user_id: int) -> bool:
+        return self.built_at(user_id) is not None
+
+    def contains(self, user_id: int, digest: int) -> bool:
+        """¿Hay ya un movimiento con esta huella? O(1): filtro de Bloom y clave primaria"""
+        self.open()
+        self.stats['lookups'] += 1
+        with self._lock:
+            if digest not in self._filter(user_id):
+                self.stats['filtered'] += 1
+                return False
+            found = self.conn.execute(
+                'SELECT 1 FROM fingerprints WHERE user_id = ? AND digest = ?', (user_id, digest)
+            ).fetchone() is not None
+        self.stats['confirmed' if found else 'false_positives'] += 1
+        return found
+
+    def add(self, user_id: int, digests: Iterable[int]):
+        """Registra huellas de movimientos creados desde el bot"""
+        self.open()
+        digests = list(digests)
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO fingerprints (user_id, digest) VALUES (?, ?)',
+                    ((user_id, digest) for digest in digests)
+                )
+            bloom = self._filters.get(user_id)
+            if bloom is None:
+                return  # se cargará de SQLite cuando haga falta
+            for digest in digests:
+                bloom.add(digest)
+            if bloom.count > bloom.capacity:
+                # Lleno: la tasa de falsos positivos se dispara, se redimensiona
+                rows = self.conn.execute('SELECT digest FROM fingerprints WHERE user_id = ?', (user_id,))
+                self._store_filter(user_id, self._new_filter((row[0] for row in rows), bloom.count))
+
+    def duplicates(self, user_id: int, items: List[Dict[str, Any]]) -> List[bool]:
+        """Marca qué elementos de un lote ya existen (solo si el usuario tiene índice)"""
+        if not self.is_built(user_id):
+            return [False] * len(items)
+        return [self.contains(user_id, fingerprint_item(item)) for item in items]
+
+# Instancia global del índice de duplicados
+duplicate_index = DuplicateIndex(
+    PERSISTENCE_PATH,
+    window_days=DUPLICATE_WINDOW_DAYS,
+    ttl=DUPLICATE_INDEX_TTL,
+    max_users=DUPLICATE_MAX_USERS
+)
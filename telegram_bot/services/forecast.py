@@ -0,0 +1,263 @@
+import calendar
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from services.api_client import APIClient
+from services.models import Account
+from config import FORECAST_HISTORY_MONTHS, FORECAST_MAX_MOVEMENTS, FORECAST_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Semivida (meses) de los pesos: un mes de hace medio año pesa la mitad que el último
+HALF_LIFE = 6.0
+# Amortiguación de la tendencia: no se extrapola una pendiente para siempre
+DAMPING = 0.8
+# Horizonte máximo de la proyección (meses)
+MAX_HORIZON = 120
+
+def _ordinal(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+def _year_month(ordinal: int) -> Tuple[int, int]:
+    return ordinal // 12, ordinal % 12 + 1
+
+class Fit:
+    """Parámetros ajustados de la aportación mensual neta de una cuenta"""
+    __slots__ = ('level', 'slope', 'season', 'months', 'last_month')
+
+    def __init__(self, level: float, slope: float, season: np.ndarray, months: int, last_month: int):
+        self.level = level          # aportación esperada en el último mes completo
+        self.slope = slope          # variación por mes de la aportación
+        self.season = season        # desviación por mes del calendario (12 valores)
+        self.months = months        # meses completos usados
+        self.last_month = last_month
+
+    @property
+    def seasonal(self) -> bool:
+        return bool(self.season.any())
+
+class Forecast:
+    """Resultado de /prevision para una cuenta"""
+    __slots__ = ('fit', 'monthly', 'month_ends', 'eta', 'reached')
+
+    def __init__(self, fit: Fit, monthly: float, month_ends: List[Tuple[int, float]],
+                 eta: Optional[date], reached: bool):
+        self.fit = fit
+        self.monthly = monthly          # aportación prevista para el próximo mes
+        self.month_ends = month_ends    # (ordinal del mes, balance a fin de mes)
+        self.eta = eta
+        self.reached = reached
+
+def fit_contributions(net: np.ndarray, first_month: int) -> Optional[Fit]:
+    """
+    Ajusta la aportación mensual a partir de los meses completos de `net`.
+
+    Mínimos cuadrados ponderados (pesos exponenciales, los meses recientes
+    cuentan más) sobre la serie desestacionalizada. La estacionalidad de cada
+    mes del calendario es la media de sus residuos, solo si se ha observado
+    al menos dos veces y encogida hacia 0 con pocos datos.
+    """
+    complete = net[:-1]
+    n = complete.size
+    if n == 0:
+        return None
+
+    age = np.arange(n - 1, -1, -1, dtype=np.float64)
+    weights = 0.5 ** (age / HALF_LIFE)
+    calendar_month = (first_month + np.arange(n)) % 12
+
+    mean = np.average(complete, weights=weights)
+    counts = np.bincount(calendar_month, minlength=12)
+    season = np.bincount(calendar_month, weights=complete - mean, minlength=12) / (counts + 1)
+    season[counts < 2] = 0.0
+    if season.any():
+        season -= season[counts >= 2].mean()
+        season[counts < 2] = 0.0
+
+    adjusted = complete - season[calendar_month]
+    if n >= 3:
+        # polyfit pondera los residuos, no sus cuadrados: se pasa la raíz de los pesos
+        slope, level = np.polyfit(-age, adjusted, 1, w=np.sqrt(weights))
+    else:
+        slope, level = 0.0, np.average(adjusted, weights=weights)
+
+    return Fit(float(level), float(slope), season, n, first_month + n - 1)
+
+def project(fit: Fit, balance: float, meta: Optional[float], today: date,
+            months: int = 6) -> Forecast:
+    """Balances a fin de mes y fecha estimada en que se alcanza la meta"""
+    current = _ordinal(today.year, today.month)
+    steps = np.arange(1, MAX_HORIZON + 1)
+    ordinals = fit.last_month + steps
+    damped = np.cumsum(DAMPING ** steps)
+    contributions = fit.level + fit.slope * damped + fit.season[ordinals % 12]
+
+    # Del mes en curso solo queda la parte proporcional a los días que faltan
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    remaining = (days_in_month - today.day) / days_in_month
+    start = int(np.searchsorted(ordinals, current))
+    contributions = contributions[start:]
+    ordinals = ordinals[start:]
+    contributions[0] *= remaining
+
+    balances = balance + np.cumsum(contributions)
+    month_ends = [(int(o), float(b)) for o, b in zip(ordinals[:months], balances[:months])]
+    monthly = float(contributions[1]) if contributions.size > 1 else float(contributions[0])
+
+    eta, reached = None, False
+    if meta:
+        if balance >= meta:
+            reached = True
+        else:
+            hits = np.flatnonzero(balances >= meta)
+            if hits.size:
+                eta = _interpolate(int(hits[0]), balances, balance, meta, ordinals, today)
+
+    return Forecast(fit, monthly, month_ends, eta, reached)
+
+def _interpolate(index: int, balances: np.ndarray, balance: float, meta: float,
+                 ordinals: np.ndarray, today: date) -> date:
+    """Día del mes `index` en que la recta entre dos fines de mes cruza la meta"""
+    previous = balance if index == 0 else float(balances[index - 1])
+    fraction = (meta - previous) / (float(balances[index]) - previous)
+
+    year, month = _year_month(int(ordinals[index]))
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    first_day = today if index == 0 else date(year, month, 1)
+    return first_day + timedelta(days=round(fraction * (last_day - first_day).days))
+
+class _Entry:
+    """Aportaciones netas por mes de una cuenta y su último ajuste"""
+    __slots__ = ('first_month', 'net', 'balance', 'fit')
+
+    def __init__(self, first_month: int, net: np.ndarray, balance: float):
+        self.first_month = first_month
+        self.net = net              # desde first_month hasta el mes en curso
+        self.balance = balance      # balance que explican los movimientos vistos
+        self.fit: Optional[Fit] = None
+
+class ForecastCache:
+    """
+    Caché de aportaciones mensuales y parámetros ajustados por cuenta.
+
+    El histórico se descarga una vez y se agrega por meses; los movimientos
+    creados desde el bot se suman a su mes (record) sin volver a pedirlo. Un
+    movimiento del mes en curso no cambia el ajuste, que solo usa meses
+    completos; uno con fecha anterior obliga a reajustar, pero sobre los
+    agregados ya guardados. Si el balance de la cuenta no coincide con el
+    que explican los movimientos vistos (cambios desde la web, recurrentes,
+    eliminaciones), se vuelve a descargar el histórico.
+    """
+
+    def __init__(self, history_months: int = 24, max_movements: int = 10000, max_entries: int = 5000):
+        self.history_months = history_months
+        self.max_movements = max_movements
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[int, int], _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'fetched': 0, 'hits': 0, 'refits': 0, 'recorded': 0}
+
+    def forecast(self, api: APIClient, user_id: int, account: Account,
+                 today: Optional[date] = None) -> Optional[Forecast]:
+        """Previsión de una cuenta; None si aún no tiene ningún mes completo"""
+        today = today or date.today()
+        balance = float(account.balance)
+        key = (user_id, account.id)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and abs(entry.balance - balance) < 0.005:
+                self._entries.move_to_end(key)
+                self._roll(entry, today)
+                self.stats['hits'] += 1
+            else:
+                entry = None
+
+        if entry is None:
+            entry = self._fetch(api, account, balance, today)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        with self._lock:
+            if entry.fit is None:
+                entry.fit = fit_contributions(entry.net, entry.first_month)
+                self.stats['refits'] += 1
+            fit = entry.fit
+
+        if fit is None:
+            return None
+        return project(fit, balance, float(account.meta) if account.meta else None, today)
+
+    def _fetch(self, api: APIClient, account: Account, balance: float, today: date) -> _Entry:
+        current = _ordinal(today.year, today.month)
+        window_start = current - self.history_months
+        year, month = _year_month(window_start)
+        movements = api.get_movement_list(
+            limit=self.max_movements,
+            id_cuenta=account.id,
+            fecha_desde=f"{year}-{month:02d}-01 00:00:00"
+        )
+        self.stats['fetched'] += 1
+
+        months = np.fromiter(
+            (int(m.fecha_movimiento[:4]) * 12 + int(m.fecha_movimiento[5:7]) - 1 for m in movements),
+            dtype=np.int64, count=len(movements)
+        )
+        amounts = np.fromiter(
+            (float(m.cantidad) if m.tipo == 'ingreso' else -float(m.cantidad) for m in movements),
+            dtype=np.float64, count=len(movements)
+        )
+
+        first_month = window_start
+        if months.size:
+            # Cuenta más reciente que la ventana: se empieza en su primer movimiento
+            first_month = max(window_start, int(months.min()))
+            if len(movements) >= self.max_movements:
+                # Lista truncada (llega ordenada por fecha descendente): el mes más antiguo está incompleto
+                first_month = min(int(months.min()) + 1, current)
+        else:
+            first_month = current
+
+        inside = months >= first_month
+        net = np.bincount(months[inside] - first_month, weights=amounts[inside],
+                          minlength=current - first_month + 1)
+        return _Entry(first_month, net[:current - first_month + 1], balance)
+
+    @staticmethod
+    def _roll(entry: _Entry, today: date):
+        """Cambio de mes: el mes en curso pasa a estar completo y hay que reajustar"""
+        current = _ordinal(today.year, today.month)
+        missing = current - (entry.first_month + entry.net.size - 1)
+        if missing > 0:
+            entry.net = np.concatenate([entry.net, np.zeros(missing)])
+            entry.fit = None
+
+    def record(self, user_id: int, account_id: int, tipo: str, cantidad: float, fecha: str):
+        """Suma a la caché un movimiento creado desde el bot"""
+        with self._lock:
+            entry = self._entries.get((user_id, account_id))
+            if entry is None:
+                return
+            amount = float(cantidad) if tipo == 'ingreso' else -float(cantidad)
+            entry.balance += amount
+            self.stats['recorded'] += 1
+
+            index = int(fecha[:4]) * 12 + int(fecha[5:7]) - 1 - entry.first_month
+            if index < 0:
+                return  # anterior a la ventana: solo cambia el balance
+            if index >= entry.net.size:
+                entry.net = np.concatenate([entry.net, np.zeros(index - entry.net.size + 1)])
+                entry.fit = None
+            entry.net[index] += amount
+            if index < entry.net.size - 1:
+                entry.fit = None  # mes ya completo: cambia el ajuste
+
+# Instancia global de la caché de previsiones
+forecast_cache = ForecastCache(FORECAST_HISTORY_MONTHS, FORECAST_MAX_MOVEMENTS, FORECAST_CACHE_SIZE)
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+import requests
+from telegram.ext import ContextTypes
+from config import (
+    API_URLS,
+    REPLICA_EJECT_FAILURES,
+    REPLICA_EJECT_TIME,
+    HEALTH_CHECK_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Peso de la última muestra en la latencia media exponencial
+EWMA_ALPHA = 0.3
+# Muestras recientes guardadas por réplica para los percentiles
+LATENCY_SAMPLES = 256
+# Latencia mínima (s) con que cuenta un fallo en la media: una réplica que
+# falla al instante no debe parecer la más rápida
+FAILURE_LATENCY = 1.0
+# Tope de la expulsión: REPLICA_EJECT_TIME * 2^n
+MAX_EJECT_DOUBLINGS = 4
+
+class Replica:
+    """Una réplica del backend con sus contadores"""
+    __slots__ = ('url', 'outstanding', 'ewma', 'latencies', 'requests', 'errors',
+                 'failures', 'ejected_until', 'ejections', 'healthy')
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0                # peticiones en curso
+        self.ewma = 0.0                     # latencia media exponencial (s)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0                   # errores seguidos
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.healthy = True                 # último resultado de /health
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def cost(self) -> float:
+        """Peticiones en curso ponderadas por la latencia (una réplica lenta acumula cola)"""
+        return (self.outstanding + 1) * self.ewma
+
+class _Call:
+    """Una petición en curso contra una réplica (context manager de BackendPool.track)"""
+    __slots__ = ('pool', 'replica', 'start', 'ok')
+
+    def __init__(self, pool: 'BackendPool', replica: Replica):
+        self.pool = pool
+        self.replica = replica
+        self.ok = True
+
+    def fail(self):
+        """Marca la petición como fallida (error de conexión o 5xx)"""
+        self.ok = False
+
+    def __enter__(self):
+        with self.pool._lock:
+            self.replica.outstanding += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.pool._finish(self.replica, elapsed, self.ok and exc_type is None)
+
+class BackendPool:
+    """
+    Reparto de peticiones entre réplicas del backend desde el propio cliente.
+
+    Cada petición elige entre dos réplicas disponibles al azar la de menor
+    coste: peticiones en curso por latencia media (power of two choices).
+    Un fallo entra en la media como una respuesta de al menos
+    FAILURE_LATENCY segundos, para que una réplica que responde errores al
+    instante no se lleve el tráfico.
+    Una réplica que falla `eject_failures` veces seguidas se expulsa
+    `eject_time` segundos (el doble en cada expulsión consecutiva, hasta
+    16 veces). El job de salud consulta /health de todas: una que no
+    responde deja de recibir tráfico y vuelve cuando responde y ha
+    cumplido la expulsión. Si no queda ninguna disponible se usan todas,
+    para que el error llegue al llamador (operaciones pendientes).
+    """
+
+    def __init__(self, urls: Sequence[str], eject_failures: int = 3, eject_time: float = 30,
+                 health_timeout: float = 2):
+        if not urls:
+            raise ValueError("Hace falta al menos una URL del backend")
+        self.replicas = [Replica(url) for url in urls]
+        self.eject_failures = eject_failures
+        self.eject_time = eject_time
+        self.health_timeout = health_timeout
+        self._lock = threading.Lock()
+        self.stats = {'retries': 0, 'ejections': 0, 'reintroduced': 0, 'panic': 0}
+
+    # ============================================
+    # Selección
+    # ============================================
+    def pick(self, exclude: Sequence[Replica] = ()) -> Replica:
+        """Réplica para la siguiente petición"""
+        replicas = self.replicas
+        if len(replicas) == 1:
+            return replicas[0]
+
+        now = time.monotonic()
+        candidates = [r for r in replicas if r.available(now) and r not in exclude]
+        if not candidates:
+            candidates = [r for r in replicas if r not in exclude] or replicas
+            self.stats['panic'] += 1
+        if len(candidates) == 1:
+            return candidates[0]
+
+        first, second = random.sample(candidates, 2)
+        return first if first.cost() <= second.cost() else second
+
+    def track(self, replica: Replica) -> _Call:
+        """Cuenta la petición como en curso y registra su latencia y resultado"""
+        return _Call(self, replica)
+
+    def can_retry(self, tried: Sequence[Replica]) -> bool:
+        """¿Queda otra réplica disponible para reintentar?"""
+        now = time.monotonic()
+        return any(r.available(now) and r not in tried for r in self.replicas)
+
+    def _finish(self, replica: Replica, elapsed: float, ok: bool):
+        with self._lock:
+            replica.outstanding -= 1
+            replica.requests += 1
+            if ok:
+                replica.latencies.append(elapsed)
+            sample = elapsed if ok else max(elapsed, FAILURE_LATENCY)
+            replica.ewma = sample if not replica.ewma else (
+                EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * replica.ewma
+            )
+            if ok:
+                replica.failures = 0
+                replica.ejections = 0
+                return
+            replica.errors += 1
+            replica.failures += 1
+            if replica.failures >= self.eject_failures and len(self.replicas) > 1:
+                self._eject(replica)
+
+    def _eject(self, replica: Replica):
+        """Saca la réplica del reparto (llamar con el lock)"""
+        duration = self.eject_time * 2 ** min(replica.ejections, MAX_EJECT_DOUBLINGS)
+        replica.ejected_until = time.monotonic() + duration
+        replica.ejections += 1
+        replica.failures = 0
+        self.stats['ejections'] += 1
+        logger.warning(f"Réplica {replica.url} expulsada durante {duration:.0f}s")
+
+    # ============================================
+    # Comprobaciones de salud
+    # ============================================
+    def probe(self, replica: Replica) -> bool:
+        """GET /health contra una réplica concreta"""
+        try:
+            response = requests.get(f"{replica.url}/health", timeout=self.health_timeout)
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: comprueba /health de todas las réplicas a la vez"""
+        if len(self.replicas) == 1:
+            return
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self.probe, replica) for replica in self.replicas
+        ))
+        self.update_health(results)
+
+    def update_health(self, results: List[bool]):
+        now = time.monotonic()
+        with self._lock:
+            for replica, healthy in zip(self.replicas, results):
+                if healthy and not replica.healthy:
+                    if now >= replica.ejected_until:
+                        replica.healthy = True
+                        replica.failures = 0
+                        self.stats['reintroduced'] += 1
+                        logger.info(f"Réplica {replica.url} de nuevo en el reparto")
+                elif not healthy and replica.healthy:
+                    replica.healthy = False
+                    logger.warning(f"Réplica {replica.url} no responde a /health")
+
+    # ============================================
+    # Métricas
+    # ============================================
+    def metrics(self) -> List[Dict[str, Any]]:
+        """Estado y latencias (ms) de cada réplica"""
+        now = time.monotonic()
+        result = []
+        with self._lock:
+            for replica in self.replicas:
+                samples = sorted(replica.latencies)
+                result.append({
+                    'url': replica.url,
+                    'available': replica.available(now),
+                    'healthy': replica.healthy,
+                    'ejected_for': max(0.0, replica.ejected_until - now),
+                    'outstanding': replica.outstanding,
+                    'requests': replica.requests,
+                    'errors': replica.errors,
+                    'ewma_ms': replica.ewma * 1000,
+                    'p50_ms': _percentile(samples, 0.5),
+                    'p95_ms': _percentile(samples, 0.95),
+                })
+        return result
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+# Instancia global del reparto entre réplicas
+backend_pool = BackendPool(
+    API_URLS,
+    eject_failures=REPLICA_EJECT_FAILURES,
+    eject_time=REPLICA_EJECT_TIME,
+    health_timeout=HEALTH_CHECK_TIMEOUT
+)
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from telegram import InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, RetryAfter
+from telegram.helpers import escape_markdown
+from config import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_MERGE_WINDOW
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+# Límite de longitud de un mensaje de Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+class TokenBucket:
+    """Cubo de tokens: `rate` envíos por segundo con ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Segundos hasta que haya un token disponible"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+def _merge(first: str, first_mode: Optional[str],
+           second: str, second_mode: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+    """Texto y parse_mode de dos mensajes unidos, o None si no se pueden unir"""
+    if first_mode != second_mode:
+        # Un texto plano se une a uno con Markdown escapando sus símbolos
+        if {first_mode, second_mode} != {None, 'Markdown'}:
+            return None
+        if first_mode is None:
+            first = escape_markdown(first, version=1)
+        else:
+            second = escape_markdown(second, version=1)
+    return f"{first}\n\n{second}", first_mode or second_mode
+
+def _is_entity_error(error: BadRequest) -> bool:
+    """Telegram rechaza el formato (p. ej. un _ sin cerrar en un nombre de cuenta)"""
+    return 'parse entities' in str(error).lower()
+
+class _Outgoing:
+    __slots__ = ('text', 'parse_mode', 'view', 'reply_markup', 'future', 'enqueued_at', 'parts', 'trace')
+
+    def __init__(self, text: str, parse_mode: Optional[str], view: Optional[str],
+                 reply_markup: Optional[InlineKeyboardMarkup] = None):
+        self.text = text
+        self.parse_mode = parse_mode
+        self.view = view
+        self.reply_markup = reply_markup
+        self.future = asyncio.get_running_loop().create_future()
+        # Los errores ya se registran en el log: nadie está obligado a esperar el futuro
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.enqueued_at = time.monotonic()
+        # Textos originales unidos en este mensaje, por si hay que enviarlos por separado
+        self.parts: List[Tuple[str, Optional[str]]] = [(text, parse_mode)]
+        # El envío ocurre en otra tarea: se guarda la traza del update que lo originó
+        self.trace = tracing.current_trace()
+
+class OutboundQueue:
+    """
+    Planificador de mensajes salientes.
+
+    - Respeta un cubo de tokens global y otro por chat para no provocar 429.
+    - Une en un solo mensaje las respuestas consecutivas a un mismo chat que
+      lleguen dentro de `merge_window` segundos, si caben. Un texto plano
+      se une a uno con Markdown escapándolo.
+    - Si Telegram rechaza el Markdown, cada parte se reenvía por separado y
+      la que falla, como texto plano: la respuesta nunca se pierde.
+    - Las vistas (`view`) editan el último mensaje enviado con esa clave en
+      lugar de enviar uno nuevo (paginación, progreso).
+    - Los mensajes con teclado inline no se unen con otros.
+    """
+
+    def __init__(self, global_rate: float = 25, per_chat_rate: float = 1,
+                 per_chat_burst: float = 3, merge_window: float = 0.15,
+                 max_chats: int = 10000):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.merge_window = merge_window
+        self.max_chats = max_chats
+        self.bot = None
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_lock = asyncio.Lock()
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._pending: Dict[int, Deque[_Outgoing]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._views: 'OrderedDict[Tuple[int, str], int]' = OrderedDict()
+
+        self.stats = {
+            'sent': 0,
+            'merged': 0,
+            'edited': 0,
+            'retried': 0,
+            'failed': 0,
+            'plain_fallbacks': 0,
+            'total_delay': 0.0,
+            'max_delay': 0.0,
+        }
+
+    def start(self, bot):
+        """Asocia el bot con el que se envían los mensajes"""
+        self.bot = bot
+
+    async def wait_chat(self, chat_id: int):
+        """Espera a que salga lo pendiente del chat (antes de enviar algo fuera de la cola)"""
+        worker = self._workers.get(chat_id)
+        if worker is not None:
+            await asyncio.shield(worker)
+
+    async def stop(self):
+        """Espera a que se envíe lo que queda en cola"""
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    # ============================================
+    # Encolado
+    # ============================================
+    def send(self, chat_id: int, text: str, parse_mode: Optional[str] = None,
+             view: Optional[str] = None,
+             reply_markup: Optional[InlineKeyboardMarkup] = None) -> asyncio.Future:
+        """Encola un mensaje; el futuro se resuelve con el Message enviado"""
+        pending = self._pending.setdefault(chat_id, deque())
+
+        # Unir con el último mensaje pendiente del mismo chat si es posible
+        if pending and view is None and reply_markup is None:
+            last = pending[-1]
+            merged = None
+            if last.view is None and last.reply_markup is None:
+                merged = _merge(last.text, last.parse_mode, text, parse_mode)
+            if merged is not None and len(merged[0]) <= MAX_MESSAGE_LENGTH:
+                last.text, last.parse_mode = merged
+                last.parts.append((text, parse_mode))
+                self.stats['merged'] += 1
+                return last.future
+
+        item = _Outgoing(text, parse_mode, view, reply_markup)
+        pending.append(item)
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+
+        return item.future
+
+    # ============================================
+    # Envío
+    # ============================================
+    async def _drain(self, chat_id: int):
+        """Envía los mensajes pendientes de un chat respetando los límites"""
+        try:
+            # Pequeña ventana para que las respuestas seguidas se puedan unir
+            await asyncio.sleep(self.merge_window)
+
+            pending = self._pending[chat_id]
+            while pending:
+                await self._acquire(chat_id)
+                item = pending.popleft()
+                await self._deliver(chat_id, item)
+        finally:
+            self._workers.pop(chat_id, None)
+            if not self._pending.get(chat_id):
+                self._pending.pop(chat_id, None)
+
+    async def _acquire(self, chat_id: int):
+        """Espera a tener token en el cubo del chat y en el global"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+
+        while True:
+            wait = bucket.wait_time()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        bucket.consume()
+
+        async with self._global_lock:
+            while True:
+                wait = self._global.wait_time()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._global.consume()
+
+        # Un cubo lleno equivale a uno nuevo: se descartan para no crecer sin límite
+        if len(self._chat_buckets) > self.max_chats:
+            for key in [k for k, b in self._chat_buckets.items() if b.tokens >= b.capacity]:
+                del self._chat_buckets[key]
+
+    async def _deliver(self, chat_id: int, item: _Outgoing):
+        for attempt in range(2):
+            try:
+                with tracing.resume(item.trace, 'telegram.send', chat_id=chat_id,
+                                    parts=len(item.parts), view=item.view, attempt=attempt) as span:
+                    message = await self._send_with_fallback(chat_id, item)
+                    span.set(queued_ms=round((time.monotonic() - item.enqueued_at) * 1000, 2))
+                delay = time.monotonic() - item.enqueued_at
+                self.stats['sent'] += 1
+                self.stats['total_delay'] += delay
+                self.stats['max_delay'] = max(self.stats['max_delay'], delay)
+                if not item.future.done():
+                    item.future.set_result(message)
+                return
+            except RetryAfter as e:
+                self.stats['retried'] += 1
+                logger.warning(f"Telegram pide esperar {e.retry_after}s antes de enviar al chat {chat_id}")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Error al enviar mensaje al chat {chat_id}: {e}")
+                if not item.future.done():
+                    item.future.set_exception(e)
+                return
+
+        self.stats['failed'] += 1
+        if not item.future.done():
+            item.future.set_exception(RuntimeError("No se pudo enviar el mensaje"))
+
+    async def _send_with_fallback(self, chat_id: int, item: _Outgoing):
+        """Envía el mensaje; si su formato no es válido, lo reenvía sin él"""
+        try:
+            return await self._send_or_edit(chat_id, item.text, item.parse_mode, item.view, item.reply_markup)
+        except BadRequest as e:
+            if item.parse_mode is None or not _is_entity_error(e):
+                raise
+            logger.warning(f"Formato rechazado en el chat {chat_id}, se reenvía sin él: {e}")
+            self.stats['plain_fallbacks'] += 1
+
+        if len(item.parts) == 1:
+            return await self._send_or_edit(chat_id, item.parts[0][0], None, item.view, item.reply_markup)
+
+        # Mensaje unido: cada parte por separado, con su formato si es válido
+        message = None
+        for i, (text, parse_mode) in enumerate(item.parts):
+            if i:
+                await self._acquire(chat_id)
+            try:
+                message = await self._send_or_edit(chat_id, text, parse_mode, None, None)
+            except BadRequest as e:
+                if parse_mode is None or not _is_entity_error(e):
+                    raise
+                message = await self._send_or_edit(chat_id, text, None, None, None)
+        return message
+
+    async def _send_or_edit(self, chat_id: int, text: str, parse_mode: Optional[str],
+                            view: Optional[str], reply_markup: Optional[InlineKeyboardMarkup]):
+        if view:
+            key = (chat_id, view)
+            message_id = self._views.get(key)
+            if message_id:
+                try:
+                    message = await self.bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id,
+                        text=text, parse_mode=parse_mode,
+                        reply_markup=reply_markup
+                    )
+                    self.stats['edited'] += 1
+                    self._views.move_to_end(key)
+                    return message
+                except BadRequest as e:
+                    # "message is not modified" no es un error real
+                    if 'not modified' in str(e).lower():
+                        return None
+                    if _is_entity_error(e):
+                        raise
+                    self._views.pop(key, None)
+
+        message = await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode,
+                                              reply_markup=reply_markup)
+
+        if view:
+            self._views[(chat_id, view)] = message.message_id
+            while len(self._views) > self.max_chats:
+                self._views.popitem(last=False)
+
+        return message
+
+    # ============================================
+    # Métricas
+    # ============================================
+    def queue_depth(self) -> int:
+        """Mensajes pendientes de envío en todos los chats"""
+        return sum(len(pending) for pending in self._pending.values())
+
+    def metrics(self) -> Dict[str, float]:
+        sent = self.stats['sent']
+        return {
+            **self.stats,
+            'queue_depth': self.queue_depth(),
+            'active_chats': len(self._workers),
+            'avg_delay': self.stats['total_delay'] / sent if sent else 0.0,
+        }
+
+# Instancia global de la cola de salida
+outbound_queue = OutboundQueue(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    per_chat_rate=OUTBOUND_CHAT_RATE,
+    merge_window=OUTBOUND_MERGE_WINDOW
+)
+
+async def reply(update: Update, text: str, parse_mode: Optional[str] = None,
+                view: Optional[str] = None,
+                reply_markup: Optional[InlineKeyboardMarkup] = None) -> asyncio.Future:
+    """Encola una respuesta al chat del update sin esperar a que se envíe"""
+    return outbound_queue.send(update.effective_chat.id, text, parse_mode=parse_mode, view=view,
+                               reply_markup=reply_markup)
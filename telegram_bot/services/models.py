@@ -0,0 +1,159 @@
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
+def decode_json(content: bytes) -> Any:
+    """Decodifica una respuesta JSON (orjson si está disponible)"""
+    return _loads(content)
+
+def to_decimal(value: Any) -> Decimal:
+    """Convierte una cantidad de la API (str, int o float) a Decimal exacto"""
+    if type(value) is str and value:
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            return Decimal('0')
+    if value is None or value == '':
+        return Decimal('0')
+    if isinstance(value, Decimal):
+        return value
+    try:
+        # str() evita arrastrar el error binario de los float
+        return Decimal(str(value))
+    except InvalidOperation:
+        return Decimal('0')
+
+def _optional_decimal(value: Any) -> Optional[Decimal]:
+    return None if value is None or value == '' else to_decimal(value)
+
+class Account:
+    """Cuenta del usuario"""
+    __slots__ = ('id', 'nombre', 'tipo', 'balance', 'moneda', 'meta',
+                 'id_etiqueta', 'etiqueta_nombre', 'porcentaje_meta')
+
+    def __init__(self, id: int, nombre: str, tipo: str, balance: Decimal,
+                 moneda: str = 'EUR', meta: Optional[Decimal] = None,
+                 id_etiqueta: Optional[int] = None, etiqueta_nombre: Optional[str] = None,
+                 porcentaje_meta: Optional[Decimal] = None):
+        self.id = id
+        self.nombre = nombre
+        self.tipo = tipo
+        self.balance = balance
+        self.moneda = moneda
+        self.meta = meta
+        self.id_etiqueta = id_etiqueta
+        self.etiqueta_nombre = etiqueta_nombre
+        self.porcentaje_meta = porcentaje_meta
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Account':
+        progreso = data.get('progreso_meta') or {}
+        id_etiqueta = data.get('id_etiqueta')
+        balance = to_decimal(data.get('balance'))
+        meta = _optional_decimal(data.get('meta'))
+        
+        porcentaje = _optional_decimal(progreso.get('porcentaje'))
+        if porcentaje is None and meta:
+            # Mismo cálculo que Cuenta::getGoalProgress cuando el listado no lo incluye
+            porcentaje = min(round(balance / meta * 100, 2), Decimal('100'))
+        
+        return cls(
+            id=int(data['id']),
+            nombre=data['nombre'],
+            tipo=data['tipo'],
+            balance=balance,
+            moneda=data.get('moneda') or 'EUR',
+            meta=meta,
+            id_etiqueta=int(id_etiqueta) if id_etiqueta else None,
+            etiqueta_nombre=data.get('etiqueta_nombre'),
+            porcentaje_meta=porcentaje
+        )
+
+    def __repr__(self):
+        return f"Account(id={self.id}, nombre={self.nombre!r}, balance={self.balance})"
+
+class Movement:
+    """Movimiento (ingreso o retirada) de una cuenta"""
+    __slots__ = ('id', 'id_cuenta', 'tipo', 'cantidad', 'fecha_movimiento',
+                 'notas', 'adjunto', 'cuenta_nombre')
+
+    def __init__(self, id: int, id_cuenta: int, tipo: str, cantidad: Decimal,
+                 fecha_movimiento: str, notas: Optional[str] = None,
+                 adjunto: Optional[str] = None, cuenta_nombre: Optional[str] = None):
+        self.id = id
+        self.id_cuenta = id_cuenta
+        self.tipo = tipo
+        self.cantidad = cantidad
+        self.fecha_movimiento = fecha_movimiento
+        self.notas = notas
+        self.adjunto = adjunto
+        self.cuenta_nombre = cuenta_nombre
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Movement':
+        return cls(
+            id=int(data['id']),
+            id_cuenta=int(data['id_cuenta']),
+            tipo=data['tipo'],
+            cantidad=to_decimal(data.get('cantidad')),
+            fecha_movimiento=data.get('fecha_movimiento') or '',
+            notas=data.get('notas') or None,
+            adjunto=data.get('adjunto') or None,
+            cuenta_nombre=data.get('cuenta_nombre')
+        )
+
+    def __repr__(self):
+        return f"Movement(id={self.id}, tipo={self.tipo!r}, cantidad={self.cantidad})"
+
+class Summary:
+    """Resumen de las cuentas del usuario"""
+    __slots__ = ('balance_total', 'total_cuentas', 'cuentas_efectivo', 'cuentas_bancarias')
+
+    def __init__(self, balance_total: Decimal, total_cuentas: int,
+                 cuentas_efectivo: int = 0, cuentas_bancarias: int = 0):
+        self.balance_total = balance_total
+        self.total_cuentas = total_cuentas
+        self.cuentas_efectivo = cuentas_efectivo
+        self.cuentas_bancarias = cuentas_bancarias
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Summary':
+        return cls(
+            balance_total=to_decimal(data.get('balance_total')),
+            total_cuentas=int(data.get('total_cuentas') or 0),
+            cuentas_efectivo=int(data.get('cuentas_efectivo') or 0),
+            cuentas_bancarias=int(data.get('cuentas_bancarias') or 0)
+        )
+
+class Stats:
+    """Estadísticas de movimientos de un periodo (/movements/stats)"""
+    __slots__ = ('total_movimientos', 'suma_ingresos', 'suma_retiradas')
+
+    def __init__(self, total_movimientos: int, suma_ingresos: Decimal, suma_retiradas: Decimal):
+        self.total_movimientos = total_movimientos
+        self.suma_ingresos = suma_ingresos
+        self.suma_retiradas = suma_retiradas
+
+    @property
+    def balance(self) -> Decimal:
+        return self.suma_ingresos - self.suma_retiradas
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Stats':
+        return cls(
+            total_movimientos=int(data.get('total_movimientos') or 0),
+            suma_ingresos=to_decimal(data.get('suma_ingresos')),
+            suma_retiradas=to_decimal(data.get('suma_retiradas'))
+        )
+
+def accounts_from_list(items: List[Dict[str, Any]]) -> List[Account]:
+    return [Account.from_dict(item) for item in items]
+
+def movements_from_list(items: List[Dict[str, Any]]) -> List[Movement]:
+    return [Movement.from_dict(item) for item in items]
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+from typing import Any, Dict, Optional, Set, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL,
+    user BLOB NOT NULL,
+    last_activity REAL NOT NULL DEFAULT 0
+);
+"""
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persistencia incremental en SQLite.
+
+    Solo se escriben las claves de user_data que han cambiado desde el último
+    volcado, agrupadas en una única transacción por ciclo de update_interval.
+    Los datos de cada usuario se cargan de forma perezosa la primera vez que
+    llega una actualización suya.
+    """
+
+    def __init__(self, path: str, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+        self.conn.commit()
+
+        # Última versión serializada de cada clave, para detectar cambios
+        self._snapshots: Dict[int, Dict[str, bytes]] = {}
+        self._loaded: Set[int] = set()
+
+        # Escrituras pendientes del ciclo actual
+        self._pending_upserts: Dict[Tuple[int, str], bytes] = {}
+        self._pending_deletes: Set[Tuple[int, str]] = set()
+        self._pending_dropped: Set[int] = set()
+        self._pending_conversations: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._pending_activity: Dict[int, float] = {}
+        self._commit_scheduled = False
+
+    def _migrate(self):
+        """Añade last_activity a una tabla de sesiones anterior (cuenta como activa ahora)"""
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(sessions)')}
+        if 'last_activity' not in columns:
+            self.conn.execute('ALTER TABLE sessions ADD COLUMN last_activity REAL NOT NULL DEFAULT 0')
+            self.conn.execute("UPDATE sessions SET last_activity = strftime('%s', 'now')")
+
+    # ============================================
+    # Escritura por lotes
+    # ============================================
+    def _schedule_commit(self):
+        """Programa un único commit para todas las escrituras del ciclo actual"""
+        if self._commit_scheduled:
+            return
+        self._commit_scheduled = True
+        try:
+            asyncio.get_running_loop().call_soon(self._commit)
+        except RuntimeError:
+            self._commit()
+
+    def _commit(self):
+        """Vuelca a disco las escrituras pendientes en una sola transacción"""
+        self._commit_scheduled = False
+
+        if not (self._pending_upserts or self._pending_deletes
+                or self._pending_dropped or self._pending_conversations or self._pending_activity):
+            return
+
+        try:
+            with self.conn:
+                for user_id in self._pending_dropped:
+                    self.conn.execute('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+                self.conn.executemany(
+                    'DELETE FROM user_data WHERE user_id = ? AND key = ?',
+                    list(self._pending_deletes)
+                )
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO user_data (user_id, key, value) VALUES (?, ?, ?)',
+                    [(uid, key, value) for (uid, key), value in self._pending_upserts.items()]
+                )
+                for (name, key), state in self._pending_conversations.items():
+                    if state is None:
+                        self.conn.execute(
+                            'DELETE FROM conversations WHERE name = ? AND key = ?', (name, key)
+                        )
+                    else:
+                        self.conn.execute(
+                            'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                            (name, key, state)
+                        )
+                self.conn.executemany(
+                    'UPDATE sessions SET last_activity = ? WHERE user_id = ?',
+                    [(at, uid) for uid, at in self._pending_activity.items()]
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error al guardar la persistencia: {e}")
+            return
+
+        self._pending_upserts.clear()
+        self._pending_deletes.clear()
+        self._pending_dropped.clear()
+        self._pending_conversations.clear()
+        self._pending_activity.clear()
+
+    # ============================================
+    # user_data
+    # ============================================
+    async def get_user_data(self) -> Dict[int, Dict]:
+        """No se precarga nada: cada usuario se carga en refresh_user_data"""
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        """Carga los datos guardados del usuario la primera vez que se le ve"""
+        if user_id in self._loaded:
+            return
+
+        snapshot = {}
+        rows = self.conn.execute(
+            'SELECT key, value FROM user_data WHERE user_id = ?', (user_id,)
+        ).fetchall()
+
+        for key, value in rows:
+            snapshot[key] = value
+            if key not in user_data:
+                try:
+                    user_data[key] = pickle.loads(value)
+                except Exception as e:
+                    logger.warning(f"No se pudo cargar '{key}' del usuario {user_id}: {e}")
+
+        self._snapshots[user_id] = snapshot
+        self._loaded.add(user_id)
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        """Registra solo las claves que han cambiado desde el último volcado"""
+        snapshot = self._snapshots.setdefault(user_id, {})
+        self._loaded.add(user_id)
+
+        for key, value in data.items():
+            key = str(key)
+            try:
+                serialized = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.warning(f"No se puede serializar '{key}' del usuario {user_id}: {e}")
+                continue
+
+            if snapshot.get(key) != serialized:
+                snapshot[key] = serialized
+                self._pending_upserts[(user_id, key)] = serialized
+                self._pending_deletes.discard((user_id, key))
+
+        for key in [k for k in snapshot if k not in data]:
+            del snapshot[key]
+            self._pending_upserts.pop((user_id, key), None)
+            self._pending_deletes.add((user_id, key))
+
+        self._schedule_commit()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        """Elimina todos los datos de un usuario"""
+        self._snapshots.pop(user_id, None)
+        self._loaded.discard(user_id)
+        for pending_key in [k for k in self._pending_upserts if k[0] == user_id]:
+            del self._pending_upserts[pending_key]
+        self._pending_dropped.add(user_id)
+        self._schedule_commit()
+
+    def user_data_size(self, user_id: int) -> int:
+        """Bytes del user_data serializado en el último volcado"""
+        return sum(len(value) for value in self._snapshots.get(user_id, {}).values())
+
+    # ============================================
+    # Conversaciones
+    # ============================================
+    async def get_conversations(self, name: str) -> Dict:
+        """Obtiene los estados guardados de una conversación"""
+        rows = self.conn.execute(
+            'SELECT key, state FROM conversations WHERE name = ?', (name,)
+        ).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        """Registra el nuevo estado de una conversación"""
+        state = None if new_state is None else pickle.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_commit()
+
+    # ============================================
+    # Sesiones del bot
+    # ============================================
+    def load_session(self, user_id: int) -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """Obtiene el token, los datos de usuario y la última actividad guardados"""
+        row = self.conn.execute(
+            'SELECT token, user, last_activity FROM sessions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return row[0], pickle.loads(row[1]), row[2]
+
+    def save_session(self, user_id: int, token: str, user: Dict[str, Any], last_activity: float):
+        """Guarda una sesión (los inicios de sesión son poco frecuentes, se escribe al momento)"""
+        self._pending_activity.pop(user_id, None)
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sessions (user_id, token, user, last_activity) VALUES (?, ?, ?, ?)',
+                (user_id, token, pickle.dumps(user), last_activity)
+            )
+
+    def touch_session(self, user_id: int, last_activity: float):
+        """Actualiza la última actividad en el próximo volcado"""
+        self._pending_activity[user_id] = last_activity
+        self._schedule_commit()
+
+    def session_activity(self) -> Dict[int, float]:
+        """Última actividad de todas las sesiones guardadas"""
+        return dict(self.conn.execute('SELECT user_id, last_activity FROM sessions'))
+
+    def delete_session(self, user_id: int):
+        """Elimina una sesión guardada"""
+        self._pending_activity.pop(user_id, None)
+        with self.conn:
+            self.conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+    # ============================================
+    # Datos no utilizados por el bot
+    # ============================================
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Vuelca lo pendiente y cierra la base de datos al detener el bot"""
+        self._commit()
+        self.conn.close()
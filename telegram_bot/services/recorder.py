@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Optional
+from telegram import Message, Update, User
+from utils.account_index import normalize
+from config import RECORD_PATH, RECORD_SAMPLE_RATE
+
+# Palabras de los comandos que no identifican a nadie y se graban tal cual
+KEEP_WORDS = {
+    # /grafico, /comparar, /movimientos, /recurrente
+    'mes', 'ano', 'anio', 'ayuda', 'help', 'borrar', 'mensual', 'semanal',
+    'ingreso', 'ingresos', 'gasto', 'gastos', 'retirada', 'retiradas',
+    'lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo',
+    'desde', 'hasta', 'cuenta', 'tipo', 'orden', 'fecha', 'cantidad', 'importe', 'id', 'asc', 'desc',
+    # /admin
+    'memoria', 'replicas', 'adjuntos', 'stats', 'log', 'usuario',
+    # Confirmación de /eliminar
+    'si', 'no',
+}
+
+_WORD = re.compile(r'\S+')
+_DATE = re.compile(r'^(?:\d{4}(?:-\d{1,2}){0,2}|(?:\d{1,2}/){1,2}\d{4})$')
+# Prefijo de un filtro (#etiqueta, >=50, cuenta:...) que se conserva si es conocido
+_PREFIX = re.compile(r'^([#<>=]+|[^\W\d_]+:)(.+)$')
+_LETTER = re.compile(r'[^\W\d_]')
+_ID_SEGMENT = re.compile(r'/\d+')
+
+def _mask(word: str, key: bytes) -> str:
+    """Sustituye letras y cifras por otras derivadas de la palabra y la clave"""
+    digest = hashlib.blake2b(word.encode('utf-8'), key=key).digest()
+    letters = bool(_LETTER.search(word))
+    chars = []
+    for i, char in enumerate(word):
+        byte = digest[i % len(digest)]
+        if not char.isalnum():
+            chars.append(char)
+        elif letters:
+            chars.append(chr(ord('a') + byte % 26))
+        elif not chars:
+            # Primera cifra no mayor que la original: un día, un límite o un
+            # número de cuenta siguen en su rango
+            chars.append('0' if char == '0' else chr(ord('1') + byte % int(char)))
+        else:
+            # Sin ceros: un importe enmascarado sigue siendo positivo
+            chars.append(chr(ord('1') + byte % 9))
+    return ''.join(chars)
+
+def _scrub_word(word: str, key: bytes, dates: bool = False) -> str:
+    if normalize(word) in KEEP_WORDS or (word.isdigit() and len(word) == 1):
+        return word
+    # Las fechas solo tras desde:, hasta: o mes: (suelto, 2026 podría ser un importe)
+    if dates and _DATE.match(word):
+        return word
+    prefix = _PREFIX.match(word)
+    if prefix and (prefix.group(1)[-1] != ':' or normalize(prefix.group(1)[:-1]) in KEEP_WORDS):
+        return prefix.group(1) + _scrub_word(prefix.group(2), key, dates=prefix.group(1)[-1] == ':')
+    return _mask(word, key)
+
+def scrub_text(text: str, key: bytes = b'') -> str:
+    """
+    Texto de un mensaje sin datos personales.
+
+    Se conservan el comando, las palabras clave, las fechas de los
+    filtros y las cifras sueltas (opciones de menú). El resto de palabras
+    se enmascaran con la misma longitud y forma, derivadas de la palabra
+    con una clave que no se guarda: notas, nombres de cuenta, usuarios y
+    contraseñas quedan irreconocibles, los importes siguen siendo
+    importes válidos y una misma palabra da siempre la misma máscara
+    (los duplicados de /nuevo se siguen detectando al reproducir).
+    """
+    def scrub(match):
+        word = match.group(0)
+        if match.start() == 0 and word.startswith('/'):
+            return word.split('@')[0]
+        return _scrub_word(word, key)
+    return _WORD.sub(scrub, text)
+
+def endpoint_template(endpoint: str) -> str:
+    """/movements/123?x=1 -> /movements/{id}"""
+    return _ID_SEGMENT.sub('/{id}', endpoint.split('?')[0])
+
+class _NoopTrack:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopTrack()
+
+class _Track:
+    """Update que se está grabando: sus llamadas al backend y su duración"""
+    __slots__ = ('recorder', 'update_id', 'start', '_token')
+
+    def __init__(self, recorder: 'Recorder', update_id: int):
+        self.recorder = recorder
+        self.update_id = update_id
+
+    def __enter__(self):
+        self._token = _recording.set(self.update_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _recording.reset(self._token)
+        self.recorder._write({'type': 'handled', 'update_id': self.update_id,
+                              'ms': round(duration * 1000, 2), 'error': exc_type is not None})
+        return False
+
+_recording: ContextVar[Optional[int]] = ContextVar('recording', default=None)
+
+class Recorder:
+    """
+    Grabación anónima de updates y tiempos del backend (JSON Lines).
+
+    Desactivada si RECORD_PATH está vacío. Se graba una fracción
+    RECORD_SAMPLE_RATE de los usuarios (todos sus updates, para que las
+    conversaciones de /nuevo queden completas). Los ids de usuario y de
+    chat se sustituyen por números correlativos, los textos pasan por
+    scrub_text, los archivos conservan tamaño y dimensiones pero no su id
+    ni su nombre, y de cada llamada al backend solo se guardan método,
+    ruta sin ids, estado, bytes y duración. tools/replay.py reproduce el
+    archivo contra el backend simulado.
+    """
+
+    def __init__(self, path: str = '', sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._salt = os.urandom(16)
+        self._users: Dict[int, int] = {}
+        self._files: Dict[str, str] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start = 0.0
+        self._arrivals: Dict[int, float] = {}
+        self.stats = {'updates': 0, 'api_calls': 0, 'skipped': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def open(self):
+        """Empieza a grabar (si hay RECORD_PATH) en un hilo escritor"""
+        if not self.path or self.enabled:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._writer, name='recorder', daemon=True)
+        self._thread.start()
+        self._write({'type': 'start', 'version': 1, 'started': datetime.now().isoformat(timespec='seconds'),
+                     'sample_rate': self.sample_rate})
+
+    def close(self):
+        if self.enabled:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _writer(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    return
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+
+    def _write(self, record: Dict[str, Any], at: Optional[float] = None):
+        record['t'] = round((at or time.monotonic()) - self._start, 3)
+        self._queue.put(record)
+
+    # ============================================
+    # Updates
+    # ============================================
+    def _sampled(self, user_id: int) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        digest = hashlib.blake2b(user_id.to_bytes(8, 'big', signed=True), key=self._salt, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2 ** 64 < self.sample_rate
+
+    def arrived(self, update: object):
+        """Anota cuándo llega un update a la cola (el ritmo real aunque el bot vaya atrasado)"""
+        if self.enabled:
+            self._arrivals[id(update)] = time.monotonic()
+
+    def track(self, update: object):
+        """Contexto alrededor del procesado de un update: lo graba si toca"""
+        arrival = self._arrivals.pop(id(update), None)
+        if not self.enabled or not isinstance(update, Update) or not update.effective_user:
+            return _NOOP
+        if not self._sampled(update.effective_user.id):
+            self.stats['skipped'] += 1
+            return _NOOP
+        data = self._scrub_update(update)
+        if data is None:
+            self.stats['skipped'] += 1
+            return _NOOP
+        self.stats['updates'] += 1
+        self._write({'type': 'update', 'update': data}, at=arrival)
+        return _Track(self, update.update_id)
+
+    def _pseudonym(self, real_id: int) -> int:
+        # Correlativos por orden de aparición: no se pueden deshacer sin este proceso
+        if real_id not in self._users:
+            self._users[real_id] = len(self._users) + 1
+        return self._users[real_id]
+
+    def _file_id(self, file_id: str) -> str:
+        """Mismo archivo -> mismo id, para que la reutilización de adjuntos se reproduzca"""
+        if file_id not in self._files:
+            self._files[file_id] = hashlib.blake2b(file_id.encode(), key=self._salt, digest_size=12).hexdigest()
+        return self._files[file_id]
+
+    def _user(self, user: User) -> Dict[str, Any]:
+        return {'id': self._pseudonym(user.id), 'is_bot': user.is_bot, 'first_name': 'Usuario'}
+
+    def _scrub_message(self, message: Message) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            'message_id': message.message_id,
+            'chat': {'id': self._pseudonym(message.chat.id), 'type': message.chat.type},
+        }
+        if message.from_user and not message.from_user.is_bot:
+            data['from'] = self._user(message.from_user)
+        if message.text:
+            data['text'] = scrub_text(message.text, self._salt)
+            if data['text'].startswith('/'):
+                data['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                     'length': len(data['text'].split()[0])}]
+        if message.photo:
+            data['photo'] = [
+                {'file_id': self._file_id(photo.file_id), 'file_unique_id': self._file_id(photo.file_unique_id),
+                 'width': photo.width, 'height': photo.height, 'file_size': photo.file_size}
+                for photo in message.photo
+            ]
+        if message.document:
+            document = message.document
+            data['document'] = {
+                'file_id': self._file_id(document.file_id),
+                'file_unique_id': self._file_id(document.file_unique_id),
+                'file_name': 'adjunto' + os.path.splitext(document.file_name or '')[1].lower(),
+                'mime_type': document.mime_type,
+                'file_size': document.file_size,
+            }
+        return data
+
+    def _scrub_update(self, update: Update) -> Optional[Dict[str, Any]]:
+        data: Dict[str, Any] = {'update_id': update.update_id}
+        if update.message:
+            data['message'] = self._scrub_message(update.message)
+        elif update.callback_query:
+            query = update.callback_query
+            data['callback_query'] = {
+                'id': str(update.update_id),
+                'from': self._user(query.from_user),
+                'chat_instance': '0',
+                'data': query.data,
+            }
+            if isinstance(query.message, Message):
+                data['callback_query']['message'] = self._scrub_message(query.message)
+        else:
+            # Ediciones, miembros del chat...: el bot no los atiende
+            return None
+        return data
+
+    # ============================================
+    # Backend
+    # ============================================
+    def api(self, method: str, endpoint: str, status: int, seconds: float, size: int):
+        """Llamada al backend hecha mientras se procesa un update grabado"""
+        update_id = _recording.get()
+        if update_id is None:
+            return
+        self.stats['api_calls'] += 1
+        self._write({'type': 'api', 'update_id': update_id, 'method': method,
+                     'endpoint': endpoint_template(endpoint), 'status': status,
+                     'ms': round(seconds * 1000, 2), 'bytes': size})
+
+class ArrivalQueue(asyncio.Queue):
+    """Cola de updates de la Application que avisa a la grabación de cada llegada"""
+
+    def put_nowait(self, item):
+        recorder.arrived(item)
+        super().put_nowait(item)
+
+# Instancia global de la grabación (inactiva sin RECORD_PATH)
+recorder = Recorder(RECORD_PATH, RECORD_SAMPLE_RATE)
@@ -0,0 +1,435 @@
+import asyncio
+import calendar
+import hashlib
+import heapq
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from services.api_client import RejectedError, SessionExpiredError
+from services.duplicates import duplicate_index, fingerprint_item
+from services.message_queue import outbound_queue
+from services.session_manager import session_manager
+from config import (
+    PERSISTENCE_PATH,
+    RECURRING_JITTER,
+    RECURRING_CONCURRENCY,
+    RECURRING_RETRY_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recurring (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    id_cuenta INTEGER NOT NULL,
+    cuenta_nombre TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    cantidad TEXT NOT NULL,
+    notas TEXT,
+    frecuencia TEXT NOT NULL,
+    dia INTEGER NOT NULL,
+    next_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recurring_user ON recurring (user_id);
+"""
+
+WEEKDAYS = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+WEEKDAY_NAMES = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+# Ocurrencias atrasadas que se registran como máximo de una vez por regla
+MAX_CATCH_UP = 12
+
+# Máximo que duerme el planificador sin revisar el montículo (cambios de hora)
+MAX_SLEEP = 3600
+
+def next_occurrence(frecuencia: str, dia: int, after: date) -> date:
+    """Primera fecha posterior a `after` en la que toca la regla"""
+    if frecuencia == 'semanal':
+        return after + timedelta(days=(dia - after.weekday() - 1) % 7 + 1)
+
+    year, month = after.year, after.month
+    while True:
+        day = min(dia, calendar.monthrange(year, month)[1])
+        candidate = date(year, month, day)
+        if candidate > after:
+            return candidate
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+def first_occurrence(frecuencia: str, dia: int, today: date) -> date:
+    """Primera fecha igual o posterior a hoy en la que toca la regla"""
+    return next_occurrence(frecuencia, dia, today - timedelta(days=1))
+
+def batch_key(occurrences: List[Tuple[int, str]]) -> str:
+    """Idempotency-Key de un lote: la misma para las mismas (regla, fecha) al reintentar"""
+    text = '\n'.join(f"{rule_id}:{fecha}" for rule_id, fecha in sorted(occurrences))
+    return 'recurrente-' + hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class RecurringRule:
+    __slots__ = ('id', 'user_id', 'id_cuenta', 'cuenta_nombre', 'tipo', 'cantidad',
+                 'notas', 'frecuencia', 'dia', 'next_date')
+
+    def __init__(self, id, user_id, id_cuenta, cuenta_nombre, tipo, cantidad,
+                 notas, frecuencia, dia, next_date):
+        self.id = id
+        self.user_id = user_id
+        self.id_cuenta = id_cuenta
+        self.cuenta_nombre = cuenta_nombre
+        self.tipo = tipo
+        self.cantidad = cantidad
+        self.notas = notas
+        self.frecuencia = frecuencia
+        self.dia = dia
+        self.next_date = next_date
+
+    def describe(self) -> str:
+        """Texto corto de la periodicidad"""
+        if self.frecuencia == 'semanal':
+            return f"cada {WEEKDAY_NAMES[self.dia]}"
+        return f"el día {self.dia} de cada mes"
+
+class RecurringScheduler:
+    """
+    Planificador de movimientos recurrentes.
+
+    Las reglas se guardan en SQLite y en memoria se mantiene un único
+    montículo (fecha de disparo, id de regla) atendido por una sola tarea que
+    duerme hasta el siguiente vencimiento, así el coste en reposo no depende
+    del número de reglas. Las reglas que vencen a la vez se agrupan por
+    usuario y se envían en una sola petición a /movements/import.
+
+    Cada usuario tiene un desfase fijo dentro de `jitter` segundos: sus
+    reglas vencen juntas (una petición por usuario) pero los usuarios se
+    reparten en la ventana en vez de coincidir todos a medianoche del día 1.
+    """
+
+    def __init__(self, path: str, jitter: float = 3600, concurrency: int = 5,
+                 retry_delay: float = 300):
+        self.path = path
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.conn: Optional[sqlite3.Connection] = None
+
+        self.rules: Dict[int, RecurringRule] = {}
+        self._by_user: Dict[int, Set[int]] = {}
+        self._heap: List[Tuple[float, int]] = []
+        # Reglas vencidas de usuarios sin sesión, a la espera de su próximo login
+        self._waiting: Dict[int, Set[int]] = {}
+        # Reglas que el backend ha rechazado (p. ej. cuenta eliminada): no se reintentan
+        self.paused: Set[int] = set()
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {'submitted': 0, 'requests': 0, 'waiting': 0, 'errors': 0, 'duplicates': 0,
+                      'rejected': 0}
+
+    # ============================================
+    # Almacenamiento
+    # ============================================
+    def open(self):
+        """Abre la base de datos y carga todas las reglas"""
+        if self.conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self._load()
+
+    def _load(self):
+        """Carga todas las reglas y construye el montículo en O(n)"""
+        rows = self.conn.execute(
+            'SELECT id, user_id, id_cuenta, cuenta_nombre, tipo, cantidad, notas, '
+            'frecuencia, dia, next_date FROM recurring'
+        )
+        midnights: Dict[str, float] = {}
+        for row in rows:
+            rule = RecurringRule(*row)
+            # Con miles de reglas se repiten mucho: una sola copia de cada cadena
+            rule.cuenta_nombre = sys.intern(rule.cuenta_nombre)
+            rule.tipo = sys.intern(rule.tipo)
+            rule.cantidad = sys.intern(rule.cantidad)
+            rule.frecuencia = sys.intern(rule.frecuencia)
+            rule.next_date = sys.intern(rule.next_date)
+            if rule.next_date not in midnights:
+                midnights[rule.next_date] = datetime.fromisoformat(rule.next_date).timestamp()
+
+            self.rules[rule.id] = rule
+            self._by_user.setdefault(rule.user_id, set()).add(rule.id)
+            self._heap.append((midnights[rule.next_date] + self._user_offset(rule.user_id), rule.id))
+        heapq.heapify(self._heap)
+
+    def add_rule(self, user_id: int, id_cuenta: int, cuenta_nombre: str, tipo: str,
+                 cantidad: str, notas: Optional[str], frecuencia: str, dia: int) -> RecurringRule:
+        """Crea una regla; la primera ocurrencia puede ser hoy mismo"""
+        next_date = first_occurrence(frecuencia, dia, date.today()).isoformat()
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO recurring (user_id, id_cuenta, cuenta_nombre, tipo, cantidad, '
+                'notas, frecuencia, dia, next_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (user_id, id_cuenta, cuenta_nombre, tipo, cantidad, notas, frecuencia, dia, next_date)
+            )
+        rule = RecurringRule(cursor.lastrowid, user_id, id_cuenta, cuenta_nombre, tipo,
+                             cantidad, notas, frecuencia, dia, next_date)
+        self.rules[rule.id] = rule
+        self._by_user.setdefault(user_id, set()).add(rule.id)
+        self._push(rule)
+        return rule
+
+    def delete_rule(self, user_id: int, rule_id: int) -> bool:
+        """Elimina una regla del usuario; su entrada del montículo se ignora al salir"""
+        rule = self.rules.get(rule_id)
+        if rule is None or rule.user_id != user_id:
+            return False
+        with self.conn:
+            self.conn.execute('DELETE FROM recurring WHERE id = ?', (rule_id,))
+        del self.rules[rule_id]
+        self._by_user[user_id].discard(rule_id)
+        if not self._by_user[user_id]:
+            del self._by_user[user_id]
+        self._waiting.get(user_id, set()).discard(rule_id)
+        self.paused.discard(rule_id)
+        return True
+
+    def rules_for(self, user_id: int) -> List[RecurringRule]:
+        return sorted((self.rules[rid] for rid in self._by_user.get(user_id, ())),
+                      key=lambda r: r.id)
+
+    # ============================================
+    # Montículo
+    # ============================================
+    def _user_offset(self, user_id: int) -> float:
+        """Desfase fijo del usuario dentro de la ventana de jitter"""
+        return (user_id * 2654435761 % 2 ** 32) / 2 ** 32 * self.jitter
+
+    def _fire_time(self, rule: RecurringRule) -> float:
+        midnight = datetime.fromisoformat(rule.next_date).timestamp()
+        return midnight + self._user_offset(rule.user_id)
+
+    def _push(self, rule: RecurringRule, when: Optional[float] = None):
+        when = self._fire_time(rule) if when is None else when
+        heapq.heappush(self._heap, (when, rule.id))
+        # Despertar al planificador solo si el nuevo vencimiento es el más próximo
+        if self._wakeup is not None and self._heap[0][1] == rule.id:
+            self._wakeup.set()
+
+    # ============================================
+    # Ejecución
+    # ============================================
+    def start(self):
+        """Arranca la tarea del planificador en el bucle actual"""
+        self.open()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else MAX_SLEEP
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._fire_due()
+            except Exception as e:
+                logger.error(f"Error en el planificador de recurrentes: {e}")
+
+    async def _fire_due(self):
+        """Saca todas las reglas vencidas y las envía agrupadas por usuario"""
+        now = time.time()
+        due: Dict[int, Dict[int, RecurringRule]] = {}
+
+        while self._heap and self._heap[0][0] <= now:
+            _, rule_id = heapq.heappop(self._heap)
+            rule = self.rules.get(rule_id)
+            if rule is None:
+                continue  # regla eliminada
+            due.setdefault(rule.user_id, {})[rule_id] = rule
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def submit(user_id: int, rules: List[RecurringRule]):
+            async with semaphore:
+                await self._submit(user_id, rules)
+
+        await asyncio.gather(*(submit(uid, list(rules.values())) for uid, rules in due.items()))
+
+    def _occurrences(self, rule: RecurringRule, now: float) -> Tuple[List[str], str]:
+        """Fechas vencidas de la regla y la siguiente fecha pendiente"""
+        dates = []
+        current = date.fromisoformat(rule.next_date)
+        offset = self._user_offset(rule.user_id)
+        while (datetime.combine(current, datetime.min.time()).timestamp() + offset <= now
+               and len(dates) < MAX_CATCH_UP):
+            dates.append(current.isoformat())
+            current = next_occurrence(rule.frecuencia, rule.dia, current)
+        # Si hubo más atrasos que MAX_CATCH_UP se salta hasta la próxima fecha futura
+        while datetime.combine(current, datetime.min.time()).timestamp() + offset <= now:
+            current = next_occurrence(rule.frecuencia, rule.dia, current)
+        return dates, current.isoformat()
+
+    async def _submit(self, user_id: int, rules: List[RecurringRule]):
+        """Registra en una sola petición los movimientos vencidos de un usuario"""
+        session = session_manager.get_session(user_id)
+        if not session:
+            self._hold(user_id, rules)
+            return
+
+        now = time.time()
+        items, occurrences, advanced = [], [], []
+        for rule in rules:
+            dates, following = self._occurrences(rule, now)
+            for fecha in dates:
+                occurrences.append((rule.id, fecha))
+                items.append({
+                    'id_cuenta': rule.id_cuenta,
+                    'tipo': rule.tipo,
+                    'cantidad': rule.cantidad,
+                    'notas': rule.notas,
+                    'fecha_movimiento': f"{fecha} 00:00:00",
+                })
+            advanced.append((rule, following))
+
+        if not items:
+            # Nada vencido todavía (p. ej. tras un login): se replanifica sin petición
+            for rule in rules:
+                self._push(rule)
+            return
+
+        # Ocurrencias ya registradas (p. ej. a mano desde la web) no se vuelven a importar
+        flags = await asyncio.to_thread(duplicate_index.duplicates, user_id, items)
+        skipped = sum(flags)
+        items = [item for item, duplicate in zip(items, flags) if not duplicate]
+        occurrences = [occurrence for occurrence, duplicate in zip(occurrences, flags) if not duplicate]
+        self.stats['duplicates'] += skipped
+        if not items:
+            self._advance(advanced)
+            outbound_queue.send(
+                user_id,
+                f"🔁 {skipped} movimiento(s) recurrente(s) ya estaban registrados; no se han duplicado."
+            )
+            return
+
+        # Si el backend registra el lote pero la respuesta se pierde, el reintento lleva
+        # la misma clave y no lo duplica
+        try:
+            self.stats['requests'] += 1
+            response = await asyncio.to_thread(
+                session['api_client'].import_movements, items, batch_key(occurrences)
+            )
+        except SessionExpiredError:
+            self._hold(user_id, rules)
+            return
+        except RejectedError as e:
+            if e.status_code != 409:
+                self._pause(user_id, rules, e)
+                return
+            # 409: el mismo lote sigue en curso en el backend
+            self._retry(user_id, rules, e)
+            return
+        except Exception as e:
+            # Backend caído (BackendUnavailableError) o error de transporte
+            self._retry(user_id, rules, e)
+            return
+
+        self._advance(advanced)
+        await asyncio.to_thread(duplicate_index.add, user_id, [fingerprint_item(item) for item in items])
+
+        data = response.get('data') or {}
+        imported = data.get('imported', len(items))
+        self.stats['submitted'] += imported
+        message = f"🔁 Se han registrado {imported} movimiento(s) recurrente(s)."
+        if skipped:
+            message += f"\nℹ️ {skipped} ya estaban registrados y no se han duplicado."
+        if data.get('errors'):
+            message += f"\n⚠️ {len(data['errors'])} no se pudieron registrar."
+        outbound_queue.send(user_id, message)
+
+    def _advance(self, advanced: List[Tuple[RecurringRule, str]]):
+        """Guarda la siguiente fecha de cada regla y las vuelve a planificar"""
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE recurring SET next_date = ? WHERE id = ?',
+                [(following, rule.id) for rule, following in advanced]
+            )
+        for rule, following in advanced:
+            rule.next_date = following
+            self._push(rule)
+
+    def _retry(self, user_id: int, rules: List[RecurringRule], error: Exception):
+        """Vuelve a planificar las reglas dentro de `retry_delay` segundos"""
+        self.stats['errors'] += 1
+        logger.warning(f"No se pudieron registrar los recurrentes de {user_id}: {error}")
+        retry_at = time.time() + self.retry_delay
+        for rule in rules:
+            self._push(rule, retry_at)
+
+    def _pause(self, user_id: int, rules: List[RecurringRule], error: RejectedError):
+        """Saca del montículo las reglas que el backend rechaza y avisa al usuario"""
+        self.stats['rejected'] += len(rules)
+        self.paused.update(rule.id for rule in rules)
+        logger.warning(f"El backend ha rechazado los recurrentes {[rule.id for rule in rules]} de {user_id}: {error}")
+        ids = ', '.join(str(rule.id) for rule in rules)
+        outbound_queue.send(
+            user_id,
+            f"⚠️ El servidor ha rechazado los movimientos recurrentes {ids} ({error.status_code}), "
+            f"p. ej. porque la cuenta ya no existe.\n"
+            f"Quedan pausados: bórralos con /recurrente borrar <id> y vuelve a crearlos."
+        )
+
+    def _hold(self, user_id: int, rules: List[RecurringRule]):
+        """Aparca las reglas vencidas hasta que el usuario inicie sesión"""
+        waiting = self._waiting.setdefault(user_id, set())
+        first_notice = not waiting
+        waiting.update(rule.id for rule in rules)
+        self.stats['waiting'] = sum(len(ids) for ids in self._waiting.values())
+
+        if first_notice and outbound_queue.bot is not None:
+            outbound_queue.send(
+                user_id,
+                "🔁 Tienes movimientos recurrentes pendientes de registrar.\n"
+                "Usa /login y se registrarán automáticamente."
+            )
+
+    def release(self, user_id: int):
+        """Vuelve a planificar ya las reglas aparcadas de un usuario (tras el login)"""
+        waiting = self._waiting.pop(user_id, None)
+        if not waiting:
+            return
+        now = time.time()
+        for rule_id in waiting:
+            if rule_id in self.rules:
+                self._push(self.rules[rule_id], now)
+        self.stats['waiting'] = sum(len(ids) for ids in self._waiting.values())
+
+# Instancia global del planificador de recurrentes
+recurring_scheduler = RecurringScheduler(
+    PERSISTENCE_PATH,
+    jitter=RECURRING_JITTER,
+    concurrency=RECURRING_CONCURRENCY,
+    retry_delay=RECURRING_RETRY_DELAY
+)
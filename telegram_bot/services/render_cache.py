@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+from config import RENDER_CACHE_ENTRIES, RENDER_CACHE_BYTES
+
+class RenderCache:
+    """
+    Mensajes ya formateados, indexados por (usuario, comando, argumentos, versión).
+
+    La versión la forman la huella del contenido que devolvió el backend
+    (la misma mientras responda 304), el contador de escrituras del cliente
+    del usuario y, si el mensaje los usa, las versiones de los catálogos.
+    Si nada de eso cambia, el texto es el mismo y se reutiliza sin volver a
+    construir los modelos ni formatear. Se descartan los menos usados
+    cuando se superan `max_entries` mensajes o `max_bytes` de texto.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple, Tuple[str, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(user_id: int, command: str, args: Hashable, *version: Hashable) -> Tuple:
+        return (user_id, command, args, version)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key: Tuple, text: str):
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (text, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.stats['evictions'] += 1
+
+    def size(self) -> Tuple[int, int]:
+        """(mensajes, bytes de texto)"""
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def hit_rate(self) -> float:
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+# Instancia global de la caché de mensajes
+render_cache = RenderCache(RENDER_CACHE_ENTRIES, RENDER_CACHE_BYTES)
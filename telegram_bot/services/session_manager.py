@@ -1,42 +1,114 @@
-from typing import Dict, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 from services.api_client import APIClient
+from services.models import Account
+from utils.account_index import AccountIndex
+
+# Segundos entre escrituras de la última actividad de una sesión en el almacén
+ACTIVITY_PERSIST_INTERVAL = 60
 
 class SessionManager:
     """Gestor de sesiones de usuarios en el bot"""
     
     def __init__(self):
         self.sessions: Dict[int, Dict] = {}
+        self.store = None
+    
+    def attach_store(self, store):
+        """Asocia un almacén persistente para que las sesiones sobrevivan a reinicios"""
+        self.store = store
     
     def create_session(self, user_id: int, token: str, user_data: Dict):
         """Crea una nueva sesión"""
+        now = time.time()
         self.sessions[user_id] = {
             'token': token,
             'user': user_data,
-            'api_client': APIClient(token)
+            'api_client': APIClient(token),
+            'last_activity': now,
+            'persisted_activity': now
         }
+        if self.store:
+            self.store.save_session(user_id, token, user_data, now)
     
     def get_session(self, user_id: int) -> Optional[Dict]:
-        """Obtiene la sesión de un usuario"""
-        return self.sessions.get(user_id)
+        """Obtiene la sesión de un usuario (cargándola del almacén si hace falta)"""
+        session = self.sessions.get(user_id)
+        
+        if session is None and self.store:
+            stored = self.store.load_session(user_id)
+            if stored:
+                token, user_data, last_activity = stored
+                session = {
+                    'token': token,
+                    'user': user_data,
+                    'api_client': APIClient(token),
+                    'last_activity': last_activity,
+                    'persisted_activity': last_activity
+                }
+                self.sessions[user_id] = session
+        
+        return session
     
     def get_api_client(self, user_id: int) -> Optional[APIClient]:
         """Obtiene el cliente API de un usuario"""
         session = self.get_session(user_id)
-        return session['api_client'] if session else None
+        if not session:
+            return None
+        now = time.time()
+        session['last_activity'] = now
+        if self.store and now - session['persisted_activity'] > ACTIVITY_PERSIST_INTERVAL:
+            # La caducidad en el backend se mide desde la última petición: sobrevive a reinicios
+            self.store.touch_session(user_id, now)
+            session['persisted_activity'] = now
+        return session['api_client']
     
     def is_logged_in(self, user_id: int) -> bool:
         """Verifica si un usuario tiene sesión activa"""
-        return user_id in self.sessions
+        return self.get_session(user_id) is not None
     
     def delete_session(self, user_id: int):
         """Elimina la sesión de un usuario"""
         if user_id in self.sessions:
             del self.sessions[user_id]
+        if self.store:
+            self.store.delete_session(user_id)
     
     def get_user_data(self, user_id: int) -> Optional[Dict]:
         """Obtiene los datos del usuario"""
         session = self.get_session(user_id)
         return session['user'] if session else None
+    
+    def cache_accounts(self, user_id: int, accounts: List[Account]):
+        """Guarda la lista de cuentas del usuario junto con su índice de nombres"""
+        session = self.get_session(user_id)
+        if session:
+            session['account_index'] = AccountIndex(accounts)
+            session['accounts_cached_at'] = time.time()
+    
+    def get_account_index(self, user_id: int, max_age: float) -> Optional[AccountIndex]:
+        """Índice de cuentas del usuario si existe y no es más antiguo que max_age"""
+        session = self.get_session(user_id)
+        if not session or 'account_index' not in session:
+            return None
+        if time.time() - session['accounts_cached_at'] > max_age:
+            return None
+        return session['account_index']
+    
+    def drop_if_expired(self, user_id: int) -> bool:
+        """Elimina la sesión si el backend ha rechazado su token en alguna petición"""
+        session = self.sessions.get(user_id)
+        if session is None or not session['api_client'].expired:
+            return False
+        self.delete_session(user_id)
+        return True
+    
+    def users_by_activity(self) -> List[Tuple[int, float]]:
+        """(usuario, última actividad) de las sesiones en memoria y guardadas, de más a menos recientes"""
+        activity = self.store.session_activity() if self.store else {}
+        for user_id, session in self.sessions.items():
+            activity[user_id] = session['last_activity']
+        return sorted(activity.items(), key=lambda item: item[1], reverse=True)
 
 # Instancia global del gestor de sesiones
 session_manager = SessionManager()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.api_client import SessionExpiredError
+from services.message_queue import outbound_queue, reply
+from services.session_manager import session_manager
+from config import (
+    SESSION_VALIDATION_BATCH,
+    SESSION_VALIDATION_CONCURRENCY,
+    SESSION_MAX_IDLE
+)
+
+logger = logging.getLogger(__name__)
+
+SESSION_EXPIRED_NOTICE = (
+    "🔒 Tu sesión ha expirado.\n"
+    "Usa /login para volver a iniciar sesión."
+)
+
+class SessionValidator:
+    """
+    Valida en segundo plano los tokens de las sesiones abiertas.
+
+    En cada ejecución se revisan como máximo `batch_size` sesiones, empezando
+    por los usuarios más recientemente activos, con un máximo de `concurrency`
+    peticiones simultáneas a /auth/validate. Se recorren también las sesiones
+    guardadas que aún no se han cargado en memoria, con su última actividad
+    guardada. Las sesiones inactivas durante más de `max_idle` segundos ya han
+    caducado en el backend y se descartan sin consultarle (validarlas las
+    renovaría).
+    """
+
+    def __init__(self, batch_size: int = 50, concurrency: int = 5,
+                 min_recheck: float = 600, max_idle: float = 7200):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.min_recheck = min_recheck
+        self.max_idle = max_idle
+        self._last_checked: Dict[int, float] = {}
+        self.stats = {
+            'validated': 0,
+            'pruned': 0,
+            'errors': 0,
+        }
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: valida un lote de sesiones"""
+        now = time.time()
+        batch = []
+
+        for user_id, last_activity in session_manager.users_by_activity():
+            if now - last_activity > self.max_idle:
+                self._prune(user_id)
+                continue
+
+            if now - self._last_checked.get(user_id, 0) < self.min_recheck:
+                continue
+
+            session = session_manager.get_session(user_id)
+            if not session:
+                continue
+            batch.append((user_id, session))
+            if len(batch) >= self.batch_size:
+                break
+
+        if not batch:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def validate(user_id: int, session: Dict):
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(session['api_client'].validate_session)
+                    self._last_checked[user_id] = time.time()
+                    self.stats['validated'] += 1
+                except SessionExpiredError:
+                    self._prune(user_id)
+                except Exception as e:
+                    # Error de conexión: no es motivo para descartar la sesión
+                    self.stats['errors'] += 1
+                    logger.warning(f"No se pudo validar la sesión de {user_id}: {e}")
+
+        await asyncio.gather(*(validate(uid, s) for uid, s in batch))
+
+        logger.info(
+            f"Sesiones validadas: {self.stats['validated']} - "
+            f"descartadas: {self.stats['pruned']} - errores: {self.stats['errors']}"
+        )
+
+    async def expire_rejected(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Tras cada update: si el backend rechazó el token del usuario, se descarta su sesión"""
+        user = update.effective_user
+        if user is None or not session_manager.drop_if_expired(user.id):
+            return
+        self._last_checked.pop(user.id, None)
+        self.stats['pruned'] += 1
+        await reply(update, SESSION_EXPIRED_NOTICE)
+
+    def _prune(self, user_id: int):
+        """Elimina una sesión inválida y avisa al usuario una sola vez"""
+        if not session_manager.is_logged_in(user_id):
+            return
+
+        session_manager.delete_session(user_id)
+        self._last_checked.pop(user_id, None)
+        self.stats['pruned'] += 1
+        # Por la cola de salida, como el resto de avisos sin update
+        outbound_queue.send(user_id, SESSION_EXPIRED_NOTICE)
+
+# Instancia global del validador de sesiones
+session_validator = SessionValidator(
+    batch_size=SESSION_VALIDATION_BATCH,
+    concurrency=SESSION_VALIDATION_CONCURRENCY,
+    max_idle=SESSION_MAX_IDLE
+)
@@ -0,0 +1,131 @@
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.session_manager import session_manager
+from config import USER_DATA_MAX_IDLE, USER_DATA_MAX_BYTES, ACCOUNT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Claves de user_data que solo tienen sentido durante una conversación
+TRANSIENT_KEYS = ('username', 'user_id_2fa', 'accounts', 'delete_movement_id')
+TRANSIENT_PREFIXES = ('new_movement_',)
+
+def is_transient(key: str) -> bool:
+    return key in TRANSIENT_KEYS or key.startswith(TRANSIENT_PREFIXES)
+
+def clear_transient(user_data: Dict[str, Any], prefix: Optional[str] = None) -> int:
+    """Elimina las claves temporales (o solo las que empiezan por prefix) y devuelve cuántas"""
+    keys = [key for key in user_data
+            if is_transient(key) and (prefix is None or key.startswith(prefix))]
+    for key in keys:
+        del user_data[key]
+    return len(keys)
+
+class StateSweeper:
+    """
+    Recolector del estado por usuario que se queda en memoria.
+
+    Las conversaciones abandonadas dejan en user_data el nombre de usuario
+    del login, la lista de cuentas o el movimiento a medias. En cada pasada
+    se eliminan las claves temporales de los usuarios inactivos durante más
+    de `max_idle` segundos (más que el timeout de las conversaciones, así que
+    ninguna sigue viva) y de los que superan `max_bytes`; si su user_data se
+    queda vacío se suelta entero. También se descartan las cachés de cuentas
+    caducadas de las sesiones.
+
+    El tamaño de cada usuario es el de su user_data serializado, que la
+    persistencia ya conoce sin volver a serializar nada.
+    """
+
+    def __init__(self, max_idle: float = 3600, max_bytes: int = 65536, account_ttl: float = 600):
+        self.max_idle = max_idle
+        self.max_bytes = max_bytes
+        self.account_ttl = account_ttl
+        self._last_seen: Dict[int, float] = {}
+        self.stats = {'runs': 0, 'keys_evicted': 0, 'users_dropped': 0,
+                      'over_cap': 0, 'account_caches': 0}
+
+    async def touch(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Handler del grupo -1: anota la última actividad de cada usuario"""
+        if isinstance(update, Update) and update.effective_user:
+            self._last_seen[update.effective_user.id] = time.monotonic()
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: una pasada del recolector"""
+        application = context.application
+        persistence = application.persistence
+        now = time.monotonic()
+        self.stats['runs'] += 1
+
+        for user_id, user_data in list(application.user_data.items()):
+            # Sin actividad anotada (p. ej. datos creados desde un job): cuenta desde ahora
+            idle = now - self._last_seen.setdefault(user_id, now) > self.max_idle
+            size = persistence.user_data_size(user_id) if persistence else 0
+            over_cap = size > self.max_bytes
+
+            if over_cap:
+                self.stats['over_cap'] += 1
+                logger.warning(f"user_data de {user_id} ocupa {size} bytes (máximo {self.max_bytes})")
+            if not (idle or over_cap):
+                continue
+
+            evicted = clear_transient(user_data)
+            self.stats['keys_evicted'] += evicted
+            if not user_data:
+                application.drop_user_data(user_id)
+                self._last_seen.pop(user_id, None)
+                self.stats['users_dropped'] += 1
+            elif evicted:
+                # Cambios hechos fuera de un update: hay que pedir que se guarden
+                application.mark_data_for_update_persistence(user_ids=user_id)
+
+        for session in session_manager.sessions.values():
+            cached_at = session.get('accounts_cached_at')
+            if cached_at is not None and time.time() - cached_at > self.account_ttl:
+                session.pop('account_index', None)
+                session.pop('accounts_cached_at', None)
+                self.stats['account_caches'] += 1
+
+        # Usuarios que ya no tienen nada en memoria
+        for user_id in [uid for uid in self._last_seen
+                        if now - self._last_seen[uid] > self.max_idle
+                        and uid not in application.user_data]:
+            del self._last_seen[user_id]
+
+    def report(self, application) -> Dict[str, Any]:
+        """Resumen de memoria para /admin memoria"""
+        persistence = application.persistence
+        sizes: List[Tuple[int, int]] = []
+        for user_id in application.user_data:
+            size = persistence.user_data_size(user_id) if persistence else 0
+            sizes.append((size, user_id))
+        sizes.sort(reverse=True)
+
+        return {
+            'users': len(sizes),
+            'user_data_bytes': sum(size for size, _ in sizes),
+            'top': sizes[:5],
+            'sessions': len(session_manager.sessions),
+            'account_caches': sum('account_index' in s for s in session_manager.sessions.values()),
+            'last_seen': len(self._last_seen),
+            'rss_bytes': _rss_bytes(),
+            'stats': dict(self.stats),
+        }
+
+def _rss_bytes() -> Optional[int]:
+    """Memoria residente del proceso (solo Linux; None si no se puede leer)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+# Instancia global del recolector de estado
+state_sweeper = StateSweeper(USER_DATA_MAX_IDLE, USER_DATA_MAX_BYTES, ACCOUNT_CACHE_TTL)
@@ -0,0 +1,187 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from telegram import Update
+from telegram.ext import Application
+from services.recorder import recorder
+from config import TRACE_SAMPLE_RATE
+
+logger = logging.getLogger('trace')
+
+class Trace:
+    """Traza de un update: id que se propaga al backend y decisión de muestreo"""
+    __slots__ = ('trace_id', 'sampled')
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar('span', default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+class _Span:
+    """
+    Tramo con duración medido con perf_counter.
+
+    Al cerrarse se emite un registro JSON por el logger 'trace'. Los
+    contextvars viajan a los hilos de asyncio.to_thread, así que las
+    llamadas al APIClient quedan enlazadas con el update que las originó.
+    """
+    __slots__ = ('name', 'attrs', 'trace', 'new_trace', 'span_id', 'parent_id',
+                 'start', '_trace_token', '_span_token')
+
+    def __init__(self, name: str, trace: Trace, attrs: Dict[str, Any], new_trace: bool):
+        self.name = name
+        self.attrs = attrs
+        self.trace = trace
+        self.new_trace = new_trace
+        self.span_id = os.urandom(4).hex()
+
+    def set(self, **attrs):
+        """Añade atributos al tramo (p. ej. el código de estado de la respuesta)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._trace_token = _current_trace.set(self.trace) if self.new_trace else None
+        self.parent_id = None if self.new_trace else _current_span.get()
+        self._span_token = _current_span.set(self.span_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        record = {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'duration_ms': round(duration * 1000, 2),
+            'status': 'error' if exc_type else 'ok',
+        }
+        if exc_type:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        record.update(self.attrs)
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+        _current_span.reset(self._span_token)
+        if self._trace_token is not None:
+            _current_trace.reset(self._trace_token)
+        return False
+
+class _NoopSpan:
+    """Tramo de una traza no muestreada: no mide ni registra nada"""
+    __slots__ = ('trace', '_token')
+
+    def __init__(self, trace: Optional[Trace] = None):
+        self.trace = trace
+        self._token = None
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        # Una traza no muestreada también fija su id: se propaga al backend y a los logs
+        if self.trace is not None:
+            self._token = _current_trace.set(self.trace)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current_trace.reset(self._token)
+        return False
+
+_NOOP = _NoopSpan()
+
+def start_trace(name: str, **attrs):
+    """Abre una traza nueva (muestreada con probabilidad TRACE_SAMPLE_RATE)"""
+    trace = Trace(os.urandom(8).hex(), random.random() < TRACE_SAMPLE_RATE)
+    if not trace.sampled:
+        return _NoopSpan(trace)
+    return _Span(name, trace, attrs, new_trace=True)
+
+def resume(trace: Optional[Trace], name: str, **attrs):
+    """Abre un tramo dentro de una traza capturada antes (p. ej. al encolar un mensaje)"""
+    if trace is None or not trace.sampled:
+        return _NOOP
+    return _Span(name, trace, attrs, new_trace=_current_trace.get() is not trace)
+
+def span(name: str, **attrs):
+    """Abre un tramo hijo en la traza actual; no hace nada si no hay traza muestreada"""
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        return _NOOP
+    return _Span(name, trace, attrs, new_trace=False)
+
+def _describe(update: object) -> Dict[str, Any]:
+    """Atributos del tramo raíz: tipo de update, comando y usuario"""
+    if not isinstance(update, Update):
+        return {'kind': type(update).__name__}
+    attrs: Dict[str, Any] = {'update_id': update.update_id}
+    if update.effective_user:
+        attrs['user_id'] = update.effective_user.id
+    message = update.effective_message
+    if update.callback_query:
+        attrs['kind'] = 'callback'
+    elif message and message.text and message.text.startswith('/'):
+        attrs['kind'] = 'command'
+        attrs['command'] = message.text.split()[0].split('@')[0]
+    else:
+        attrs['kind'] = 'message'
+    return attrs
+
+class TracedApplication(Application):
+    """Application que abre una traza por update alrededor de sus handlers (y lo graba si toca)"""
+
+    async def process_update(self, update: object) -> None:
+        with start_trace('update', **_describe(update)), recorder.track(update):
+            await super().process_update(update)
+
+# ============================================
+# Logging no bloqueante
+# ============================================
+class TraceIdFilter(logging.Filter):
+    """Añade el trace id actual a todos los registros (o '-' si no hay)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or '-'
+        return True
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Envía todos los registros a una cola que vacía un hilo aparte.
+
+    El formateo y la escritura en stderr salen del bucle de eventos; quien
+    registra solo hace un put en la cola. Devuelve el listener para pararlo
+    al salir y no perder lo que quede en cola.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+    ))
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # El trace id se toma en el hilo que registra, antes de pasar a la cola
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from telegram.ext import ContextTypes
+from services.api_client import (
+    APIClient,
+    BackendUnavailableError,
+    NotFoundError,
+    RejectedError,
+    SessionExpiredError
+)
+from services.message_queue import outbound_queue
+from services.session_manager import session_manager
+from config import (
+    PERSISTENCE_PATH,
+    JOURNAL_FILES_DIR,
+    JOURNAL_BATCH_SIZE,
+    JOURNAL_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    file_path TEXT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS journal_user ON journal (user_id, seq);
+"""
+
+def new_idempotency_key() -> str:
+    return uuid.uuid4().hex
+
+class WriteJournal:
+    """
+    Diario persistente de escrituras que no se pudieron enviar.
+
+    Si el backend no está disponible, las creaciones y eliminaciones se
+    guardan en SQLite (synchronous=FULL: sobreviven a un corte en cuanto se
+    confirma al usuario) y se reenvían en orden cuando /health responde.
+    Cada entrada lleva su Idempotency-Key: si el bot se cae entre el envío y
+    el borrado de la entrada, el reenvío no duplica el movimiento. Las
+    eliminaciones son idempotentes por sí mismas (un 404 al repetir = hecho).
+
+    Una entrada solo se descarta si el backend la rechaza con un 4xx
+    definitivo (validación, permisos). Un 409 (la petición original con esa
+    clave aún no ha terminado), un error de transporte o un fallo local
+    (p. ej. al leer el adjunto) la dejan en el diario y se reintenta en el
+    siguiente ciclo, sin adelantar las posteriores del mismo usuario.
+    """
+
+    def __init__(self, path: str, files_dir: str, batch_size: int = 50, concurrency: int = 4):
+        self.path = path
+        self.files_dir = files_dir
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.conn: Optional[sqlite3.Connection] = None
+        self.size = 0
+        self._replaying = False
+        self.stats = {'queued': 0, 'replayed': 0, 'failed': 0, 'retried': 0, 'health_checks': 0}
+
+    def open(self):
+        """Abre el diario y elimina adjuntos huérfanos de un cierre a medias"""
+        if self.conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(self.files_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+        self.size = self.conn.execute('SELECT COUNT(*) FROM journal').fetchone()[0]
+
+        referenced = {row[0] for row in self.conn.execute(
+            'SELECT file_path FROM journal WHERE file_path IS NOT NULL')}
+        for name in os.listdir(self.files_dir):
+            path = os.path.join(self.files_dir, name)
+            if path not in referenced:
+                os.remove(path)
+
+    # ============================================
+    # Encolado
+    # ============================================
+    def append(self, user_id: int, op: str, payload: Dict[str, Any],
+               file_path: Optional[str] = None, idempotency_key: Optional[str] = None) -> int:
+        """Guarda una escritura pendiente y devuelve su número de secuencia"""
+        self.open()
+        key = idempotency_key or new_idempotency_key()
+
+        stored_file = None
+        if file_path:
+            # El adjunto temporal se borra al acabar la conversación: se guarda una copia
+            extension = os.path.splitext(file_path)[1]
+            stored_file = os.path.join(self.files_dir, f"{key}{extension}")
+            shutil.copyfile(file_path, stored_file)
+
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO journal (user_id, op, payload, file_path, idempotency_key, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (user_id, op, json.dumps(payload), stored_file, key, time.time())
+            )
+        self.size += 1
+        self.stats['queued'] += 1
+        return cursor.lastrowid
+
+    def pending(self, user_id: int) -> List[Dict[str, Any]]:
+        """Escrituras pendientes de un usuario, en orden"""
+        if not self.size:
+            return []
+        rows = self.conn.execute(
+            'SELECT seq, op, payload, file_path, created_at, attempts FROM journal '
+            'WHERE user_id = ? ORDER BY seq', (user_id,)
+        )
+        return [
+            {'seq': seq, 'op': op, 'payload': json.loads(payload), 'file_path': file_path,
+             'created_at': created_at, 'attempts': attempts}
+            for seq, op, payload, file_path, created_at, attempts in rows
+        ]
+
+    def _remove(self, seq: int, file_path: Optional[str]):
+        with self.conn:
+            self.conn.execute('DELETE FROM journal WHERE seq = ?', (seq,))
+        self.size -= 1
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+    # ============================================
+    # Reenvío
+    # ============================================
+    async def replay(self, context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: reenvía la cola si el backend vuelve a responder"""
+        if not self.size or self._replaying:
+            return
+
+        self._replaying = True
+        try:
+            self.stats['health_checks'] += 1
+            if not await asyncio.to_thread(APIClient().health):
+                return
+
+            skipped = set()
+            while self.size:
+                batch = self._next_batch(skipped)
+                if not batch:
+                    break
+                if not await self._replay_batch(batch, skipped):
+                    break  # el backend ha vuelto a caer
+        finally:
+            self._replaying = False
+
+    def _next_batch(self, skipped: set) -> Dict[int, List[tuple]]:
+        """Siguientes entradas agrupadas por usuario (el orden se respeta dentro de cada uno)"""
+        placeholders = ','.join('?' * len(skipped))
+        where = f'WHERE user_id NOT IN ({placeholders})' if skipped else ''
+        rows = self.conn.execute(
+            f'SELECT seq, user_id, op, payload, file_path, idempotency_key FROM journal '
+            f'{where} ORDER BY seq LIMIT ?', (*skipped, self.batch_size)
+        ).fetchall()
+
+        batch: Dict[int, List[tuple]] = {}
+        for row in rows:
+            batch.setdefault(row[1], []).append(row)
+        return batch
+
+    async def _replay_batch(self, batch: Dict[int, List[tuple]], skipped: set) -> bool:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unavailable = False
+
+        async def replay_user(user_id: int, entries: List[tuple]):
+            nonlocal unavailable
+            async with semaphore:
+                session = session_manager.get_session(user_id)
+                if not session:
+                    # Sin sesión no se puede enviar nada: se intentará tras su próximo login
+                    skipped.add(user_id)
+                    return
+
+                api = session['api_client']
+                done, errors = 0, []
+                for seq, _, op, payload, file_path, key in entries:
+                    if unavailable:
+                        break
+                    try:
+                        await asyncio.to_thread(self._apply, api, op, json.loads(payload), file_path, key)
+                        self._remove(seq, file_path)
+                        done += 1
+                    except BackendUnavailableError:
+                        unavailable = True
+                        self._bump_attempts(seq)
+                    except SessionExpiredError:
+                        skipped.add(user_id)
+                        break
+                    except RejectedError as e:
+                        if e.status_code == 409:
+                            # La petición original con esta clave sigue en curso
+                            self._retry_later(seq, user_id, skipped, e)
+                            break
+                        # Rechazado por el backend (validación): no se puede reenviar tal cual
+                        logger.warning(f"Escritura pendiente {seq} de {user_id} rechazada: {e}")
+                        self._remove(seq, file_path)
+                        self.stats['failed'] += 1
+                        errors.append(f"#{seq}: {e}")
+                    except Exception as e:
+                        # Transporte o fallo local: no se sabe si se registró, se repite con la misma clave
+                        self._retry_later(seq, user_id, skipped, e)
+                        break
+
+                self.stats['replayed'] += done
+                self._notify(user_id, done, errors)
+
+        await asyncio.gather(*(replay_user(uid, entries) for uid, entries in batch.items()))
+        return not unavailable
+
+    @staticmethod
+    def _apply(api: APIClient, op: str, payload: Dict[str, Any], file_path: Optional[str], key: str):
+        if op == 'create':
+            api.create_movement(payload, file_path, idempotency_key=key)
+        elif op == 'delete':
+            try:
+                api.delete_movement(payload['id'])
+            except NotFoundError:
+                pass  # ya eliminado (p. ej. reenvío tras una caída del bot)
+        else:
+            raise ValueError(f"Operación desconocida: {op}")
+
+    def _retry_later(self, seq: int, user_id: int, skipped: set, error: Exception):
+        """Deja la entrada (y las siguientes del usuario) para el próximo ciclo"""
+        logger.warning(f"Escritura pendiente {seq} de {user_id} no enviada, se reintentará: {error}")
+        self._bump_attempts(seq)
+        self.stats['retried'] += 1
+        skipped.add(user_id)
+
+    def _bump_attempts(self, seq: int):
+        with self.conn:
+            self.conn.execute('UPDATE journal SET attempts = attempts + 1 WHERE seq = ?', (seq,))
+
+    def _notify(self, user_id: int, done: int, errors: List[str]):
+        if not done and not errors:
+            return
+        message = ""
+        if done:
+            message += f"✅ Se han enviado {done} operación(es) pendiente(s)."
+        if errors:
+            message += ("\n\n" if message else "") + "❌ No se pudieron registrar:\n" + "\n".join(errors[:10])
+        outbound_queue.send(user_id, message)
+
+# Instancia global del diario de escrituras pendientes
+write_journal = WriteJournal(
+    PERSISTENCE_PATH,
+    JOURNAL_FILES_DIR,
+    batch_size=JOURNAL_BATCH_SIZE,
+    concurrency=JOURNAL_CONCURRENCY
+)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Prueba de rendimiento y de caídas del diario de escrituras (services/write_journal.py)
+contra el backend simulado. Uso:
+
+    python tools/journal_bench.py --users 20 --entries 2000 --latency 0.01
+
+Hace tres comprobaciones y sale con código 1 si alguna falla:
+
+1. Rendimiento: reenvía --entries creaciones (una de cada 10 con adjunto)
+   de --users usuarios y mide entradas por segundo. El backend debe
+   registrarlas todas exactamente una vez.
+2. Caída: un proceso hijo reenvía el mismo volumen y se mata con SIGKILL a
+   mitad. El diario se reabre y se termina el reenvío: ningún movimiento
+   perdido ni duplicado (las entradas ya registradas que seguían en el
+   diario se resuelven por su Idempotency-Key).
+3. Errores: un 409 (petición en curso) y un adjunto que no se puede leer
+   se quedan en el diario y se envían en el ciclo siguiente. Un 400
+   (validación) se descarta.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from stub_backend import StubState, start_stub
+
+# config.py lee API_URL al importarse: los backends simulados usan siempre este puerto
+API_PORT = int(os.getenv('JOURNAL_BENCH_PORT', '8097'))
+API_URL = f"http://127.0.0.1:{API_PORT}/api"
+os.environ.update({'API_URL': API_URL, 'API_URLS': API_URL})
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:bench')
+
+class _Message:
+    message_id = 1
+
+class _SilentBot:
+    """Los avisos a los usuarios (_notify) no salen a Telegram"""
+
+    async def send_message(self, **kwargs):
+        return _Message()
+
+    async def edit_message_text(self, **kwargs):
+        return _Message()
+
+# ============================================
+# Preparación
+# ============================================
+def login_users(state: StubState, api_url: str, users: int) -> Dict[int, str]:
+    """Crea los usuarios en el backend y devuelve {user_id: token}"""
+    import requests
+    tokens = {}
+    for i in range(users):
+        name = f"bench{i}"
+        user_id = state.add_user(name, 'bench', accounts=2, movements=0)
+        response = requests.post(f"{api_url}/auth/login", data={'nombre_usuario': name, 'contrasena': 'bench'})
+        tokens[user_id] = response.json()['data']['token']
+    return tokens
+
+def fill_journal(journal, state: StubState, tokens: Dict[int, str], entries: int, work_dir: str) -> List[str]:
+    """Encola `entries` creaciones repartidas entre los usuarios y devuelve sus claves"""
+    attachment = os.path.join(work_dir, 'ticket.jpg')
+    with open(attachment, 'wb') as f:
+        f.write(os.urandom(20 * 1024))
+
+    accounts = {}
+    for account in state.accounts.values():
+        accounts.setdefault(account['id_usuario'], account['id'])
+
+    users = list(tokens)
+    keys = []
+    for i in range(entries):
+        user_id = users[i % len(users)]
+        key = f"bench-{i}"
+        journal.append(user_id, 'create', {
+            'tipo': 'retirada', 'id_cuenta': accounts[user_id], 'cantidad': f"{i % 90 + 1}.50",
+            'notas': f"pendiente {i}",
+        }, attachment if i % 10 == 0 else None, idempotency_key=key)
+        keys.append(key)
+    return keys
+
+def open_sessions(tokens: Dict[int, str]):
+    from services.session_manager import session_manager
+    for user_id, token in tokens.items():
+        session_manager.create_session(user_id, token, {'id': user_id})
+
+def new_journal(work_dir: str, concurrency: int):
+    from services.write_journal import WriteJournal
+    journal = WriteJournal(os.path.join(work_dir, 'journal.sqlite3'), os.path.join(work_dir, 'files'),
+                           batch_size=50, concurrency=concurrency)
+    journal.open()
+    return journal
+
+async def replay(journal):
+    from services.message_queue import outbound_queue
+    outbound_queue.start(_SilentBot())
+    await journal.replay(None)
+    await outbound_queue.stop()
+
+def check_exactly_once(state: StubState, keys: List[str]) -> List[str]:
+    """Claves que el backend no ha registrado exactamente una vez"""
+    created = {key: movement_id for (_, key), movement_id in state.idempotency.items()}
+    notes = {}
+    for movement in state.movements.values():
+        if movement['notas'] and movement['notas'].startswith('pendiente '):
+            notes[movement['notas']] = notes.get(movement['notas'], 0) + 1
+    wrong = [key for key in keys if key not in created]
+    wrong += [note for note, count in notes.items() if count != 1]
+    return wrong
+
+# ============================================
+# Comprobaciones
+# ============================================
+def bench_throughput(args) -> bool:
+    state = StubState(accounts=0, movements=0)
+    server, _ = start_stub(API_PORT, args.latency, state)
+    work_dir = tempfile.mkdtemp(prefix='journal_bench_')
+    try:
+        tokens = login_users(state, API_URL, args.users)
+        open_sessions(tokens)
+        journal = new_journal(work_dir, args.concurrency)
+        keys = fill_journal(journal, state, tokens, args.entries, work_dir)
+
+        start = time.perf_counter()
+        asyncio.run(replay(journal))
+        elapsed = time.perf_counter() - start
+
+        wrong = check_exactly_once(state, keys)
+        ok = journal.size == 0 and not wrong
+        print(f"Rendimiento: {args.entries} entradas en {elapsed:.2f}s "
+              f"({args.entries / elapsed:.0f}/s, latencia {args.latency * 1000:.0f} ms, "
+              f"concurrencia {args.concurrency}) - quedan {journal.size}, incorrectas {len(wrong)}")
+        return ok
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def bench_crash(args) -> bool:
+    state = StubState(accounts=0, movements=0)
+    kill_after = args.entries // 2
+    child = None
+
+    def kill_child():
+        # Se mata en cuanto el backend ha registrado la mitad: hay peticiones a medias
+        while len(state.idempotency) < kill_after:
+            time.sleep(0.001)
+        child.send_signal(signal.SIGKILL)
+
+    server, _ = start_stub(API_PORT, args.latency, state)
+    work_dir = tempfile.mkdtemp(prefix='journal_bench_')
+    try:
+        tokens = login_users(state, API_URL, args.users)
+        journal = new_journal(work_dir, args.concurrency)
+        keys = fill_journal(journal, state, tokens, args.entries, work_dir)
+        journal.conn.close()
+
+        child = subprocess.Popen([sys.executable, __file__, '--child', work_dir, json.dumps(tokens),
+                                  '--concurrency', str(args.concurrency)])
+        killer = threading.Thread(target=kill_child, daemon=True)
+        killer.start()
+        child.wait()
+        killed = child.returncode == -signal.SIGKILL
+
+        journal = new_journal(work_dir, args.concurrency)
+        left = journal.size
+        already = sum(1 for (_, key) in state.idempotency
+                      if journal.conn.execute('SELECT 1 FROM journal WHERE idempotency_key = ?', (key,)).fetchone())
+        open_sessions(tokens)
+        asyncio.run(replay(journal))
+
+        wrong = check_exactly_once(state, keys)
+        ok = killed and journal.size == 0 and not wrong
+        print(f"Caída: hijo {'matado' if killed else 'NO matado'} con {left} entradas en el diario "
+              f"({already} ya registradas en el backend) - tras reabrir quedan {journal.size}, "
+              f"incorrectas {len(wrong)}")
+        return ok
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def bench_errors(args) -> bool:
+    state = StubState(accounts=0, movements=0)
+    server, _ = start_stub(API_PORT, 0.0, state)
+    work_dir = tempfile.mkdtemp(prefix='journal_bench_')
+    try:
+        tokens = login_users(state, API_URL, 3)
+        open_sessions(tokens)
+        journal = new_journal(work_dir, args.concurrency)
+        (busy, unreadable, invalid) = tokens
+        accounts = {a['id_usuario']: a['id'] for a in state.accounts.values()}
+
+        def entry(user_id: int, key: str, cantidad: str = '10.00'):
+            journal.append(user_id, 'create', {'tipo': 'ingreso', 'id_cuenta': accounts[user_id],
+                                               'cantidad': cantidad, 'notas': f"pendiente {key}"},
+                           idempotency_key=key)
+
+        entry(busy, 'en-curso')
+        entry(busy, 'tras-en-curso')
+        attachment = os.path.join(work_dir, 'ticket.jpg')
+        with open(attachment, 'wb') as f:
+            f.write(b'jpg')
+        journal.append(unreadable, 'create', {'tipo': 'ingreso', 'id_cuenta': accounts[unreadable],
+                                              'cantidad': '5.00', 'notas': 'pendiente adjunto'},
+                       attachment, idempotency_key='adjunto')
+        stored = journal.pending(unreadable)[0]['file_path']
+        os.rename(stored, stored + '.tmp')
+        entry(invalid, 'invalida', cantidad='abc')
+
+        state.in_flight.add('en-curso')
+        asyncio.run(replay(journal))
+        first = journal.size
+        kept = first == 3 and journal.stats['retried'] == 2 and journal.stats['failed'] == 1
+
+        state.in_flight.clear()
+        os.rename(stored + '.tmp', stored)
+        asyncio.run(replay(journal))
+        order = [m['notas'] for m in state.movements.values() if m['id_cuenta'] == accounts[busy]]
+        in_order = order == ['pendiente en-curso', 'pendiente tras-en-curso']
+        ok = kept and journal.size == 0 and in_order
+        print(f"Errores: tras el primer ciclo quedan {first} (409 y el siguiente del mismo usuario, "
+              f"adjunto ilegible), descartadas {journal.stats['failed']} (400); "
+              f"tras el segundo quedan {journal.size}, orden {'correcto' if in_order else order}")
+        return ok
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_child(work_dir: str, tokens: str, concurrency: int):
+    open_sessions({int(k): v for k, v in json.loads(tokens).items()})
+    asyncio.run(replay(new_journal(work_dir, concurrency)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento y caídas del diario de escrituras")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--entries', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.01, help="Retardo por petición (segundos)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--child', nargs=2, metavar=('DIR', 'TOKENS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.CRITICAL)
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.concurrency)
+        return
+
+    results = [bench_throughput(args), bench_crash(args), bench_errors(args)]
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == '__main__':
+    main()
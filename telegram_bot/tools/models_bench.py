@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compara dos formas de manejar una respuesta de movimientos (services/models.py):
+
+- dicts: json.loads y convertir 'cantidad' a Decimal en cada uso, como
+  hacían los formateadores antes de los modelos
+- modelos: decode_json (orjson si está instalado) y Movement con la
+  cantidad ya convertida una sola vez
+
+Para cada una mide la decodificación, el coste de cada pasada sobre los
+movimientos (sumas por cuenta y mes, como la previsión o los duplicados) y
+la memoria que queda retenida. Uso:
+
+    python tools/models_bench.py --movements 10000 --passes 3
+
+Los tiempos dependen mucho de la máquina, de la versión de Python y de si
+está orjson: la primera línea de la salida los indica. La memoria retenida
+apenas varía.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from stub_backend import StubState
+from services.models import decode_json, movements_from_list
+
+def response_body(movements: int) -> bytes:
+    """Cuerpo de GET /movements con `movements` movimientos, como lo envía el backend"""
+    state = StubState(accounts=5, movements=movements)
+    return json.dumps({'success': True, 'message': "Movimientos obtenidos",
+                       'data': {'movimientos': list(state.movements.values()), 'total': movements}},
+                      ensure_ascii=False).encode('utf-8')
+
+# ============================================
+# Las dos variantes
+# ============================================
+def decode_dicts(body: bytes) -> List[Dict[str, Any]]:
+    return json.loads(body)['data']['movimientos']
+
+def decode_models(body: bytes) -> list:
+    return movements_from_list(decode_json(body)['data']['movimientos'])
+
+def pass_dicts(movements: List[Dict[str, Any]]) -> Dict[Tuple[int, str], Decimal]:
+    totals: Dict[Tuple[int, str], Decimal] = {}
+    for m in movements:
+        key = (int(m['id_cuenta']), m['fecha_movimiento'][:7])
+        amount = Decimal(m['cantidad'])
+        totals[key] = totals.get(key, Decimal(0)) + (amount if m['tipo'] == 'ingreso' else -amount)
+    return totals
+
+def pass_models(movements: list) -> Dict[Tuple[int, str], Decimal]:
+    totals: Dict[Tuple[int, str], Decimal] = {}
+    for m in movements:
+        key = (m.id_cuenta, m.fecha_movimiento[:7])
+        totals[key] = totals.get(key, Decimal(0)) + (m.cantidad if m.tipo == 'ingreso' else -m.cantidad)
+    return totals
+
+# ============================================
+# Medidas
+# ============================================
+def medians(repeat: int, funcs: Dict[Any, Callable[[], Any]]) -> Dict[Any, float]:
+    """
+    Mediana en ms de `repeat` ejecuciones de cada función (tras una de
+    calentamiento). Se alternan en cada ronda para que el ruido de la
+    máquina afecte por igual a todas.
+    """
+    times: Dict[Any, List[float]] = {name: [] for name in funcs}
+    for round_ in range(repeat + 1):
+        for name, func in funcs.items():
+            start = time.perf_counter()
+            func()
+            if round_:
+                times[name].append(time.perf_counter() - start)
+    return {name: statistics.median(values) * 1000 for name, values in times.items()}
+
+def retained(decode: Callable, body: bytes) -> int:
+    """Bytes que siguen ocupados mientras se guarda el resultado de decodificar"""
+    gc.collect()
+    tracemalloc.start()
+    result = decode(body)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def _decoder_name() -> str:
+    from services import models
+    return 'json' if models._loads is json.loads else 'orjson'
+
+def main():
+    parser = argparse.ArgumentParser(description="Dicts frente a modelos para las respuestas de movimientos")
+    parser.add_argument('--movements', type=int, default=10000)
+    parser.add_argument('--passes', type=int, default=3, help="Pasadas sobre los movimientos tras decodificar")
+    parser.add_argument('--repeat', type=int, default=15)
+    args = parser.parse_args()
+
+    body = response_body(args.movements)
+    assert pass_dicts(decode_dicts(body)) == pass_models(decode_models(body))
+
+    print(f"Python {platform.python_version()} ({platform.python_implementation()}), "
+          f"{platform.machine()}, {os.cpu_count()} CPU, decodificador de los modelos: {_decoder_name()}")
+    print(f"{args.movements} movimientos ({len(body) / 1024:.0f} KB), mediana de {args.repeat}")
+    print(f"{'':10}{'decodificar':>14}{'por pasada':>13}{'total ' + str(args.passes) + ' pasadas':>20}{'retenido':>12}")
+    variants = (('dicts', decode_dicts, pass_dicts), ('modelos', decode_models, pass_models))
+    funcs = {}
+    for name, decode, walk in variants:
+        decoded = decode(body)
+        funcs[(name, 'decode')] = lambda decode=decode: decode(body)
+        funcs[(name, 'pass')] = lambda walk=walk, decoded=decoded: walk(decoded)
+    timings = medians(args.repeat, funcs)
+
+    rows = {}
+    for name, decode, _ in variants:
+        decode_ms, pass_ms = timings[(name, 'decode')], timings[(name, 'pass')]
+        total = decode_ms + args.passes * pass_ms
+        size = retained(decode, body)
+        rows[name] = (decode_ms, pass_ms, total, size)
+        print(f"{name:10}{decode_ms:>11.1f} ms{pass_ms:>10.1f} ms{total:>17.1f} ms{size / 2 ** 20:>9.1f} MB")
+
+    (d_decode, d_pass, _, d_size), (m_decode, m_pass, _, m_size) = rows['dicts'], rows['modelos']
+    print(f"Decodificar en modelos: x{m_decode / d_decode:.2f} el tiempo de los dicts; "
+          f"memoria retenida {(m_size - d_size) / d_size * 100:+.0f}%")
+    if d_pass > m_pass:
+        breakeven = (m_decode - d_decode) / (d_pass - m_pass)
+        print(f"En tiempo, los modelos compensan a partir de {max(breakeven, 0):.1f} pasadas")
+    else:
+        print("En tiempo, los modelos no compensan con ningún número de pasadas")
+
+if __name__ == '__main__':
+    main()
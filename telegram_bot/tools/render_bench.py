@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Mide la caché de mensajes formateados (services/render_cache.py) contra el
+backend simulado con listas grandes. Uso:
+
+    python tools/render_bench.py --accounts 500 --movements 20000 --iterations 200
+
+Para /cuentas, /movimientos (50) y /balance mide, con el mismo código que
+los handlers:
+
+- formatear: construir los modelos y el texto a partir de la respuesta
+- acierto: leer el texto de la caché
+- GET + formatear / GET + caché: la petición condicional (304, el caso
+  habitual al repetir un comando) más cada una de las dos cosas
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from stub_backend import StubState, start_stub
+
+# config.py lee API_URL al importarse
+API_PORT = int(os.getenv('RENDER_BENCH_PORT', '8098'))
+API_URL = f"http://127.0.0.1:{API_PORT}/api"
+os.environ.update({'API_URL': API_URL, 'API_URLS': API_URL})
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:bench')
+
+from services.api_client import APIClient
+from services.catalog import tag_names
+from services.models import Summary, accounts_from_list, movements_from_list
+from services.render_cache import RenderCache
+from utils.formatters import format_accounts_list, format_movements_list, format_summary
+
+MOVEMENTS_LIMIT = 50
+
+# (comando, endpoint, parámetros, función que formatea la respuesta decodificada)
+COMMANDS: List[Tuple[str, str, Dict[str, Any], Callable[[Dict[str, Any]], str]]] = [
+    ('/cuentas', '/accounts', {},
+     lambda response: format_accounts_list(accounts_from_list(response['data']['cuentas']), tag_names())),
+    (f'/movimientos {MOVEMENTS_LIMIT}', '/movements', {'limit': MOVEMENTS_LIMIT},
+     lambda response: format_movements_list(movements_from_list(response['data']['movimientos']))),
+    ('/balance', '/accounts/summary', {},
+     lambda response: format_summary(Summary.from_dict(response['data']['summary']))),
+]
+
+def timed(iterations: int, func: Callable[[], Any]) -> float:
+    """Media en segundos de `iterations` llamadas"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+def fmt(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Formatear frente a la caché de mensajes")
+    parser.add_argument('--accounts', type=int, default=500)
+    parser.add_argument('--movements', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    server, _ = start_stub(API_PORT, 0.0, StubState(args.accounts, args.movements))
+    try:
+        token = APIClient().login('demo', 'demo')['data']['token']
+        api = APIClient(token)
+        cache = RenderCache()
+
+        print(f"{args.accounts} cuentas, {args.movements} movimientos, {args.iterations} iteraciones "
+              f"(media por llamada, backend local)")
+        print(f"{'':22}{'formatear':>12}{'acierto':>12}{'GET + formatear':>18}{'GET + caché':>14}")
+        for name, endpoint, params, render in COMMANDS:
+            response, version = api.get_versioned(endpoint, params or None)
+            key = cache.key(1, name, (), version)
+            message = render(response)
+            cache.put(key, message)
+
+            format_time = timed(args.iterations, lambda: render(response))
+            hit_time = timed(args.iterations, lambda: cache.get(key))
+
+            def uncached():
+                render(api.get_versioned(endpoint, params or None)[0])
+
+            def cached():
+                _, current = api.get_versioned(endpoint, params or None)
+                assert cache.get(cache.key(1, name, (), current)) is not None
+
+            get_format = timed(args.iterations, uncached)
+            get_cached = timed(args.iterations, cached)
+            size = len(message.encode('utf-8'))
+            label = f"{name} ({size / 1024:.0f} KB)" if size >= 1024 else f"{name} ({size} B)"
+            print(f"{label:22}{fmt(format_time):>12}{fmt(hit_time):>12}{fmt(get_format):>18}{fmt(get_cached):>14}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Reproduce una grabación de updates (RECORD_PATH) contra el backend simulado.
+
+Crea la misma Application que bot.py (build_application), sin red: las
+llamadas a la API de Telegram las contesta un request falso con un retardo
+fijo y el backend es tools/stub_backend.py, que por defecto tarda en cada
+ruta lo que tardó el backend real al grabar. Los updates se inyectan con
+el ritmo original multiplicado por --speed y se mide, por comando, el tiempo
+desde que llega cada update hasta que el bot termina de procesarlo. Uso:
+
+    RECORD_PATH=data/grabacion.jsonl python bot.py        # en producción
+    python tools/replay.py data/grabacion.jsonl --speed 10 --report antes.json
+    python tools/replay.py data/grabacion.jsonl --speed 10 --report despues.json
+    python tools/replay.py --compare antes.json despues.json
+
+Para comparar dos versiones del bot se ejecuta el replay.py de cada una
+(por ejemplo en un `git worktree`) con la misma grabación y --seed.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from telegram import Update
+from telegram.request import BaseRequest
+from stub_backend import StubState, start_stub
+
+# Updates de un comando necesarios en los dos informes para juzgar su p95
+MIN_SAMPLES = 5
+
+# ============================================
+# Grabación
+# ============================================
+def load_recording(path: str) -> Tuple[List[Dict[str, Any]], Dict[Tuple[str, str], List[float]], List[float]]:
+    """(updates con su instante, ms del backend por (método, ruta), ms de proceso en producción)"""
+    updates, backend, handled = [], defaultdict(list), []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['type'] == 'update':
+                updates.append(record)
+            elif record['type'] == 'api':
+                backend[(record['method'], record['endpoint'])].append(record['ms'])
+            elif record['type'] == 'handled':
+                handled.append(record['ms'])
+    updates.sort(key=lambda r: r['t'])
+    return updates, dict(backend), handled
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'n': 0}
+    values = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))], 2)
+
+    return {'n': len(values), 'p50': rank(0.5), 'p95': rank(0.95), 'p99': rank(0.99),
+            'max': round(values[-1], 2)}
+
+class RecordedLatency:
+    """Retardo del backend simulado: una duración grabada de la misma ruta, al azar"""
+
+    def __init__(self, timings: Dict[Tuple[str, str], List[float]], seed: int):
+        self.timings = timings
+        self.template = lambda path: path  # endpoint_template, cuando ya se puede importar el bot
+        self.fallback = sorted(ms for values in timings.values() for ms in values) or [0.0]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = defaultdict(int)
+
+    def __call__(self, method: str, path: str) -> float:
+        key = (method, self.template(path))
+        with self.lock:
+            self.requests[f"{method} {key[1]}"] += 1
+            return self.random.choice(self.timings.get(key) or self.fallback) / 1000
+
+class FixedLatency(RecordedLatency):
+    def __init__(self, seconds: float):
+        super().__init__({}, 0)
+        self.seconds = seconds
+
+    def __call__(self, method: str, path: str) -> float:
+        with self.lock:
+            self.requests[f"{method} {self.template(path)}"] += 1
+        return self.seconds
+
+# ============================================
+# API de Telegram simulada
+# ============================================
+class ReplayRequest(BaseRequest):
+    """Contesta a la API de Telegram sin red, tras `latency` segundos"""
+
+    def __init__(self, latency: float, file_sizes: Dict[str, int]):
+        self.latency = latency
+        self.file_sizes = file_sizes
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.next_message_id = 1
+        self.closed = False
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        self.closed = False
+
+    async def shutdown(self):
+        # Como HTTPXRequest: tras Application.shutdown() ya no se puede enviar
+        self.closed = True
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        if self.closed:
+            raise RuntimeError("ReplayRequest cerrado: envío después de Application.shutdown()")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if '/file/bot' in url:
+            # Descarga de un adjunto: mismo id -> mismo contenido
+            file_id = url.rsplit('/', 1)[-1]
+            self.calls['download'] += 1
+            seed = hashlib.sha256(file_id.encode()).digest()
+            size = self.file_sizes.get(file_id, 64 * 1024)
+            return 200, (seed * (size // len(seed) + 1))[:size]
+
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode()
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.next_message_id += 1
+        return {'message_id': params.get('message_id') or self.next_message_id, 'date': int(time.time()),
+                'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+                'text': params.get('text') or params.get('caption') or ''}
+
+    def _result(self, endpoint: str, params: Dict[str, Any]) -> Any:
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+        if endpoint == 'getFile':
+            file_id = params['file_id']
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': self.file_sizes.get(file_id), 'file_path': f"files/{file_id}"}
+        if endpoint == 'sendPhoto':
+            message = self._message(params)
+            file_id = f"chart{message['message_id']}"
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1000, 'height': 600}]
+            return message
+        if endpoint in ('sendMessage', 'sendDocument', 'editMessageText', 'editMessageCaption'):
+            return self._message(params)
+        if endpoint == 'getUpdates':
+            return []
+        return True
+
+# ============================================
+# Reproducción
+# ============================================
+def _label(data: Dict[str, Any]) -> str:
+    """Comando o tipo de update para agrupar las latencias"""
+    if 'callback_query' in data:
+        return 'callback:' + (data['callback_query'].get('data') or '').split(':')[0]
+    message = data.get('message', {})
+    text = message.get('text', '')
+    if text.startswith('/'):
+        return text.split()[0]
+    if 'photo' in message:
+        return 'foto'
+    if 'document' in message:
+        return 'documento'
+    return 'texto'
+
+def _file_sizes(updates: List[Dict[str, Any]]) -> Dict[str, int]:
+    sizes = {}
+    for record in updates:
+        message = record['update'].get('message', {})
+        for item in message.get('photo', []) + ([message['document']] if 'document' in message else []):
+            if item.get('file_size'):
+                sizes[item['file_id']] = item['file_size']
+    return sizes
+
+def _users(updates: List[Dict[str, Any]]) -> Dict[int, bool]:
+    """Usuario grabado -> si usó /admin (en el backend simulado será propietario)"""
+    users: Dict[int, bool] = {}
+    for record in updates:
+        update = record['update']
+        source = update.get('message') or update.get('callback_query') or {}
+        if 'from' in source:
+            admin = _label(update) in ('/admin', 'callback:alog')
+            users[source['from']['id']] = users.get(source['from']['id'], False) or admin
+    return users
+
+def create_sessions(state: StubState, updates: List[Dict[str, Any]], accounts: int, movements: int):
+    """Un usuario del backend simulado por cada usuario grabado, ya con sesión en el bot"""
+    from services.session_manager import session_manager
+
+    for user_id, admin in sorted(_users(updates).items()):
+        backend_id = state.add_user(f"replay{user_id}", 'replay', accounts, movements,
+                                    rol='propietario' if admin else 'usuario')
+        token = uuid.uuid4().hex
+        state.tokens[token] = backend_id
+        user = {k: v for k, v in state.users[backend_id].items() if k != 'contrasena'}
+        session_manager.create_session(user_id, token, user)
+
+async def replay(args, updates: List[Dict[str, Any]], request, state: StubState) -> Dict[str, Any]:
+    from bot import build_application
+    from services.message_queue import outbound_queue
+
+    application = build_application(request=request)
+    create_sessions(state, updates, args.accounts, args.movements)
+
+    arrived: Dict[int, Tuple[str, float]] = {}
+    latency: Dict[str, List[float]] = defaultdict(list)
+    service: List[float] = []
+    errors = 0
+    injected_all = False
+    done = asyncio.Event()
+    process_update = application.process_update
+
+    async def measured(update):
+        start = time.perf_counter()
+        try:
+            await process_update(update)
+        finally:
+            end = time.perf_counter()
+            entry = arrived.pop(id(update), None)
+            if entry is not None:
+                latency[entry[0]].append((end - entry[1]) * 1000)
+                service.append((end - start) * 1000)
+                if not arrived and injected_all:
+                    done.set()
+
+    async def count_error(update, context):
+        nonlocal errors
+        errors += 1
+
+    application.process_update = measured
+    application.add_error_handler(count_error)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    started = time.perf_counter()
+    for record in updates:
+        if args.speed > 0:
+            delay = record['t'] / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        data = record['update']
+        message = data.get('message') or data.get('callback_query', {}).get('message')
+        if message is not None:
+            message['date'] = int(time.time())  # la grabación no guarda fechas
+        update = Update.de_json(data, application.bot)
+        arrived[id(update)] = (_label(data), time.perf_counter())
+        await application.update_queue.put(update)
+    injected_all = True
+    if arrived:
+        await asyncio.wait_for(done.wait(), timeout=args.timeout)
+    wall = time.perf_counter() - started
+
+    # Mismo orden que run_polling
+    await application.stop()
+    await application.post_stop(application)
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+    every = [ms for values in latency.values() for ms in values]
+    return {
+        'latency_ms': {'all': percentiles(every),
+                       'by_command': {label: percentiles(values) for label, values in sorted(latency.items())}},
+        'service_ms': percentiles(service),
+        'errors': errors,
+        'wall_s': round(wall, 2),
+        'outbound': outbound_queue.metrics(),
+    }
+
+# ============================================
+# Informes
+# ============================================
+def _git_label() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BOT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or 'desconocida'
+    except (OSError, subprocess.SubprocessError):
+        return 'desconocida'
+
+def _row(label: str, stats: Dict[str, float]) -> str:
+    if not stats.get('n'):
+        return f"{label:<24} {0:>6}"
+    return (f"{label:<24} {stats['n']:>6} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+            f"{stats['p99']:>9.1f} {stats['max']:>9.1f}")
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nVersión {report['label']} - {report['updates']} updates a x{report['speed']} "
+          f"en {report['wall_s']} s, {report['errors']} errores")
+    print(f"{'ms desde la llegada':<24} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'máx':>9}")
+    for label, stats in report['latency_ms']['by_command'].items():
+        print(_row(label, stats))
+    print(_row('TOTAL', report['latency_ms']['all']))
+    print(_row('(proceso)', report['service_ms']))
+    print(_row('(producción)', report['recorded_ms']))
+    print(f"Backend: {sum(report['backend_requests'].values())} peticiones - "
+          f"Telegram: {sum(report['telegram_calls'].values())} llamadas")
+
+def _change(before: Optional[float], after: Optional[float]) -> str:
+    if not before or after is None:
+        return f"{'-':>8}"
+    return f"{(after - before) / before:>+8.0%}"
+
+def compare(path_a: str, path_b: str, threshold: float) -> int:
+    """Tabla de diferencias entre dos informes; 1 si algún p95 empeora más de `threshold`"""
+    # Con menos muestras el p95 es el máximo: no se toma como regresión
+    with open(path_a, encoding='utf-8') as f:
+        a = json.load(f)
+    with open(path_b, encoding='utf-8') as f:
+        b = json.load(f)
+
+    print(f"{a['label']} -> {b['label']} ({a['recording']}, x{a['speed']} / x{b['speed']})")
+    print(f"{'p50/p95 ms':<24} {'n':>6} {'p50 A':>9} {'p50 B':>9} {'Δp50':>8} {'p95 A':>9} {'p95 B':>9} {'Δp95':>8}")
+
+    worse = []
+    rows = dict(a['latency_ms']['by_command'])
+    labels = sorted(set(rows) | set(b['latency_ms']['by_command']))
+    for label in labels + ['TOTAL']:
+        if label == 'TOTAL':
+            sa, sb = a['latency_ms']['all'], b['latency_ms']['all']
+        else:
+            sa, sb = rows.get(label, {}), b['latency_ms']['by_command'].get(label, {})
+        print(f"{label:<24} {sb.get('n', 0):>6} {sa.get('p50', 0):>9.1f} {sb.get('p50', 0):>9.1f} "
+              f"{_change(sa.get('p50'), sb.get('p50'))} {sa.get('p95', 0):>9.1f} {sb.get('p95', 0):>9.1f} "
+              f"{_change(sa.get('p95'), sb.get('p95'))}")
+        if (min(sa.get('n', 0), sb.get('n', 0)) >= MIN_SAMPLES
+                and (sb['p95'] - sa['p95']) / sa['p95'] > threshold):
+            worse.append(label)
+
+    for name in ('backend_requests', 'telegram_calls'):
+        print(f"{name}: {sum(a[name].values())} -> {sum(b[name].values())}")
+    print(f"errores: {a['errors']} -> {b['errors']}")
+
+    if worse:
+        print(f"⚠️ p95 peor en más de un {threshold:.0%}: {', '.join(worse)}")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una grabación del bot y mide latencias")
+    parser.add_argument('recording', nargs='?', help="Archivo de RECORD_PATH")
+    parser.add_argument('--speed', type=float, default=1.0, help="Multiplicador del ritmo grabado (0 = sin esperas)")
+    parser.add_argument('--backend-latency', default='recorded',
+                        help="'recorded' (tiempos grabados por ruta) o segundos fijos por petición")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="Segundos por llamada a Telegram")
+    parser.add_argument('--accounts', type=int, default=5, help="Cuentas de cada usuario en el backend simulado")
+    parser.add_argument('--movements', type=int, default=200, help="Movimientos de cada usuario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300, help="Espera máxima al final (segundos)")
+    parser.add_argument('--label', help="Nombre de la versión (por defecto, git describe)")
+    parser.add_argument('--report', help="Guarda el informe JSON en este archivo")
+    parser.add_argument('--compare', nargs=2, metavar=('A', 'B'), help="Compara dos informes")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Empeoramiento tolerado del p95 en --compare")
+    parser.add_argument('--verbose', action='store_true', help="Muestra los logs del bot")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(args.compare[0], args.compare[1], args.threshold))
+    if not args.recording:
+        parser.error("falta la grabación (o --compare A B)")
+
+    updates, timings, handled = load_recording(args.recording)
+    if args.backend_latency == 'recorded':
+        backend_latency = RecordedLatency(timings, args.seed)
+    else:
+        backend_latency = FixedLatency(float(args.backend_latency))
+    state = StubState(args.accounts, args.movements)
+    server, url = start_stub(latency=backend_latency, state=state)
+
+    # El bot se configura por entorno: se fija antes de importarlo
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': os.environ.get('TELEGRAM_BOT_TOKEN') or '1:replay',
+        'API_URL': url,
+        'API_URLS': url,
+        'PERSISTENCE_PATH': os.path.join(workdir, 'bot_state.sqlite3'),
+        'JOURNAL_FILES_DIR': os.path.join(workdir, 'pending_files'),
+        'RECORD_PATH': '',
+        'TRACE_SAMPLE_RATE': '0',
+    })
+    from services.recorder import endpoint_template
+    backend_latency.template = endpoint_template
+
+    import bot  # configura el logging
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    request = ReplayRequest(args.telegram_latency, _file_sizes(updates))
+    report = {
+        'label': args.label or _git_label(),
+        'recording': os.path.basename(args.recording),
+        'updates': len(updates),
+        'speed': args.speed,
+        'backend_latency': args.backend_latency,
+        'telegram_latency': args.telegram_latency,
+        'seed': args.seed,
+    }
+    report.update(asyncio.run(replay(args, updates, request, state)))
+    report['recorded_ms'] = percentiles(handled)
+    report['backend_requests'] = dict(backend_latency.requests)
+    report['telegram_calls'] = dict(request.calls)
+    server.shutdown()
+
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Informe guardado en {args.report}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+Backend simulado para desarrollo y pruebas de rendimiento del bot.
+
+Implementa en memoria el subconjunto de la API REST que usa el bot, con las
+mismas respuestas {success, message, data}, ETag/304 y compresión gzip que el
+backend PHP. Uso:
+
+    python tools/stub_backend.py --port 8090 --latency 0.05
+    API_URL=http://localhost:8090/api python bot.py
+
+Con --replicas N se levantan N servidores en puertos consecutivos que
+comparten los mismos datos (como varias réplicas PHP con una sola MySQL):
+
+    python tools/stub_backend.py --replicas 3
+    API_URLS=http://localhost:8090/api,http://localhost:8091/api,http://localhost:8092/api python bot.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+class StubState:
+    """Datos en memoria del backend simulado"""
+
+    def __init__(self, accounts: int = 3, movements: int = 200):
+        self.lock = threading.Lock()
+        self.users = {
+            1: {'id': 1, 'nombre_usuario': 'demo', 'correo_electronico': 'demo@example.com',
+                'rol': 'propietario', 'contrasena': 'demo'},
+        }
+        self.tokens: Dict[str, int] = {}
+        self.tags = [
+            {'id': 1, 'nombre': 'Ahorro'},
+            {'id': 2, 'nombre': 'Gastos fijos'},
+        ]
+        self.accounts: Dict[int, Dict[str, Any]] = {}
+        self.movements: Dict[int, Dict[str, Any]] = {}
+        self.activity_log: List[Dict[str, Any]] = []
+        self.next_movement_id = 1
+        # (id_usuario, Idempotency-Key) -> id del movimiento creado (0 en una importación)
+        self.idempotency: Dict[Tuple[int, str], int] = {}
+        # Claves cuya petición original "sigue en curso": responden 409 como MovementController
+        self.in_flight: set = set()
+        # (id_usuario, sha256) -> {'archivo', 'referencias', 'bytes'}, como la tabla adjuntos
+        self.attachments: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self.stored_bytes = 0
+        self.upload_bytes = 0
+        # False simula una caída de PHP/MySQL: todo responde 503
+        self.available = True
+
+        self._seed(1, accounts, movements)
+
+    def add_user(self, nombre_usuario: str, contrasena: str, accounts: int = 3, movements: int = 200,
+                 rol: str = 'usuario') -> int:
+        """Crea otro usuario con sus cuentas y movimientos de ejemplo y devuelve su id"""
+        user_id = max(self.users) + 1
+        self.users[user_id] = {'id': user_id, 'nombre_usuario': nombre_usuario,
+                               'correo_electronico': f"{nombre_usuario}@example.com",
+                               'rol': rol, 'contrasena': contrasena}
+        self._seed(user_id, accounts, movements)
+        return user_id
+
+    def _seed(self, user_id: int, accounts: int, movements: int):
+        names = ['Santander', 'Efectivo', 'Ahorro vacaciones', 'Nómina', 'Cuenta común']
+        first_id = max(self.accounts, default=0) + 1
+        for i in range(accounts):
+            account_id = first_id + i
+            self.accounts[account_id] = {
+                'id': account_id, 'id_usuario': user_id,
+                'nombre': names[i % len(names)] + ('' if i < len(names) else f' {i}'),
+                'tipo': 'efectivo' if i % 2 else 'bancaria',
+                'balance': '0.00', 'moneda': 'EUR',
+                'meta': '5000.00' if i == 2 else None,
+                'id_etiqueta': 1 if i == 2 else None,
+                'etiqueta_nombre': 'Ahorro' if i == 2 else None,
+                'color': '#3B82F6', 'descripcion': None,
+            }
+
+        start = datetime.now() - timedelta(days=365)
+        for i in range(movements):
+            self.add_movement(user_id, {
+                'tipo': 'ingreso' if i % 4 == 0 else 'retirada',
+                'id_cuenta': first_id + i % max(accounts, 1),
+                'cantidad': f"{1500 if i % 4 == 0 else (i * 37) % 120 + 5:.2f}",
+                'notas': f"Movimiento {i}" if i % 3 else '',
+                'fecha_movimiento': (start + timedelta(hours=i * 24 * 365 // max(movements, 1)))
+                .strftime('%Y-%m-%d %H:%M:%S'),
+            })
+
+    def add_movement(self, user_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+        account = self.accounts[int(data['id_cuenta'])]
+        movement = {
+            'id': self.next_movement_id,
+            'id_cuenta': int(data['id_cuenta']),
+            'tipo': data['tipo'],
+            'cantidad': f"{float(data['cantidad']):.2f}",
+            'notas': data.get('notas') or None,
+            'adjunto': data.get('adjunto'),
+            'fecha_movimiento': data.get('fecha_movimiento') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'cuenta_nombre': account['nombre'],
+            'cuenta_color': account['color'],
+        }
+        self.movements[movement['id']] = movement
+        self.next_movement_id += 1
+        self._apply_balance(movement, 1)
+        self.activity_log.append({
+            'id': len(self.activity_log) + 1, 'id_usuario': user_id,
+            'accion': f"ha creado el movimiento {movement['id']}",
+            'ip': '127.0.0.1', 'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return movement
+
+    def delete_movement(self, movement_id: int) -> bool:
+        movement = self.movements.pop(movement_id, None)
+        if movement:
+            self._apply_balance(movement, -1)
+            if movement['adjunto']:
+                self.release_attachment(movement['adjunto'])
+        return movement is not None
+
+    def store_attachment(self, user_id: int, filename: str, content: bytes) -> str:
+        """Guarda un adjunto subido; si el usuario ya tiene uno idéntico lo reutiliza"""
+        self.upload_bytes += len(content)
+        sha256 = hashlib.sha256(content).hexdigest()
+        entry = self.attachments.get((user_id, sha256))
+        if entry:
+            entry['referencias'] += 1
+            return entry['archivo']
+        archivo = f"file_{uuid.uuid4().hex}_{filename}"
+        self.attachments[(user_id, sha256)] = {'archivo': archivo, 'referencias': 1, 'bytes': len(content)}
+        self.stored_bytes += len(content)
+        return archivo
+
+    def acquire_attachment(self, user_id: int, sha256: str) -> Optional[str]:
+        entry = self.attachments.get((user_id, sha256.lower()))
+        if not entry:
+            return None
+        entry['referencias'] += 1
+        return entry['archivo']
+
+    def release_attachment(self, archivo: str):
+        for key, entry in list(self.attachments.items()):
+            if entry['archivo'] == archivo:
+                entry['referencias'] -= 1
+                if entry['referencias'] <= 0:
+                    del self.attachments[key]
+                    self.stored_bytes -= entry['bytes']
+                return
+
+    def _apply_balance(self, movement: Dict[str, Any], sign: int):
+        account = self.accounts[movement['id_cuenta']]
+        amount = float(movement['cantidad']) * (1 if movement['tipo'] == 'ingreso' else -1)
+        account['balance'] = f"{float(account['balance']) + sign * amount:.2f}"
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Atiende las peticiones imitando al backend PHP"""
+
+    protocol_version = 'HTTP/1.1'
+    state: StubState = None
+    # Segundos fijos o función (método, ruta) -> segundos
+    latency: Union[float, Callable[[str, str], float]] = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    # ============================================
+    # Respuestas
+    # ============================================
+    def _send(self, status: int, payload: Dict[str, Any], cacheable: bool = False):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+
+        if cacheable:
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            headers['ETag'] = etag
+            headers['Cache-Control'] = 'private, no-cache'
+            if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+                self._write(304, headers, b'')
+                return
+
+            accept = self.headers.get('Accept-Encoding', '')
+            if len(body) > 1024 and 'gzip' in accept:
+                headers['Content-Encoding'] = 'gzip'
+                body = gzip.compress(body, 6)
+            elif len(body) > 1024 and 'deflate' in accept:
+                headers['Content-Encoding'] = 'deflate'
+                body = zlib.compress(body, 6)
+
+        self._write(status, headers, body)
+
+    def _write(self, status: int, headers: Dict[str, str], body: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _success(self, message: str, data: Any, status: int = 200):
+        self._send(status, {'success': True, 'message': message, 'data': data},
+                   cacheable=self.command == 'GET' and status == 200)
+
+    def _error(self, message: str, status: int = 400):
+        self._send(status, {'success': False, 'message': message, 'errors': []})
+
+    # ============================================
+    # Lectura de la petición
+    # ============================================
+    def _body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _form(self) -> Tuple[Dict[str, str], Dict[str, Tuple[str, bytes]]]:
+        """Devuelve (campos, archivos) de un cuerpo JSON, urlencoded o multipart"""
+        body = self._body()
+        content_type = self.headers.get('Content-Type', '')
+
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}'), {}
+
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=default_policy).parsebytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+            )
+            fields, files = {}, {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                filename = part.get_filename()
+                payload = part.get_payload(decode=True) or b''
+                if filename:
+                    files[name] = (filename, payload)
+                else:
+                    fields[name] = payload.decode('utf-8')
+            return fields, files
+
+        return {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}, {}
+
+    def _current_user(self) -> Optional[int]:
+        token = self.headers.get('Authorization', '').replace('Bearer ', '')
+        return self.state.tokens.get(token)
+
+    # ============================================
+    # Enrutado
+    # ============================================
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        path = parsed.path[4:] if parsed.path.startswith('/api') else parsed.path
+
+        delay = self.latency(method, path) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        parts = [p for p in path.split('/') if p]
+
+        if not self.state.available:
+            self._body()
+            return self._error("Error al conectar con la base de datos", 503)
+
+        with self.state.lock:
+            try:
+                self._route(method, parts, query)
+            except KeyError as e:
+                self._error(f"No encontrado: {e}", 404)
+            except (ValueError, TypeError) as e:
+                self._error(str(e), 400)
+
+    def _route(self, method: str, parts: List[str], query: Dict[str, str]):
+        state = self.state
+
+        # Rutas públicas
+        if parts == ['auth', 'login'] and method == 'POST':
+            data, _ = self._form()
+            for user in state.users.values():
+                if user['nombre_usuario'] == data.get('nombre_usuario') and user['contrasena'] == data.get('contrasena'):
+                    token = uuid.uuid4().hex
+                    state.tokens[token] = user['id']
+                    public = {k: v for k, v in user.items() if k != 'contrasena'}
+                    return self._success("Login exitoso", {'token': token, 'user': public})
+            return self._error("Credenciales incorrectas", 401)
+
+        if parts == ['tags'] and method == 'GET':
+            return self._success("Etiquetas obtenidas", {'etiquetas': state.tags})
+
+        if parts == ['health']:
+            return self._success("OK", {'status': 'ok'})
+
+        user_id = self._current_user()
+        if user_id is None:
+            return self._error("Token no proporcionado o inválido", 401)
+        user = state.users[user_id]
+
+        if parts == ['auth', 'validate']:
+            public = {k: v for k, v in user.items() if k != 'contrasena'}
+            return self._success("Sesión válida", {'user': public})
+
+        if parts == ['auth', 'logout']:
+            token = self.headers.get('Authorization', '').replace('Bearer ', '')
+            state.tokens.pop(token, None)
+            return self._success("Sesión cerrada", {})
+
+        if parts[0] == 'accounts':
+            return self._route_accounts(method, parts, query, user_id)
+
+        if parts[0] == 'movements':
+            return self._route_movements(method, parts, query, user_id)
+
+        if parts[0] == 'admin' and method == 'GET':
+            if user['rol'] != 'propietario':
+                return self._error("No tienes permisos para esta acción", 403)
+            if parts[1:] == ['stats']:
+                return self._success("Estadísticas obtenidas", {'stats': {
+                    'total_usuarios': len(state.users),
+                    'usuarios_activos': len(state.users),
+                    'total_cuentas': len(state.accounts),
+                    'total_movimientos': len(state.movements),
+                    'usuarios_con_2fa': 0,
+                }})
+            if parts[1:] == ['activity-log']:
+                # Mismos filtros que AdminController::getActivityLog
+                limit = int(query.get('limit', 100))
+                offset = int(query.get('offset', 0))
+                log = [{**entry, 'nombre_usuario': state.users[entry['id_usuario']]['nombre_usuario']}
+                       for entry in reversed(state.activity_log)]
+                if query.get('usuario'):
+                    log = [e for e in log if e['nombre_usuario'] == query['usuario']]
+                if query.get('accion'):
+                    log = [e for e in log if query['accion'].lower() in e['accion'].lower()]
+                if 'fecha_desde' in query:
+                    log = [e for e in log if e['fecha'] >= query['fecha_desde']]
+                if 'fecha_hasta' in query:
+                    log = [e for e in log if e['fecha'] <= query['fecha_hasta']]
+                if 'id_hasta' in query:
+                    log = [e for e in log if e['id'] <= int(query['id_hasta'])]
+                return self._success("Historial obtenido", {
+                    'logs': log[offset:offset + limit], 'total': len(log)
+                })
+
+        return self._error("Ruta no encontrada", 404)
+
+    def _route_accounts(self, method: str, parts: List[str], query: Dict[str, str], user_id: int):
+        state = self.state
+        accounts = [a for a in state.accounts.values() if a['id_usuario'] == user_id]
+
+        if parts == ['accounts']:
+            return self._success("Cuentas obtenidas", {'cuentas': accounts})
+
+        if parts == ['accounts', 'summary']:
+            total = sum(float(a['balance']) for a in accounts)
+            return self._success("Resumen obtenido", {'summary': {
+                'total_cuentas': len(accounts),
+                'cuentas_efectivo': sum(1 for a in accounts if a['tipo'] == 'efectivo'),
+                'cuentas_bancarias': sum(1 for a in accounts if a['tipo'] == 'bancaria'),
+                'balance_total': f"{total:.2f}",
+            }})
+
+        if parts == ['accounts', 'search']:
+            q = query.get('q', '').lower()
+            if not q:
+                return self._error("Debe proporcionar un término de búsqueda", 400)
+            found = [a for a in accounts if q in a['nombre'].lower()]
+            return self._success("Búsqueda completada", {'cuentas': found})
+
+        account = state.accounts[int(parts[1])]
+        if account['id_usuario'] != user_id:
+            return self._error("No tienes permiso para acceder a esta cuenta", 403)
+        detail = dict(account)
+        if account['meta']:
+            balance, meta = float(account['balance']), float(account['meta'])
+            detail['progreso_meta'] = {
+                'alcanzada': balance >= meta,
+                'porcentaje': min(round(balance / meta * 100, 2), 100),
+                'faltante': max(meta - balance, 0),
+            }
+        return self._success("Cuenta obtenida", {'cuenta': detail})
+
+    def _route_movements(self, method: str, parts: List[str], query: Dict[str, str], user_id: int):
+        state = self.state
+        own = [m for m in state.movements.values()
+               if state.accounts[m['id_cuenta']]['id_usuario'] == user_id]
+
+        if parts == ['movements'] and method == 'POST':
+            data, files = self._form()
+            key = self.headers.get('Idempotency-Key')
+            if key and key in state.in_flight:
+                return self._error("Hay una petición en curso con esta clave", 409)
+            if key and (user_id, key) in state.idempotency:
+                return self._success("Movimiento registrado exitosamente", {
+                    'movimiento_id': state.idempotency[(user_id, key)], 'repetido': True
+                }, 201)
+            if 'adjunto' in files:
+                data['adjunto'] = state.store_attachment(user_id, *files['adjunto'])
+            elif data.get('adjunto_hash'):
+                data['adjunto'] = state.acquire_attachment(user_id, data['adjunto_hash'])
+                if not data['adjunto']:
+                    return self._error("Adjunto no encontrado", 412)
+            movement = state.add_movement(user_id, data)
+            if key:
+                state.idempotency[(user_id, key)] = movement['id']
+            return self._success("Movimiento registrado exitosamente", {'movimiento_id': movement['id']}, 201)
+
+        if parts == ['movements', 'import'] and method == 'POST':
+            _, files = self._form()
+            key = self.headers.get('Idempotency-Key')
+            if key and key in state.in_flight:
+                return self._error("Hay una petición en curso con esta clave", 409)
+            if key and (user_id, key) in state.idempotency:
+                return self._success("Importación completada", {'repetido': True})
+            items = json.loads(files['file'][1]) if 'file' in files else []
+            for item in items:
+                state.add_movement(user_id, item)
+            if key:
+                state.idempotency[(user_id, key)] = 0
+            return self._success("Importación completada", {'imported': len(items), 'errors': []})
+
+        if parts == ['movements'] and method == 'GET':
+            return self._success("Movimientos obtenidos", self._filter_movements(own, query))
+
+        if parts == ['movements', 'stats']:
+            selected = self._filter_movements(own, {k: v for k, v in query.items()
+                                                    if k in ('id_cuenta', 'fecha_desde', 'fecha_hasta')})['movimientos']
+            ingresos = [float(m['cantidad']) for m in selected if m['tipo'] == 'ingreso']
+            retiradas = [float(m['cantidad']) for m in selected if m['tipo'] == 'retirada']
+            data = {'stats': {
+                'total_movimientos': len(selected),
+                'total_ingresos': len(ingresos),
+                'total_retiradas': len(retiradas),
+                'suma_ingresos': f"{sum(ingresos):.2f}",
+                'suma_retiradas': f"{sum(retiradas):.2f}",
+            }}
+            if 'agrupar' in query:
+                # Como Movimiento::getUserSeries: solo los periodos con movimientos
+                length = {'dia': 10, 'mes': 7}[query['agrupar']]
+                series: Dict[str, List[float]] = {}
+                for m in selected:
+                    sums = series.setdefault(m['fecha_movimiento'][:length], [0.0, 0.0])
+                    sums[0 if m['tipo'] == 'ingreso' else 1] += float(m['cantidad'])
+                data['series'] = [{'periodo': periodo, 'suma_ingresos': f"{i:.2f}", 'suma_retiradas': f"{r:.2f}"}
+                                  for periodo, (i, r) in sorted(series.items())]
+            return self._success("Estadísticas obtenidas", data)
+
+        if parts == ['movements', 'export', 'json']:
+            # Igual que Movimiento::exportToJSON: copia de seguridad sin envoltorio ni ids
+            selected = self._filter_movements(own, {k: v for k, v in query.items()
+                                                    if k in ('id_cuenta', 'tipo', 'fecha_desde', 'fecha_hasta')})
+            return self._send(200, {
+                'version': '2.0',
+                'fecha_exportacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'usuario_id_original': user_id,
+                'cuentas': [{'nombre': a['nombre'], 'tipo': a['tipo'], 'moneda': a['moneda'],
+                             'balance_actual': a['balance']}
+                            for a in state.accounts.values() if a['id_usuario'] == user_id],
+                'movimientos': [{'cuenta_nombre': m['cuenta_nombre'], 'tipo': m['tipo'],
+                                 'cantidad': m['cantidad'], 'fecha_movimiento': m['fecha_movimiento'],
+                                 'notas': m['notas']} for m in selected['movimientos']],
+            })
+
+        movement = state.movements[int(parts[1])]
+        if state.accounts[movement['id_cuenta']]['id_usuario'] != user_id:
+            return self._error("No tienes permiso para acceder a este movimiento", 403)
+
+        if method == 'DELETE':
+            state.delete_movement(movement['id'])
+            return self._success("Movimiento eliminado", {})
+
+        return self._success("Movimiento obtenido", {'movimiento': movement})
+
+    @staticmethod
+    def _filter_movements(movements: List[Dict[str, Any]], query: Dict[str, str]) -> Dict[str, Any]:
+        selected = movements
+        if 'id_cuenta' in query:
+            selected = [m for m in selected if m['id_cuenta'] == int(query['id_cuenta'])]
+        if 'tipo' in query:
+            selected = [m for m in selected if m['tipo'] == query['tipo']]
+        if 'fecha_desde' in query:
+            selected = [m for m in selected if m['fecha_movimiento'] >= query['fecha_desde']]
+        if 'fecha_hasta' in query:
+            selected = [m for m in selected if m['fecha_movimiento'] <= query['fecha_hasta']]
+        if 'cantidad_min' in query:
+            selected = [m for m in selected if float(m['cantidad']) >= float(query['cantidad_min'])]
+        if 'cantidad_max' in query:
+            selected = [m for m in selected if float(m['cantidad']) <= float(query['cantidad_max'])]
+
+        order_by = query.get('order_by', 'fecha_movimiento')
+        if order_by not in ('fecha_movimiento', 'cantidad', 'id'):
+            order_by = 'fecha_movimiento'
+        key = (lambda m: float(m['cantidad'])) if order_by == 'cantidad' else (lambda m: m[order_by])
+        selected = sorted(selected, key=key, reverse=query.get('order_dir', 'DESC').upper() != 'ASC')
+
+        total = len(selected)
+        if 'limit' in query:
+            offset = int(query.get('offset', 0))
+            selected = selected[offset:offset + int(query['limit'])]
+        return {'movimientos': selected, 'total': total}
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # La cola de 5 de TCPServer provoca reintentos de SYN de 1 s con concurrencia
+    request_queue_size = 128
+
+def start_stub(port: int = 0, latency: Union[float, Callable[[str, str], float]] = 0.0,
+               state: Optional[StubState] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """Arranca el backend simulado en un hilo y devuelve (servidor, API_URL)"""
+    handler = type('BoundStubHandler', (StubHandler,), {
+        'state': state or StubState(),
+        'latency': staticmethod(latency) if callable(latency) else latency,
+    })
+    server = StubServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api"
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend simulado para el bot")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help="Retardo por petición (segundos)")
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--movements', type=int, default=200)
+    parser.add_argument('--replicas', type=int, default=1, help="Servidores con los mismos datos")
+    args = parser.parse_args()
+
+    state = StubState(args.accounts, args.movements)
+    servers, urls = [], []
+    for i in range(args.replicas):
+        server, url = start_stub(args.port + i, args.latency, state)
+        servers.append(server)
+        urls.append(url)
+    print(f"Backend simulado escuchando en {','.join(urls)} (usuario: demo / contraseña: demo)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import unicodedata
+from typing import Dict, List, Optional
+from services.models import Account
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.lower().split())
+
+class _TrieNode:
+    __slots__ = ('children', 'accounts')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.accounts: List[int] = []
+
+class AccountIndex:
+    """
+    Índice por prefijo de los nombres de cuenta de un usuario.
+
+    Se indexa el nombre completo y cada palabra, así "vaca" encuentra
+    "Ahorro vacaciones" y "ahorro" encuentra "Ahorro vacaciones" y "Ahorro".
+    Cada nodo guarda las posiciones de las cuentas que pasan por él, de modo
+    que una búsqueda cuesta O(longitud del prefijo).
+    """
+
+    def __init__(self, accounts: List[Account]):
+        self.accounts = accounts
+        self._root = _TrieNode()
+        self._exact: Dict[str, int] = {}
+
+        for position, account in enumerate(accounts):
+            name = normalize(account.nombre)
+            self._exact.setdefault(name, position)
+            words = name.split(' ')
+            keys = {name} | {' '.join(words[i:]) for i in range(1, len(words))}
+            for key in keys:
+                self._insert(key, position)
+
+    def _insert(self, key: str, position: int):
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if not node.accounts or node.accounts[-1] != position:
+                node.accounts.append(position)
+
+    def by_number(self, number: int) -> Optional[Account]:
+        """Cuenta por su número en /cuentas (empezando en 1)"""
+        if 1 <= number <= len(self.accounts):
+            return self.accounts[number - 1]
+        return None
+
+    def lookup(self, query: str) -> List[Account]:
+        """Cuentas cuyo nombre (o alguna palabra) empieza por la consulta"""
+        key = normalize(query)
+        if not key:
+            return []
+
+        if key in self._exact:
+            return [self.accounts[self._exact[key]]]
+
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.accounts[position] for position in node.accounts]
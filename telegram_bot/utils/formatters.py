@@ -1,13 +1,25 @@
 from datetime import datetime
-from typing import Dict, List
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from services.models import Account, Movement, Summary, Stats
 
-def format_money(amount, currency: str = 'EUR') -> str:
-    """Formatea cantidad de dinero"""
-    # Asegurar que amount sea float
+if TYPE_CHECKING:
+    from services.forecast import Forecast
+
+MONTH_NAMES = ['ene', 'feb', 'mar', 'abr', 'may', 'jun',
+               'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+
+def format_number(amount) -> str:
+    """Formatea una cantidad con separadores españoles (1.234,56)"""
+    # Las cantidades de los modelos ya son Decimal; solo se convierten las cadenas
     if isinstance(amount, str):
-        amount = float(amount)
+        amount = Decimal(amount)
     
-    return f"{amount:,.2f} {currency}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return f"{amount:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def format_money(amount, currency: str = 'EUR') -> str:
+    """Formatea cantidad de dinero"""
+    return f"{format_number(amount)} {currency}"
 
 def format_date(date_str: str) -> str:
     """Formatea fecha a formato legible (solo fecha, sin hora)"""
@@ -17,51 +29,50 @@ def format_date(date_str: str) -> str:
     except:
         return date_str
 
-def format_account(account: Dict) -> str:
-    """Formatea información de una cuenta"""
-    tipo_emoji = '💵' if account['tipo'] == 'efectivo' else '🏦'
-    balance = format_money(account['balance'])
+def format_account(account: Account, tag_names: Optional[Dict[int, str]] = None) -> str:
+    """Formatea información de una cuenta (nombre de etiqueta del catálogo si se pasa)"""
+    tipo_emoji = '💵' if account.tipo == 'efectivo' else '🏦'
+    balance = format_money(account.balance)
     
-    msg = f"{tipo_emoji} *{account['nombre']}*\n"
+    msg = f"{tipo_emoji} *{account.nombre}*\n"
     msg += f"Balance: `{balance}`\n"
     
-    if account.get('etiqueta_nombre'):
-        msg += f"Etiqueta: {account['etiqueta_nombre']}\n"
+    etiqueta = _tag_name(account, tag_names)
+    if etiqueta:
+        msg += f"Etiqueta: {etiqueta}\n"
     
-    if account.get('meta'):
-        meta = format_money(account['meta'])
+    if account.meta:
+        meta = format_money(account.meta)
         msg += f"Meta: {meta}\n"
         
-        if account.get('progreso_meta'):
-            progreso = account['progreso_meta']
-            porcentaje = float(progreso['porcentaje']) if isinstance(progreso['porcentaje'], str) else progreso['porcentaje']
-            msg += f"Progreso: {porcentaje:.1f}%\n"
+        if account.porcentaje_meta is not None:
+            msg += f"Progreso: {account.porcentaje_meta:.1f}%\n"
     
     return msg
 
-def format_movement(movement: Dict) -> str:
+def format_movement(movement: Movement) -> str:
     """Formatea información de un movimiento"""
-    tipo_emoji = '📈' if movement['tipo'] == 'ingreso' else '📉'
-    tipo_text = 'Ingreso' if movement['tipo'] == 'ingreso' else 'Gasto'
+    tipo_emoji = '📈' if movement.tipo == 'ingreso' else '📉'
+    tipo_text = 'Ingreso' if movement.tipo == 'ingreso' else 'Gasto'
     
-    cantidad = format_money(movement['cantidad'])
-    fecha = format_date(movement['fecha_movimiento'])
+    cantidad = format_money(movement.cantidad)
+    fecha = format_date(movement.fecha_movimiento)
     
     msg = f"{tipo_emoji} *{tipo_text}*\n"
-    msg += f"ID: `{movement['id']}`\n"
-    msg += f"Cuenta: {movement.get('cuenta_nombre', 'N/A')}\n"
+    msg += f"ID: `{movement.id}`\n"
+    msg += f"Cuenta: {movement.cuenta_nombre or 'N/A'}\n"
     msg += f"Cantidad: `{cantidad}`\n"
     msg += f"Fecha: {fecha}\n"
     
-    if movement.get('notas'):
-        msg += f"Notas: {movement['notas'][:100]}\n"
+    if movement.notas:
+        msg += f"Notas: {movement.notas[:100]}\n"
     
-    if movement.get('adjunto'):
+    if movement.adjunto:
         msg += f"📎 Archivo adjunto\n"
     
     return msg
 
-def format_accounts_list(accounts: List[Dict]) -> str:
+def format_accounts_list(accounts: List[Account], tag_names: Optional[Dict[int, str]] = None) -> str:
     """Formatea lista de cuentas"""
     if not accounts:
         return "No tienes cuentas registradas."
@@ -69,52 +80,142 @@ def format_accounts_list(accounts: List[Dict]) -> str:
     msg = "💰 *Tus cuentas:*\n\n"
     
     for i, account in enumerate(accounts, 1):
-        tipo_emoji = '💵' if account['tipo'] == 'efectivo' else '🏦'
-        balance = format_money(account['balance'])
-        msg += f"{i}. {tipo_emoji} {account['nombre']}: `{balance}`\n"
+        tipo_emoji = '💵' if account.tipo == 'efectivo' else '🏦'
+        balance = format_money(account.balance)
+        msg += f"{i}. {tipo_emoji} {account.nombre}: `{balance}`"
+        etiqueta = _tag_name(account, tag_names)
+        if etiqueta:
+            msg += f" 🏷 {etiqueta}"
+        msg += "\n"
     
     return msg
 
-def format_movements_list(movements: List[Dict]) -> str:
+def _tag_name(account: Account, tag_names: Optional[Dict[int, str]]) -> Optional[str]:
+    if tag_names and account.id_etiqueta in tag_names:
+        return tag_names[account.id_etiqueta]
+    return account.etiqueta_nombre
+
+def format_movements_list(movements: List[Movement], title: str = "Últimos movimientos") -> str:
     """Formatea lista de movimientos con fecha y descripción"""
     if not movements:
         return "No hay movimientos registrados."
     
-    msg = "📊 *Últimos movimientos:*\n\n"
+    msg = f"📊 *{title}:*\n\n"
     
     for movement in movements:
-        tipo_emoji = '📈' if movement['tipo'] == 'ingreso' else '📉'
-        cantidad = format_money(movement['cantidad'])
-        fecha = format_date(movement['fecha_movimiento'])
+        tipo_emoji = '📈' if movement.tipo == 'ingreso' else '📉'
+        cantidad = format_money(movement.cantidad)
+        fecha = format_date(movement.fecha_movimiento)
         
         # Línea principal con tipo, cantidad y cuenta
-        msg += f"{tipo_emoji} *{cantidad}* - {movement.get('cuenta_nombre', 'N/A')}\n"
+        msg += f"{tipo_emoji} *{cantidad}* - {movement.cuenta_nombre or 'N/A'}\n"
         
         # Fecha e ID
-        msg += f"📅 {fecha} • ID: `{movement['id']}`\n"
+        msg += f"📅 {fecha} • ID: `{movement.id}`\n"
         
         # Notas si existen
-        if movement.get('notas'):
-            notas_cortas = movement['notas'][:80]
-            if len(movement['notas']) > 80:
+        if movement.notas:
+            notas_cortas = movement.notas[:80]
+            if len(movement.notas) > 80:
                 notas_cortas += '...'
             msg += f"💬 {notas_cortas}\n"
         
         # Indicador de adjunto
-        if movement.get('adjunto'):
+        if movement.adjunto:
             msg += f"📎 Con archivo adjunto\n"
         
         msg += "\n"
     
     return msg
 
-def format_summary(summary: Dict) -> str:
+def format_summary(summary: Summary) -> str:
     """Formatea resumen de cuentas"""
-    balance_total = format_money(summary.get('balance_total', 0))
-    total_cuentas = summary.get('total_cuentas', 0)
+    balance_total = format_money(summary.balance_total)
+    total_cuentas = summary.total_cuentas
     
     msg = "💼 *Resumen Financiero*\n\n"
     msg += f"Balance Total: `{balance_total}`\n"
     msg += f"Cuentas: {total_cuentas}\n"
     
-    return msg
\ No newline at end of file
+    return msg
+
+def format_delta(current: Decimal, previous: Decimal) -> str:
+    """Diferencia con signo y porcentaje respecto al valor anterior"""
+    delta = current - previous
+    sign = '+' if delta >= 0 else '-'
+    text = f"{sign}{format_number(abs(delta))}"
+    if previous:
+        percent = abs(delta / previous * 100)
+        text += f" ({sign}{percent:.1f}%)".replace('.', ',')
+    return text
+
+def format_comparison(periods: List[Tuple[str, Stats]], note: Optional[str] = None) -> str:
+    """Tabla de ingresos, gastos y balance por periodo con diferencias frente al primero"""
+    width = max(len(label) for label, _ in periods)
+    rows = [f"{'':<{width}} {'Ingresos':>10} {'Gastos':>10} {'Balance':>10}"]
+    for label, stats in periods:
+        rows.append(
+            f"{label:<{width}} {format_number(stats.suma_ingresos):>10} "
+            f"{format_number(stats.suma_retiradas):>10} {format_number(stats.balance):>10}"
+        )
+    
+    msg = "📊 *Comparativa*\n\n```\n" + '\n'.join(rows) + "\n```\n"
+    
+    current_label, current = periods[0]
+    for label, stats in periods[1:]:
+        msg += f"\n*{current_label} vs {label}*\n"
+        msg += f"📈 Ingresos: {format_delta(current.suma_ingresos, stats.suma_ingresos)}\n"
+        msg += f"📉 Gastos: {format_delta(current.suma_retiradas, stats.suma_retiradas)}\n"
+        msg += f"💰 Balance: {format_delta(current.balance, stats.balance)}\n"
+    
+    if note:
+        msg += f"\n_{note}_"
+    
+    return msg
+
+def format_forecast(account: Account, forecast: 'Forecast') -> str:
+    """Previsión de una cuenta: aportación, balances a fin de mes y meta"""
+    fit = forecast.fit
+    msg = f"🔮 *Previsión - {account.nombre}*\n\n"
+    msg += f"Balance actual: {format_money(account.balance, account.moneda)}\n"
+    msg += f"Aportación prevista: {_signed(forecast.monthly, account.moneda)} al mes\n"
+    if abs(fit.slope) >= 0.01:
+        msg += f"Tendencia: {_signed(fit.slope, account.moneda)} por mes\n"
+    
+    msg += "\n*Balance a fin de mes*\n"
+    for ordinal, balance in forecast.month_ends:
+        msg += f"{MONTH_NAMES[ordinal % 12]} {ordinal // 12 % 100:02d}: {format_money(round(balance, 2), account.moneda)}\n"
+    
+    if account.meta:
+        msg += f"\n🎯 Meta: {format_money(account.meta, account.moneda)}\n"
+        msg += _format_eta(forecast) + "\n"
+    
+    basis = f"{fit.months} mes(es) completos"
+    if fit.seasonal:
+        basis += ", con estacionalidad"
+    msg += f"\n_Estimación a partir de {basis}_"
+    return msg
+
+def format_forecast_summary(items: List[Tuple[Account, Optional['Forecast']]]) -> str:
+    """Fecha estimada de cada cuenta con meta"""
+    msg = "🔮 *Previsión de metas*\n\n"
+    for account, forecast in items:
+        msg += f"*{account.nombre}* ({account.porcentaje_meta or 0:.1f}%)\n"
+        if forecast is None:
+            msg += "Sin historial suficiente (hace falta un mes completo)\n\n"
+        else:
+            msg += f"{_format_eta(forecast)}\n\n"
+    msg += "Usa /prevision [cuenta] para ver el detalle."
+    return msg
+
+def _signed(amount: float, currency: str = 'EUR') -> str:
+    return ('+' if amount >= 0 else '-') + format_money(round(abs(amount), 2), currency)
+
+def _format_eta(forecast: 'Forecast') -> str:
+    if forecast.reached:
+        return "✅ Meta alcanzada"
+    if forecast.eta:
+        return f"📅 Se alcanzaría hacia el {forecast.eta:%d/%m/%Y}"
+    if forecast.monthly <= 0:
+        return "⚠️ Con la aportación actual no se alcanzaría"
+    return "⚠️ No se alcanzaría en los próximos 10 años"
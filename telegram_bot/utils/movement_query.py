@@ -0,0 +1,224 @@
+import calendar
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+from utils.account_index import normalize
+from utils.formatters import format_number, MONTH_NAMES
+
+MAX_LIMIT = 50
+DEFAULT_LIMIT = 10
+CENT = Decimal('0.01')
+
+MOVEMENTS_HELP = (
+    "🔎 Filtros de /movimientos (en cualquier orden):\n\n"
+    "20 - cuántos mostrar (máx. 50)\n"
+    "gasto | ingreso - tipo\n"
+    ">50  >=50  <100  <=100  =12,99 - cantidad\n"
+    "desde:2026-01  hasta:2026-03-15  mes:2026-02 - fechas (año, mes o día; también 15/01/2026)\n"
+    "cuenta:ahorro - una cuenta (nombre, prefijo o número; \"entre comillas\" o con _ si tiene espacios)\n"
+    "#etiqueta - cuentas con esa etiqueta\n"
+    "orden:cantidad | orden:fecha | orden:id - orden (añade :asc para ascendente)\n\n"
+    "Ejemplo: /movimientos gasto >50 desde:2026-01 cuenta:ahorro orden:cantidad"
+)
+
+# Palabras sueltas que fijan el tipo
+_TIPOS = {'ingreso': 'ingreso', 'ingresos': 'ingreso',
+          'gasto': 'retirada', 'gastos': 'retirada', 'retirada': 'retirada', 'retiradas': 'retirada'}
+_ORDERS = {'fecha': 'fecha_movimiento', 'cantidad': 'cantidad', 'importe': 'cantidad', 'id': 'id'}
+_KEYS = ('desde', 'hasta', 'mes', 'cuenta', 'tipo', 'orden')
+
+# Un término es texto sin espacios que puede incluir tramos "entre comillas"
+_TOKEN = re.compile(r'(?:[^\s"]+|"[^"]*")+')
+_COMPARISON = re.compile(r'^(>=|<=|>|<|=)(.+)$')
+_ISO_DATE = re.compile(r'^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+_LOCAL_DATE = re.compile(r'^(?:(\d{1,2})/)?(\d{1,2})/(\d{4})$')
+
+class QueryError(ValueError):
+    """Filtro de /movimientos mal escrito (el mensaje se muestra al usuario)"""
+
+class MovementQuery:
+    """
+    Consulta de /movimientos ya validada.
+
+    `filters()` da los parámetros de GET /movements para que el filtrado y
+    el orden los haga la base de datos y solo viajen las filas pedidas.
+    `terms` describe los filtros aplicados para el título del mensaje.
+    """
+    __slots__ = ('limit', 'tag', 'account', 'tipo', 'fecha_desde', 'fecha_hasta',
+                 'cantidad_min', 'cantidad_max', 'order_by', 'order_dir', 'terms')
+
+    def __init__(self):
+        self.limit = DEFAULT_LIMIT
+        self.tag: Optional[str] = None
+        self.account: Optional[str] = None
+        self.tipo: Optional[str] = None
+        self.fecha_desde: Optional[str] = None
+        self.fecha_hasta: Optional[str] = None
+        self.cantidad_min: Optional[Decimal] = None
+        self.cantidad_max: Optional[Decimal] = None
+        self.order_by: Optional[str] = None
+        self.order_dir = 'DESC'
+        self.terms: List[str] = []
+
+    def filters(self) -> Dict[str, str]:
+        """Parámetros para GET /movements (sin limit ni id_cuenta)"""
+        params = {}
+        if self.tipo:
+            params['tipo'] = self.tipo
+        if self.fecha_desde:
+            params['fecha_desde'] = self.fecha_desde
+        if self.fecha_hasta:
+            params['fecha_hasta'] = self.fecha_hasta
+        if self.cantidad_min is not None:
+            params['cantidad_min'] = f"{self.cantidad_min:.2f}"
+        if self.cantidad_max is not None:
+            params['cantidad_max'] = f"{self.cantidad_max:.2f}"
+        if self.order_by:
+            params['order_by'] = self.order_by
+            params['order_dir'] = self.order_dir
+        return params
+
+    def sort_key(self):
+        """Clave para ordenar en el bot igual que el backend (al mezclar varias cuentas)"""
+        if self.order_by == 'cantidad':
+            return lambda m: (m.cantidad, m.id)
+        if self.order_by == 'id':
+            return lambda m: m.id
+        return lambda m: (m.fecha_movimiento, m.id)
+
+def _parse_amount(text: str) -> Decimal:
+    try:
+        amount = Decimal(text.replace(',', '.'))
+    except InvalidOperation:
+        raise QueryError(f"Cantidad inválida: «{text}». Ejemplo: >50 o <=12,99")
+    if not amount.is_finite() or amount < 0:
+        raise QueryError(f"Cantidad inválida: «{text}»")
+    try:
+        return amount.quantize(CENT)
+    except InvalidOperation:
+        # Más cifras de las que admite el contexto decimal (p. ej. >1e30)
+        raise QueryError(f"Cantidad demasiado grande: «{text}»")
+
+def parse_period(text: str) -> Tuple[str, str, str]:
+    """(primer instante, último instante, etiqueta) de un año, mes o día"""
+    iso = _ISO_DATE.match(text)
+    local = _LOCAL_DATE.match(text)
+    if iso:
+        year, month, day = iso.groups()
+    elif local:
+        day, month, year = local.groups()
+    else:
+        raise QueryError(f"Fecha inválida: «{text}». Usa 2026, 2026-01, 2026-01-15 o 15/01/2026")
+
+    try:
+        year = int(year)
+        if month is None:
+            first, last, label = date(year, 1, 1), date(year, 12, 31), str(year)
+        elif day is None:
+            month = int(month)
+            first = date(year, month, 1)
+            last = date(year, month, calendar.monthrange(year, month)[1])
+            label = f"{MONTH_NAMES[month - 1]} {year}"
+        else:
+            first = last = date(year, int(month), int(day))
+            label = first.strftime('%d/%m/%Y')
+    except ValueError:
+        raise QueryError(f"Fecha inválida: «{text}»")
+
+    return f"{first.isoformat()} 00:00:00", f"{last.isoformat()} 23:59:59", label
+
+def _set_once(query: MovementQuery, field: str, value, token: str):
+    if getattr(query, field) is not None:
+        raise QueryError(f"Filtro repetido: «{token}»")
+    setattr(query, field, value)
+
+def _comparison(query: MovementQuery, operator: str, text: str, token: str):
+    amount = _parse_amount(text)
+    # Las cantidades tienen dos decimales: > y < se convierten en límites inclusivos exactos
+    if operator in ('>', '>='):
+        _set_once(query, 'cantidad_min', amount + CENT if operator == '>' else amount, token)
+    elif operator in ('<', '<='):
+        _set_once(query, 'cantidad_max', amount - CENT if operator == '<' else amount, token)
+    else:
+        _set_once(query, 'cantidad_min', amount, token)
+        _set_once(query, 'cantidad_max', amount, token)
+    query.terms.append(f"{operator} {format_number(amount)}")
+
+def _key_value(query: MovementQuery, key: str, value: str, token: str):
+    if not value:
+        raise QueryError(f"Falta el valor en «{token}»")
+
+    if key == 'cuenta':
+        _set_once(query, 'account', value.replace('_', ' '), token)
+    elif key == 'tipo':
+        tipo = _TIPOS.get(normalize(value))
+        if tipo is None:
+            raise QueryError(f"Tipo inválido: «{value}». Usa gasto o ingreso")
+        _set_once(query, 'tipo', tipo, token)
+        query.terms.append('ingresos' if tipo == 'ingreso' else 'gastos')
+    elif key == 'orden':
+        field, _, direction = normalize(value).partition(':')
+        if field not in _ORDERS or direction not in ('', 'asc', 'desc'):
+            raise QueryError(f"Orden inválido: «{value}». Usa fecha, cantidad o id (y :asc)")
+        _set_once(query, 'order_by', _ORDERS[field], token)
+        query.order_dir = 'ASC' if direction == 'asc' else 'DESC'
+        query.terms.append(f"por {field} {'↑' if direction == 'asc' else '↓'}")
+    else:
+        first, last, label = parse_period(value)
+        if key in ('desde', 'mes'):
+            _set_once(query, 'fecha_desde', first, token)
+        if key in ('hasta', 'mes'):
+            _set_once(query, 'fecha_hasta', last, token)
+        query.terms.append(label if key == 'mes' else f"{key} {label}")
+
+def parse_movement_query(args: List[str]) -> MovementQuery:
+    """
+    Convierte los argumentos de /movimientos en una MovementQuery.
+
+    Lanza QueryError con un mensaje para el usuario si algún término no se
+    entiende o los filtros se contradicen.
+    """
+    text = ' '.join(args)
+    if text.count('"') % 2:
+        raise QueryError("Faltan comillas de cierre")
+
+    query = MovementQuery()
+    limit_set = False
+    for token in _TOKEN.findall(text):
+        bare = token.replace('"', '')
+        word = normalize(bare)
+
+        if bare.isascii() and bare.isdigit():
+            if limit_set:
+                raise QueryError(f"Filtro repetido: «{token}»")
+            if not 1 <= int(bare) <= MAX_LIMIT:
+                raise QueryError(f"Se pueden mostrar entre 1 y {MAX_LIMIT} movimientos")
+            query.limit = int(bare)
+            limit_set = True
+        elif bare.startswith('#'):
+            if len(bare) == 1:
+                raise QueryError("Falta el nombre de la etiqueta tras #")
+            _set_once(query, 'tag', bare[1:], token)
+        elif word in _TIPOS:
+            _set_once(query, 'tipo', _TIPOS[word], token)
+            query.terms.append('ingresos' if _TIPOS[word] == 'ingreso' else 'gastos')
+        elif _COMPARISON.match(bare):
+            operator, amount = _COMPARISON.match(bare).groups()
+            _comparison(query, operator, amount, token)
+        elif ':' in bare:
+            key, _, value = bare.partition(':')
+            key = normalize(key)
+            if key not in _KEYS:
+                raise QueryError(f"Filtro desconocido: «{key}:». Disponibles: " +
+                                 ', '.join(f"{k}:" for k in _KEYS))
+            _key_value(query, key, value.strip(), token)
+        else:
+            raise QueryError(f"No entiendo «{token}»")
+
+    if query.fecha_desde and query.fecha_hasta and query.fecha_desde > query.fecha_hasta:
+        raise QueryError("La fecha «desde» es posterior a «hasta»")
+    if (query.cantidad_min is not None and query.cantidad_max is not None
+            and query.cantidad_min > query.cantidad_max):
+        raise QueryError("No hay cantidades que cumplan a la vez el mínimo y el máximo")
+    return query